@@ -0,0 +1,328 @@
+"""
+Control de admisión y executor acotado para el trabajo de CPU de /cluster
+
+Las etapas pesadas (lectura, preprocesamiento, predicción, formato) se
+ejecutan en un pool de CLUSTER_MAX_CONCURRENCY hilos en lugar del event loop,
+de modo que /health, /cluster/info y las demás requests siguen respondiendo
+mientras se procesa un archivo grande.
+
+Cada request se admite antes de empezar:
+
+- Si ya hay CLUSTER_MAX_CONCURRENCY en proceso y CLUSTER_QUEUE_SIZE esperando,
+  se rechaza de inmediato con 429 y Retry-After.
+- Su costo en memoria se estima por el tamaño del archivo; si no cabe en
+  CLUSTER_MEMORY_BUDGET_MB junto con las requests admitidas, 503 y Retry-After
+  (413 si no cabría ni con el servicio vacío).
+- Si espera en la cola más de CLUSTER_QUEUE_TIMEOUT_S sin empezar, 503.
+
+Los jobs asíncronos corren en su propio pool (app/jobs.py) pero reservan su
+memoria en el mismo presupuesto: esperan a que quepa antes de procesarse y,
+mientras tanto, la memoria reservada cuenta para admitir las requests.
+
+El control es por proceso: con varios workers de uvicorn cada uno tiene su cupo.
+"""
+import asyncio
+import contextvars
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, BinaryIO, Callable, Dict, Iterator, Optional
+
+from app import metrics
+
+logger = logging.getLogger(__name__)
+
+# Requests procesándose a la vez, en espera (más allá: 429) y espera máxima antes de empezar (503)
+CLUSTER_MAX_CONCURRENCY = int(os.getenv("CLUSTER_MAX_CONCURRENCY", "2"))
+CLUSTER_QUEUE_SIZE = int(os.getenv("CLUSTER_QUEUE_SIZE", "8"))
+CLUSTER_QUEUE_TIMEOUT_S = float(os.getenv("CLUSTER_QUEUE_TIMEOUT_S", "60"))
+
+# Memoria para requests admitidas: "auto" (la mitad del límite del contenedor), MB o 0 (sin límite)
+CLUSTER_MEMORY_BUDGET_MB = os.getenv("CLUSTER_MEMORY_BUDGET_MB", "auto")
+
+# Costo estimado: MB fijos por request más MB por cada MB del archivo (pico de RSS medido:
+# ~245 MB con 8 MB de CSV, ~375 con 41 MB y ~515 con 83 MB; XLSX queda por debajo de la recta)
+ADMISSION_BASE_COST_MB = float(os.getenv("ADMISSION_BASE_COST_MB", "200"))
+ADMISSION_COST_FACTOR = float(os.getenv("ADMISSION_COST_FACTOR", "4"))
+
+# Segundos sugeridos al cliente en Retry-After
+ADMISSION_RETRY_AFTER_S = int(os.getenv("ADMISSION_RETRY_AFTER_S", "5"))
+
+# Bytes leídos del inicio del CSV para estimar el tamaño de fila (modo streaming)
+_SAMPLE_BYTES = 64 * 1024
+
+
+class AdmissionRejected(Exception):
+    """Request rechazada por falta de cupo (la convierte en HTTP el handler de app.main)"""
+
+    def __init__(self, status_code: int, detail: str, retry_after: Optional[int] = None):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+def _memory_limit_mb() -> Optional[float]:
+    """Memoria disponible para el proceso: Lambda, cgroup v2/v1 o RAM física"""
+    lambda_mb = os.getenv("AWS_LAMBDA_FUNCTION_MEMORY_SIZE")
+    if lambda_mb:
+        return float(lambda_mb)
+    for path in ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory/memory.limit_in_bytes"):
+        try:
+            with open(path) as f:
+                value = f.read().strip()
+        except OSError:
+            continue
+        # "max" o un número enorme (cgroup v1 sin límite) = sin límite del contenedor
+        if value.isdigit() and int(value) < 1 << 60:
+            return int(value) / (1024 * 1024)
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") / (1024 * 1024)
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def resolve_memory_budget_mb(setting: str = CLUSTER_MEMORY_BUDGET_MB) -> float:
+    """Presupuesto de memoria para requests (0 = sin límite)"""
+    if setting.strip().lower() != "auto":
+        return float(setting)
+    limit = _memory_limit_mb()
+    # La otra mitad: modelo, índice de similitud, caché y el resto del proceso
+    return round(limit / 2, 1) if limit else 0.0
+
+
+def estimate_cost_mb(file: BinaryIO, chunk_rows: Optional[int] = None) -> float:
+    """
+    Memoria estimada para procesar un archivo subido
+
+    El archivo completo pasa por varias copias (texto parseado, DataFrame
+    preprocesado, features en float64, resultado formateado y serializado),
+    así que el costo crece con su tamaño. En streaming solo cuenta un bloque de
+    chunk_rows filas, con el tamaño de fila medido al inicio del archivo.
+
+    Args:
+        file: Archivo subido (se deja en la posición 0)
+        chunk_rows: Filas por bloque en modo streaming (None = archivo completo)
+
+    Returns:
+        MB estimados
+    """
+    file.seek(0, os.SEEK_END)
+    size = file.tell()
+    file.seek(0)
+
+    if chunk_rows is not None:
+        sample = file.read(_SAMPLE_BYTES)
+        file.seek(0)
+        lines = sample.count(b"\n")
+        if lines > 1 and len(sample) < size:
+            size = min(size, len(sample) / lines * chunk_rows)
+
+    return round(ADMISSION_BASE_COST_MB + ADMISSION_COST_FACTOR * size / (1024 * 1024), 1)
+
+
+class AdmissionTicket:
+    """Cupo de una request admitida (libera la memoria reservada una sola vez)"""
+
+    def __init__(self, controller: "AdmissionController", cost_mb: float, slot: bool = True):
+        self._controller = controller
+        self.cost_mb = cost_mb
+        # False = solo memoria (jobs): no ocupa un lugar en el pool ni en la cola
+        self.slot = slot
+        self._released = False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self._controller._release(self)
+
+    def __del__(self):
+        # Red de seguridad: un stream que nunca empezó a enviarse no pasa por su finally
+        self.release()
+
+
+class AdmissionController:
+    """
+    Cupos de requests y pool de hilos para su trabajo de CPU
+
+    Args:
+        max_concurrency: Hilos del pool (requests procesándose a la vez)
+        queue_size: Requests admitidas esperando un hilo (más allá: 429)
+        queue_timeout_s: Espera máxima antes de empezar (después: 503)
+        memory_budget_mb: Memoria para las requests admitidas (0 = sin límite)
+        retry_after_s: Valor del header Retry-After en los rechazos
+    """
+
+    def __init__(self, max_concurrency: int = CLUSTER_MAX_CONCURRENCY, queue_size: int = CLUSTER_QUEUE_SIZE,
+                 queue_timeout_s: float = CLUSTER_QUEUE_TIMEOUT_S, memory_budget_mb: Optional[float] = None,
+                 retry_after_s: int = ADMISSION_RETRY_AFTER_S):
+        self.max_concurrency = max(max_concurrency, 1)
+        self.queue_size = max(queue_size, 0)
+        self.queue_timeout_s = queue_timeout_s
+        self.memory_budget_mb = memory_budget_mb if memory_budget_mb is not None else resolve_memory_budget_mb()
+        self.retry_after_s = retry_after_s
+        self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="cluster-cpu")
+        self._admitted = 0
+        self._running = 0
+        self._reserved_mb = 0.0
+        self._jobs = 0
+        self._rejected: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._memory_freed = threading.Condition(self._lock)
+
+    def _reject(self, reason: str, status_code: int, detail: str, retry: bool = True):
+        with self._lock:
+            self._rejected[reason] = self._rejected.get(reason, 0) + 1
+        metrics.observe_rejection(reason)
+        logger.warning(f"⚠️  Request rechazada ({reason}): {detail}")
+        raise AdmissionRejected(status_code, detail, self.retry_after_s if retry else None)
+
+    def admit(self, cost_mb: float = 0.0) -> AdmissionTicket:
+        """
+        Reserva un cupo o rechaza la request de inmediato
+
+        Raises:
+            AdmissionRejected: 429 (cola llena), 503 (sin memoria) o 413 (no cabe nunca)
+        """
+        self.check_cost(cost_mb)
+        budget = self.memory_budget_mb
+        with self._lock:
+            queue_full = self._admitted >= self.max_concurrency + self.queue_size
+            no_memory = bool(budget) and self._reserved_mb + cost_mb > budget
+            if not (queue_full or no_memory):
+                self._admitted += 1
+                self._reserved_mb += cost_mb
+                return AdmissionTicket(self, cost_mb)
+        if queue_full:
+            self._reject("queue_full", 429, "Demasiadas solicitudes en proceso, intente más tarde")
+        self._reject("memory", 503, f"Memoria insuficiente para ~{cost_mb:.0f} MB adicionales, intente más tarde")
+
+    def check_cost(self, cost_mb: float, hint: str = "use stream=true o divida el archivo"):
+        """
+        Rechaza un trabajo que no cabría en el presupuesto ni con el servicio vacío
+
+        Raises:
+            AdmissionRejected: 413 (sin Retry-After)
+        """
+        budget = self.memory_budget_mb
+        if budget and cost_mb > budget:
+            self._reject(
+                "too_large", 413,
+                f"El archivo requiere ~{cost_mb:.0f} MB y el límite es {budget:.0f} MB: {hint}",
+                retry=False
+            )
+
+    def reserve(self, cost_mb: float) -> AdmissionTicket:
+        """
+        Reserva memoria del presupuesto para un job, esperando (en el hilo del job) a que quepa
+
+        Un job más grande que el presupuesto completo espera a que el servicio
+        quede vacío (check_cost lo rechaza antes, al encolarlo).
+        """
+        budget = self.memory_budget_mb
+        started = time.perf_counter()
+        with self._memory_freed:
+            while budget and self._reserved_mb > 0 and self._reserved_mb + cost_mb > budget:
+                self._memory_freed.wait()
+            self._jobs += 1
+            self._reserved_mb += cost_mb
+        waited = time.perf_counter() - started
+        if waited > 1:
+            logger.info(f"Job admitido tras esperar {waited:.1f}s por memoria (~{cost_mb:.0f} MB)")
+        return AdmissionTicket(self, cost_mb, slot=False)
+
+    def _release(self, ticket: AdmissionTicket):
+        with self._memory_freed:
+            if ticket.slot:
+                self._admitted -= 1
+            else:
+                self._jobs -= 1
+            self._reserved_mb -= ticket.cost_mb
+            self._memory_freed.notify_all()
+
+    async def run(self, func: Callable, *args, timeout: Optional[float] = -1):
+        """
+        Ejecuta func(*args) en el pool (con el contexto de la request: etapas de Server-Timing)
+
+        Args:
+            timeout: Espera máxima en cola antes de empezar (-1 = queue_timeout_s, None = sin límite)
+
+        Raises:
+            AdmissionRejected: 503 si no empezó dentro del timeout
+        """
+        timeout = self.queue_timeout_s if timeout == -1 else timeout
+        context = contextvars.copy_context()
+        submitted = time.perf_counter()
+
+        def task():
+            metrics.record_stage("queue", time.perf_counter() - submitted)
+            with self._lock:
+                self._running += 1
+            try:
+                return func(*args)
+            finally:
+                with self._lock:
+                    self._running -= 1
+
+        future = self._executor.submit(context.run, task)
+        try:
+            return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), timeout)
+        except asyncio.TimeoutError:
+            # Solo se cancela si todavía no empezó; si ya corre, se espera el resultado
+            if future.cancel():
+                self._reject("queue_timeout", 503, f"La solicitud esperó más de {timeout:.0f}s en cola")
+            return await asyncio.wrap_future(future)
+
+    async def iterate(self, iterator: Iterator[bytes], ticket: AdmissionTicket) -> AsyncIterator[bytes]:
+        """Avanza un generador síncrono (p. ej. un stream por bloques) en el pool y libera el cupo al final"""
+        done = object()
+        try:
+            while True:
+                chunk = await self.run(next, iterator, done, timeout=None)
+                if chunk is done:
+                    break
+                yield chunk
+        finally:
+            ticket.release()
+            close = getattr(iterator, "close", None)
+            try:
+                if close is not None:
+                    close()
+            except ValueError:
+                # Cliente desconectado con un bloque aún en proceso: el generador termina solo
+                pass
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "max_concurrency": self.max_concurrency,
+                "queue_size": self.queue_size,
+                "admitted": self._admitted,
+                "running": self._running,
+                "jobs": self._jobs,
+                "memory_budget_mb": self.memory_budget_mb,
+                "reserved_mb": round(self._reserved_mb, 1),
+                "rejected": dict(self._rejected),
+            }
+
+
+# Controlador global (singleton)
+_admission_controller: Optional[AdmissionController] = None
+_admission_controller_lock = threading.Lock()
+
+
+def get_admission_controller() -> AdmissionController:
+    """Control de admisión del proceso"""
+    global _admission_controller
+    if _admission_controller is None:
+        with _admission_controller_lock:
+            if _admission_controller is None:
+                _admission_controller = AdmissionController()
+                stats = _admission_controller.stats()
+                logger.info(
+                    f"Control de admisión: {stats['max_concurrency']} en proceso, {stats['queue_size']} en cola, "
+                    f"presupuesto {stats['memory_budget_mb'] or 'sin límite'} MB"
+                )
+    return _admission_controller
@@ -0,0 +1,270 @@
+"""
+Índice aproximado de vecinos (IVF) en NumPy para la interpolación UMAP
+
+El espacio escalado de referencia se particiona en celdas con k-means
+(cuantización gruesa). Cada consulta solo compara contra los puntos de las
+n_probe celdas más cercanas, en lugar de todo el conjunto de entrenamiento.
+
+Reporte de recall@k / concordancia de clusters contra el índice exacto:
+    python -m app.ann report --models-path models --n-lists 256 --n-probe 8
+"""
+import argparse
+import json
+import logging
+import time
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+IVF_FILES = ("ivf_centroids.npy", "ivf_order.npy", "ivf_offsets.npy")
+
+
+def _squared_distances(X: np.ndarray, Y: np.ndarray, Y_sq_norms: np.ndarray) -> np.ndarray:
+    """||x||² - 2·x·y + ||y||² sin el término de x (constante por fila)"""
+    sq_dist = X @ Y.T
+    sq_dist *= -2.0
+    sq_dist += Y_sq_norms
+    return sq_dist
+
+
+class IVFIndex:
+    """
+    Índice invertido sobre celdas k-means con la interfaz de NearestNeighbors.kneighbors
+
+    Args:
+        fit_X: Matriz de referencia escalada (shape: [n_samples, n_features])
+        centroids: Centroides de las celdas (shape: [n_lists, n_features])
+        order: Índices de fit_X ordenados por celda
+        offsets: Inicio de cada celda en order (shape: [n_lists + 1])
+        n_probe: Celdas visitadas por consulta
+    """
+
+    def __init__(
+        self,
+        fit_X: np.ndarray,
+        centroids: np.ndarray,
+        order: np.ndarray,
+        offsets: np.ndarray,
+        n_probe: int = 8
+    ):
+        self._fit_X = fit_X
+        self.n_samples_fit_ = len(fit_X)
+        self.centroids = np.ascontiguousarray(centroids, dtype=np.float64)
+        self.order = order
+        self.offsets = offsets
+        self.n_lists = len(self.centroids)
+        self.n_probe = max(1, min(n_probe, self.n_lists))
+        self._centroid_sq_norms = np.einsum('ij,ij->i', self.centroids, self.centroids)
+        self._fit_sq_norms = np.einsum('ij,ij->i', fit_X, fit_X)
+
+    @classmethod
+    def build(
+        cls,
+        fit_X: np.ndarray,
+        n_lists: Optional[int] = None,
+        n_probe: int = 8,
+        n_iter: int = 20,
+        random_state: int = 42
+    ) -> "IVFIndex":
+        """
+        Construye el índice ejecutando k-means (Lloyd) sobre la matriz de referencia
+
+        Args:
+            fit_X: Matriz de referencia escalada
+            n_lists: Número de celdas (default: ~sqrt(n_samples))
+            n_probe: Celdas visitadas por consulta
+            n_iter: Iteraciones de Lloyd
+            random_state: Semilla de la inicialización
+        """
+        fit_X = np.ascontiguousarray(fit_X, dtype=np.float64)
+        n_samples = len(fit_X)
+        n_lists = n_lists or max(1, int(np.sqrt(n_samples)))
+        n_lists = min(n_lists, n_samples)
+
+        logger.info(f"Construyendo índice IVF: {n_samples} muestras, {n_lists} celdas...")
+        rng = np.random.default_rng(random_state)
+        centroids = fit_X[rng.choice(n_samples, n_lists, replace=False)].copy()
+
+        for _ in range(n_iter):
+            assignments = cls._assign(fit_X, centroids)
+            counts = np.bincount(assignments, minlength=n_lists)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignments, fit_X)
+            non_empty = counts > 0
+            centroids[non_empty] = sums[non_empty] / counts[non_empty, np.newaxis]
+
+        assignments = cls._assign(fit_X, centroids)
+        order = np.argsort(assignments, kind='stable')
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(assignments, minlength=n_lists))])
+        return cls(fit_X, centroids, order, offsets, n_probe=n_probe)
+
+    @staticmethod
+    def _assign(X: np.ndarray, centroids: np.ndarray, block: int = 8192) -> np.ndarray:
+        """Celda más cercana de cada fila, por bloques"""
+        sq_norms = np.einsum('ij,ij->i', centroids, centroids)
+        assignments = np.empty(len(X), dtype=np.intp)
+        for start in range(0, len(X), block):
+            stop = min(start + block, len(X))
+            assignments[start:stop] = _squared_distances(X[start:stop], centroids, sq_norms).argmin(axis=1)
+        return assignments
+
+    def save(self, path: str):
+        """Guarda centroides y listas invertidas como .npy junto a los artefactos"""
+        path = Path(path)
+        np.save(path / IVF_FILES[0], self.centroids)
+        np.save(path / IVF_FILES[1], self.order)
+        np.save(path / IVF_FILES[2], self.offsets)
+
+    @classmethod
+    def load(cls, path: str, fit_X: np.ndarray, n_probe: int = 8) -> "IVFIndex":
+        """Carga un índice guardado con save() (memory-mapped)"""
+        path = Path(path)
+        centroids, order, offsets = (np.load(path / name, mmap_mode='r') for name in IVF_FILES)
+        if offsets[-1] != len(fit_X):
+            raise ValueError(
+                f"Índice IVF desactualizado: indexa {offsets[-1]} muestras, la referencia tiene {len(fit_X)}"
+            )
+        return cls(fit_X, centroids, order, offsets, n_probe=n_probe)
+
+    def kneighbors(self, X: np.ndarray, n_neighbors: int = 5) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Vecinos aproximados: búsqueda exacta restringida a las n_probe celdas más cercanas
+
+        Returns:
+            Tuple (distances, indices), ordenados por distancia ascendente
+        """
+        X = np.ascontiguousarray(X, dtype=np.float64)
+        n_neighbors = min(n_neighbors, self.n_samples_fit_)
+        best_d = np.full((len(X), n_neighbors), np.inf)
+        best_i = np.full((len(X), n_neighbors), -1, dtype=np.intp)
+
+        centroid_d = _squared_distances(X, self.centroids, self._centroid_sq_norms)
+        if self.n_probe < self.n_lists:
+            probes = np.argpartition(centroid_d, self.n_probe - 1, axis=1)[:, :self.n_probe]
+        else:
+            probes = np.broadcast_to(np.arange(self.n_lists), centroid_d.shape)
+
+        for cell in np.unique(probes):
+            members = self.order[self.offsets[cell]:self.offsets[cell + 1]]
+            if len(members) == 0:
+                continue
+            rows = np.flatnonzero((probes == cell).any(axis=1))
+            cell_d = _squared_distances(X[rows], self._fit_X[members], self._fit_sq_norms[members])
+            cand_d = np.hstack([best_d[rows], cell_d])
+            cand_i = np.hstack([best_i[rows], np.broadcast_to(members, cell_d.shape)])
+            keep = np.argpartition(cand_d, n_neighbors - 1, axis=1)[:, :n_neighbors]
+            best_d[rows] = np.take_along_axis(cand_d, keep, axis=1)
+            best_i[rows] = np.take_along_axis(cand_i, keep, axis=1)
+
+        # Filas con menos de k candidatos en sus celdas: búsqueda completa
+        incomplete = np.flatnonzero((best_i < 0).any(axis=1))
+        if len(incomplete):
+            full_d = _squared_distances(X[incomplete], self._fit_X, self._fit_sq_norms)
+            best_i[incomplete] = np.argpartition(full_d, n_neighbors - 1, axis=1)[:, :n_neighbors]
+
+        # Distancias exactas de los k seleccionados y orden final
+        diff = X[:, np.newaxis, :] - self._fit_X[best_i]
+        dist = np.sqrt(np.einsum('ijk,ijk->ij', diff, diff))
+        order = np.argsort(dist, axis=1, kind='stable')
+        return np.take_along_axis(dist, order, axis=1), np.take_along_axis(best_i, order, axis=1)
+
+
+def compare_indexes(model, approx_index, X_scaled: np.ndarray, n_neighbors: Optional[int] = None) -> Dict:
+    """
+    Compara un índice aproximado contra el índice exacto del modelo
+
+    Args:
+        model: ClusteringModel cargado (aporta el índice exacto, embeddings y KMeans)
+        approx_index: Índice con interfaz kneighbors (p. ej. IVFIndex)
+        X_scaled: Muestras escaladas de consulta
+        n_neighbors: k de la evaluación (default: model.n_neighbors)
+
+    Returns:
+        Diccionario con recall@k, concordancia de clusters y tiempos
+    """
+    exact_index = model.exact_knn_index
+    n_neighbors = n_neighbors or model.n_neighbors
+
+    start = time.perf_counter()
+    _, exact_idx = exact_index.kneighbors(X_scaled, n_neighbors=n_neighbors)
+    exact_umap = model._approximate_umap(X_scaled, n_neighbors=n_neighbors, knn_index=exact_index)
+    exact_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    _, approx_idx = approx_index.kneighbors(X_scaled, n_neighbors=n_neighbors)
+    approx_umap = model._approximate_umap(X_scaled, n_neighbors=n_neighbors, knn_index=approx_index)
+    approx_seconds = time.perf_counter() - start
+
+    hits = sum(len(np.intersect1d(a, b)) for a, b in zip(exact_idx, approx_idx))
+    exact_labels = model.kmeans_model.predict(exact_umap)
+    approx_labels = model.kmeans_model.predict(approx_umap)
+
+    return {
+        'n_queries': int(len(X_scaled)),
+        'k': int(n_neighbors),
+        f'recall@{n_neighbors}': hits / exact_idx.size,
+        'cluster_agreement': float((exact_labels == approx_labels).mean()),
+        'max_embedding_error': float(np.abs(exact_umap - approx_umap).max()),
+        'exact_seconds': exact_seconds,
+        'approx_seconds': approx_seconds,
+        'speedup': exact_seconds / approx_seconds if approx_seconds else None,
+        'n_lists': getattr(approx_index, 'n_lists', None),
+        'n_probe': getattr(approx_index, 'n_probe', None),
+    }
+
+
+def main():
+    from app.prediction import ClusteringModel
+
+    parser = argparse.ArgumentParser(description="Índice IVF para la aproximación UMAP")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    build_parser = subparsers.add_parser('build', help="Construye y guarda el índice IVF en la carpeta de modelos")
+    report_parser = subparsers.add_parser('report', help="Recall@k y concordancia de clusters vs índice exacto")
+    for sub in (build_parser, report_parser):
+        sub.add_argument('--models-path', default="models")
+        sub.add_argument('--n-lists', type=int, default=None, help="Celdas (default: sqrt(n))")
+        sub.add_argument('--n-probe', type=int, default=8, help="Celdas visitadas por consulta")
+    report_parser.add_argument('--data', default=None, help="CSV/XLSX crudo para las consultas")
+    report_parser.add_argument('--n-queries', type=int, default=2000, help="Consultas sintéticas si no hay --data")
+    report_parser.add_argument('--k', type=int, default=None)
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING, format="%(message)s")
+
+    model = ClusteringModel(args.models_path, knn_backend="exact")
+    fit_X = model.exact_knn_index._fit_X
+    index = IVFIndex.build(fit_X, n_lists=args.n_lists, n_probe=args.n_probe)
+
+    if args.command == 'build':
+        index.save(args.models_path)
+        print(f"Índice IVF guardado en {args.models_path}: {index.n_lists} celdas")
+    else:
+        if args.data:
+            X_scaled = _scale_upload(model, args.data)
+        else:
+            # Puntos medios entre pares de referencia: no coinciden con ningún punto indexado
+            rng = np.random.default_rng(0)
+            a, b = rng.integers(0, len(fit_X), (2, args.n_queries))
+            X_scaled = (np.asarray(fit_X[a]) + np.asarray(fit_X[b])) / 2.0
+        report = compare_indexes(model, index, X_scaled, n_neighbors=args.k)
+        print(json.dumps(report, indent=2))
+
+
+def _scale_upload(model, data_path: str) -> np.ndarray:
+    """Lee, preprocesa y escala un archivo crudo como lo hace el endpoint /cluster"""
+    from app.ingestion import read_upload
+    from app.preprocessing import DataPreprocessor
+
+    with open(data_path, 'rb') as f:
+        df = read_upload(f, data_path)
+    df_processed, _ = DataPreprocessor().process(df)
+    X = df_processed[list(model.scaler.feature_names_in_)].astype(np.float64).dropna()
+    return model.scaler.transform(X)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,290 @@
+"""
+Formato plano de artefactos del modelo (arrays .npy + manifest.json)
+
+Exporta los pickles de entrenamiento (scaler, KMeans y datos UMAP + KNN) a
+arrays NumPy float64 que se cargan con np.load(mmap_mode='r'): sin
+deserializar objetos de sklearn y sin copias, de modo que el page cache del
+sistema operativo se comparte entre contenedores y workers.
+
+Con MODELS_SHARED_PATH (p. ej. /dev/shm/coomeva-models) los modelos en pickle
+se exportan una sola vez por máquina a esa carpeta en memoria compartida y
+todos los workers de uvicorn mapean los mismos arrays de solo lectura.
+
+Uso:
+    python -m app.artifacts export --models-path models --output models
+"""
+import argparse
+import datetime
+import hashlib
+import json
+import logging
+import os
+import pickle
+import shutil
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin lock entre procesos
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+MANIFEST_NAME = "manifest.json"
+PICKLE_FILES = ("scaler_model.pkl", "kmeans_model.pkl", "umap_data.pkl")
+
+
+class ArrayScaler:
+    """Equivalente de StandardScaler.transform sobre arrays planos"""
+
+    def __init__(self, mean: np.ndarray, scale: np.ndarray, feature_names: List[str]):
+        self.mean_ = mean
+        self.scale_ = scale
+        self.feature_names_in_ = np.asarray(feature_names, dtype=object)
+        self.n_features_in_ = len(feature_names)
+
+    def transform(self, X) -> np.ndarray:
+        X = np.array(X, dtype=np.float64)
+        X -= self.mean_
+        X /= self.scale_
+        return X
+
+
+class ArrayKMeans:
+    """Equivalente de KMeans.predict sobre los centroides"""
+
+    def __init__(self, cluster_centers: np.ndarray):
+        self.cluster_centers_ = cluster_centers
+        self.n_clusters = len(cluster_centers)
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        X = np.asarray(X, dtype=np.float64)
+        distances = ((X[:, np.newaxis, :] - self.cluster_centers_[np.newaxis, :, :]) ** 2).sum(axis=2)
+        return distances.argmin(axis=1).astype(np.int32)
+
+
+class BruteForceKNN:
+    """
+    Búsqueda exacta de vecinos (distancia euclidiana) sobre una matriz de referencia
+
+    Reemplaza a NearestNeighbors.kneighbors sin deserializar el objeto de sklearn.
+    Las consultas se procesan en bloques para que la matriz de distancias
+    temporal no supere working_memory_mb. Las normas de la referencia se
+    calculan al crear el índice, salvo que vengan exportadas (mmap).
+    """
+
+    def __init__(self, fit_X: np.ndarray, working_memory_mb: int = 64, sq_norms: Optional[np.ndarray] = None):
+        self._fit_X = fit_X
+        self.n_samples_fit_ = len(fit_X)
+        self.working_memory_mb = working_memory_mb
+        self._fit_sq_norms = sq_norms if sq_norms is not None else np.einsum('ij,ij->i', fit_X, fit_X)
+
+    def kneighbors(self, X: np.ndarray, n_neighbors: int = 5) -> Tuple[np.ndarray, np.ndarray]:
+        X = np.ascontiguousarray(X, dtype=np.float64)
+        n_neighbors = min(n_neighbors, self.n_samples_fit_)
+        distances = np.empty((len(X), n_neighbors), dtype=np.float64)
+        indices = np.empty((len(X), n_neighbors), dtype=np.intp)
+
+        block = max(1, (self.working_memory_mb * 2 ** 20) // (8 * self.n_samples_fit_))
+        for start in range(0, len(X), block):
+            stop = min(start + block, len(X))
+            distances[start:stop], indices[start:stop] = self._kneighbors_block(X[start:stop], n_neighbors)
+        return distances, indices
+
+    def _kneighbors_block(self, X: np.ndarray, n_neighbors: int) -> Tuple[np.ndarray, np.ndarray]:
+        # Candidatos con ||x||² - 2·x·y + ||y||² (rápido, con error de redondeo)
+        sq_dist = X @ self._fit_X.T
+        sq_dist *= -2.0
+        sq_dist += self._fit_sq_norms
+        if n_neighbors < self.n_samples_fit_:
+            candidates = np.argpartition(sq_dist, n_neighbors - 1, axis=1)[:, :n_neighbors]
+        else:
+            candidates = np.broadcast_to(np.arange(self.n_samples_fit_), sq_dist.shape)
+
+        # Distancias exactas de los candidatos y orden final
+        diff = X[:, np.newaxis, :] - self._fit_X[candidates]
+        dist = np.sqrt(np.einsum('ijk,ijk->ij', diff, diff))
+        order = np.argsort(dist, axis=1, kind='stable')
+        return np.take_along_axis(dist, order, axis=1), np.take_along_axis(candidates, order, axis=1)
+
+
+def file_sha256(path: Path) -> str:
+    """SHA-256 de un archivo, leído por bloques"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def export_artifacts(models_path: str = "models", output_path: Optional[str] = None) -> Path:
+    """
+    Exporta los pickles del modelo al formato plano versionado
+
+    Args:
+        models_path: Carpeta con scaler_model.pkl, kmeans_model.pkl y umap_data.pkl
+        output_path: Carpeta de destino (default: la misma carpeta de modelos)
+
+    Returns:
+        Ruta al manifest.json generado
+    """
+    models_path = Path(models_path)
+    output_path = Path(output_path) if output_path else models_path
+    output_path.mkdir(parents=True, exist_ok=True)
+
+    with open(models_path / "scaler_model.pkl", 'rb') as f:
+        scaler = pickle.load(f)
+    with open(models_path / "kmeans_model.pkl", 'rb') as f:
+        kmeans = pickle.load(f)
+    with open(models_path / "umap_data.pkl", 'rb') as f:
+        umap_data = pickle.load(f)
+
+    knn_index = umap_data['knn_index']
+    metric = getattr(knn_index, 'effective_metric_', 'euclidean')
+    if metric != 'euclidean':
+        raise ValueError(f"Métrica KNN no soportada para exportar: {metric} (se requiere euclidean)")
+
+    n_features = len(scaler.feature_names_in_)
+    arrays = {
+        'scaler_mean': scaler.mean_ if scaler.mean_ is not None else np.zeros(n_features),
+        'scaler_scale': scaler.scale_ if scaler.scale_ is not None else np.ones(n_features),
+        'kmeans_centers': kmeans.cluster_centers_,
+        'umap_embeddings': umap_data['embeddings'],
+        'knn_fit_X': knn_index._fit_X,
+    }
+    fit_X = np.ascontiguousarray(arrays['knn_fit_X'], dtype=np.float64)
+    arrays['knn_fit_sq_norms'] = np.einsum('ij,ij->i', fit_X, fit_X)
+
+    manifest = {
+        'format_version': FORMAT_VERSION,
+        'created_at': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'source': {name: file_sha256(models_path / name) for name in PICKLE_FILES},
+        'scaler_feature_names': [str(c) for c in scaler.feature_names_in_],
+        'feature_names': [str(c) for c in umap_data['feature_names']],
+        'n_clusters': int(kmeans.n_clusters),
+        'knn_metric': metric,
+        'arrays': {},
+    }
+
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array, dtype=np.float64)
+        file_name = f"{name}.npy"
+        np.save(output_path / file_name, array)
+        manifest['arrays'][name] = {
+            'file': file_name,
+            'dtype': str(array.dtype),
+            'shape': list(array.shape),
+        }
+        logger.info(f"  ✓ {file_name}: {array.shape}")
+
+    manifest_path = output_path / MANIFEST_NAME
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+
+    logger.info(f"Artefactos exportados en {output_path}")
+    return manifest_path
+
+
+def load_artifacts(path: str) -> Dict:
+    """
+    Carga los artefactos del formato plano con memory-mapping (sin copias)
+
+    Args:
+        path: Carpeta que contiene manifest.json
+
+    Returns:
+        Diccionario con scaler, kmeans_model, umap_embeddings, knn_index,
+        feature_names y manifest
+    """
+    path = Path(path)
+    with open(path / MANIFEST_NAME, encoding='utf-8') as f:
+        manifest = json.load(f)
+
+    if manifest.get('format_version') != FORMAT_VERSION:
+        raise ValueError(
+            f"Versión de formato no soportada: {manifest.get('format_version')} "
+            f"(se esperaba {FORMAT_VERSION})"
+        )
+
+    arrays = {}
+    for name, spec in manifest['arrays'].items():
+        array = np.load(path / spec['file'], mmap_mode='r')
+        if str(array.dtype) != spec['dtype'] or list(array.shape) != spec['shape']:
+            raise ValueError(
+                f"Artefacto {spec['file']} no coincide con el manifest: "
+                f"{array.dtype}{array.shape} vs {spec['dtype']}{tuple(spec['shape'])}"
+            )
+        arrays[name] = array
+
+    return {
+        'scaler': ArrayScaler(arrays['scaler_mean'], arrays['scaler_scale'], manifest['scaler_feature_names']),
+        'kmeans_model': ArrayKMeans(arrays['kmeans_centers']),
+        'umap_embeddings': arrays['umap_embeddings'],
+        'knn_index': BruteForceKNN(arrays['knn_fit_X'], sq_norms=arrays.get('knn_fit_sq_norms')),
+        'feature_names': manifest['feature_names'],
+        'manifest': manifest,
+    }
+
+
+def share_artifacts(models_path: str, shared_root: str, fingerprint: str) -> Path:
+    """
+    Exporta los pickles a una carpeta compartida por los procesos de la máquina
+
+    El primer proceso exporta (con lock de archivo) a shared_root/<huella>/ y
+    renombra la carpeta al terminar; los demás reutilizan el mismo manifest.
+    Apuntar shared_root a un tmpfs (/dev/shm) deja los arrays en memoria
+    compartida: cada worker los mapea de solo lectura en lugar de tener su copia.
+
+    Args:
+        models_path: Carpeta con los pickles
+        shared_root: Carpeta compartida (se crea si no existe)
+        fingerprint: Huella de los pickles (nombre de la subcarpeta)
+
+    Returns:
+        Carpeta con el manifest.json listo para load_artifacts
+    """
+    shared_root = Path(shared_root)
+    target = shared_root / fingerprint[:16]
+    if (target / MANIFEST_NAME).exists():
+        return target
+
+    shared_root.mkdir(parents=True, exist_ok=True)
+    with open(shared_root / ".lock", "w") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            if not (target / MANIFEST_NAME).exists():
+                tmp_path = shared_root / f".{target.name}.{os.getpid()}"
+                shutil.rmtree(tmp_path, ignore_errors=True)
+                export_artifacts(str(models_path), str(tmp_path))
+                shutil.rmtree(target, ignore_errors=True)
+                os.rename(tmp_path, target)
+                logger.info(f"✓ Modelos exportados a memoria compartida en {target}")
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+    return target
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Exporta los modelos al formato plano memory-mapped")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    export_parser = subparsers.add_parser('export', help="Exporta los pickles a .npy + manifest.json")
+    export_parser.add_argument('--models-path', default="models", help="Carpeta con los pickles")
+    export_parser.add_argument('--output', default=None, help="Carpeta de destino (default: --models-path)")
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    if args.command == 'export':
+        manifest_path = export_artifacts(args.models_path, args.output)
+        print(f"Manifest: {manifest_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+"""
+Caché de predicciones por fila, indexada por el hash del vector de features
+
+Las filas con el mismo vector (en el orden de scaler.feature_names_in_) se
+deduplican dentro del lote y reutilizan el embedding UMAP y el cluster ya
+calculados. La caché se asocia a la huella de los artefactos del modelo y de
+los parámetros de la aproximación (n_neighbors, KNN_BACKEND, celdas y n_probe
+del IVF): si cambian, las entradas anteriores se descartan.
+"""
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Dict, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Entradas en memoria (0 desactiva la caché) y archivo SQLite opcional de persistencia
+PREDICTION_CACHE_SIZE = int(os.getenv("PREDICTION_CACHE_SIZE", "100000"))
+PREDICTION_CACHE_PATH = os.getenv("PREDICTION_CACHE_PATH", "")
+
+
+class SQLiteCacheStore:
+    """Persistencia en disco de la caché (una tabla clave -> embedding + cluster)"""
+
+    def __init__(self, path: str, fingerprint: str):
+        self.path = path
+        self._lock = threading.Lock()
+        import sqlite3  # solo con PREDICTION_CACHE_PATH (menos imports en el arranque)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS predictions "
+                "(key BLOB PRIMARY KEY, umap_1 REAL, umap_2 REAL, label INTEGER)"
+            )
+            row = self._conn.execute("SELECT value FROM meta WHERE key = 'fingerprint'").fetchone()
+            if row is None or row[0] != fingerprint:
+                if row is not None:
+                    logger.info(f"Caché en disco invalidada: modelos cambiaron ({row[0][:12]} -> {fingerprint[:12]})")
+                self._conn.execute("DELETE FROM predictions")
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO meta (key, value) VALUES ('fingerprint', ?)", (fingerprint,)
+                )
+
+    def get_many(self, keys) -> Dict[bytes, Tuple[float, float, int]]:
+        found = {}
+        keys = list(keys)
+        with self._lock:
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                for key, u1, u2, label in self._conn.execute(
+                    f"SELECT key, umap_1, umap_2, label FROM predictions WHERE key IN ({placeholders})", batch
+                ):
+                    found[bytes(key)] = (u1, u2, label)
+        return found
+
+    def put_many(self, items):
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO predictions (key, umap_1, umap_2, label) VALUES (?, ?, ?, ?)",
+                [(key, u1, u2, label) for key, (u1, u2, label) in items]
+            )
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM predictions").fetchone()[0]
+
+
+class PredictionCache:
+    """
+    Caché LRU de (embedding UMAP, cluster) por vector de features
+
+    Args:
+        fingerprint: Huella de los artefactos del modelo
+        max_entries: Entradas máximas en memoria (LRU)
+        store: Persistencia opcional en disco (SQLiteCacheStore)
+    """
+
+    def __init__(self, fingerprint: str, max_entries: int = PREDICTION_CACHE_SIZE,
+                 store: Optional[SQLiteCacheStore] = None):
+        self.fingerprint = fingerprint
+        self.max_entries = max_entries
+        self.store = store
+        self._entries: "OrderedDict[bytes, Tuple[float, float, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.batch_duplicates = 0
+
+    @classmethod
+    def from_env(cls, fingerprint: str, version: Optional[str] = None) -> Optional["PredictionCache"]:
+        """
+        Crea la caché según PREDICTION_CACHE_SIZE / PREDICTION_CACHE_PATH (None si está desactivada)
+
+        Con una versión del registro el archivo lleva su nombre (cache.2025-10.db): dos
+        versiones cargadas a la vez no se invalidan entre sí
+        """
+        if PREDICTION_CACHE_SIZE <= 0:
+            return None
+        store = None
+        if PREDICTION_CACHE_PATH:
+            path = Path(PREDICTION_CACHE_PATH)
+            if version is not None:
+                path = path.with_name(f"{path.stem}.{version}{path.suffix}")
+            store = SQLiteCacheStore(str(path), fingerprint)
+        return cls(fingerprint, PREDICTION_CACHE_SIZE, store)
+
+    @staticmethod
+    def _row_key(row: np.ndarray) -> bytes:
+        return hashlib.blake2b(row.tobytes(), digest_size=16).digest()
+
+    def resolve(
+        self,
+        X: np.ndarray,
+        compute: Callable[[np.ndarray], Tuple[np.ndarray, np.ndarray]]
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Obtiene embeddings y clusters de cada fila, calculando solo las filas nuevas
+
+        Args:
+            X: Features en el orden de scaler.feature_names_in_ (float64, sin NaN)
+            compute: Función X -> (X_umap, labels) para las filas no cacheadas
+
+        Returns:
+            Tuple (X_umap, labels) alineados con las filas de X
+        """
+        # +0.0 normaliza -0.0 a 0.0 para que valores iguales tengan los mismos bytes
+        X = np.ascontiguousarray(X, dtype=np.float64) + 0.0
+        rows = X.view(np.dtype((np.void, X.dtype.itemsize * X.shape[1]))).ravel()
+        _, first, inverse = np.unique(rows, return_index=True, return_inverse=True)
+        unique_X = X[first]
+        keys = [self._row_key(row) for row in unique_X]
+
+        values = np.empty((len(keys), 3), dtype=np.float64)
+        missing = []
+        with self._lock:
+            for j, key in enumerate(keys):
+                value = self._entries.get(key)
+                if value is None:
+                    missing.append(j)
+                else:
+                    self._entries.move_to_end(key)
+                    values[j] = value
+
+        if missing and self.store is not None:
+            stored = self.store.get_many(keys[j] for j in missing)
+            if stored:
+                still_missing = []
+                for j in missing:
+                    value = stored.get(keys[j])
+                    if value is None:
+                        still_missing.append(j)
+                    else:
+                        values[j] = value
+                self._put([(keys[j], tuple(values[j])) for j in missing if keys[j] in stored])
+                missing = still_missing
+
+        if missing:
+            X_umap, labels = compute(unique_X[missing])
+            values[missing, :2] = X_umap
+            values[missing, 2] = labels
+            new_items = [
+                (keys[j], (float(values[j, 0]), float(values[j, 1]), int(values[j, 2])))
+                for j in missing
+            ]
+            self._put(new_items)
+            if self.store is not None:
+                self.store.put_many(new_items)
+
+        with self._lock:
+            self.hits += len(keys) - len(missing)
+            self.misses += len(missing)
+            self.batch_duplicates += len(X) - len(keys)
+
+        values = values[inverse.ravel()]
+        return values[:, :2], values[:, 2].astype(np.int32)
+
+    def _put(self, items):
+        with self._lock:
+            for key, value in items:
+                self._entries[key] = value
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict:
+        """Contadores para /api/v1/cluster/info"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": True,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "batch_duplicates": self.batch_duplicates,
+                "evictions": self.evictions,
+                "persistent": self.store is not None,
+                "fingerprint": self.fingerprint[:12],
+            }
@@ -0,0 +1,229 @@
+"""
+Lectura de archivos subidos con proyección de columnas y tipos explícitos
+
+Solo se leen las columnas que DataPreprocessor usa (las que elimina al inicio,
+Egresos y las de columns_to_drop_detailed no se parsean) y cada una con su tipo:
+categóricas para los campos de texto codificados con one-hot, texto para
+IdUnico y fechas, float64 para montos y conteos e Int8 para los indicadores de
+productos. El CSV se lee con el motor de pyarrow y el XLSX recorriendo la hoja
+en modo read-only de openpyxl. Si el archivo no cumple los tipos (p. ej. texto
+en un indicador) se vuelve a leer con la inferencia de pandas.
+"""
+import importlib.util
+import logging
+import os
+from typing import BinaryIO, Dict, List
+
+import numpy as np
+import pandas as pd
+
+from app.preprocessing import (
+    CATEGORICAL_INPUT_COLUMNS, EXPECTED_COLUMNS, TEXT_COLUMNS, DataPreprocessor
+)
+
+logger = logging.getLogger(__name__)
+
+# Lectura tipada y proyectada (false = pd.read_csv / pd.read_excel sin dtype) y motor del CSV
+INGEST_TYPED = os.getenv("INGEST_TYPED", "true").lower() in ("1", "true", "yes")
+INGEST_CSV_ENGINE = os.getenv("INGEST_CSV_ENGINE", "pyarrow")
+
+# Montos, conteos y variables derivadas que pueden venir precalculadas: float64
+MONEY_COLUMNS = [
+    'Ingresos', 'Ingresos_Deflactados', 'Saldo_aportes', 'Vlr_mora', 'saldo_VISA',
+    'MasterCardCupo', 'MasterCardSaldo'
+]
+COUNT_COLUMNS = [
+    'Personas_a_Cargo', 'Cuotas_canceladas_aportes', 'Cuotas_mora_aportes', 'numedad', 'numCantidadProductos'
+]
+DERIVED_INPUT_COLUMNS = ['log_ingresos', 'log_ingresos_deflactados', 'Antiguedad_dias', 'Edad']
+
+
+def _input_columns() -> List[str]:
+    """Columnas del archivo que llegan a la salida (EXPECTED_COLUMNS menos las eliminadas)"""
+    preprocessor = DataPreprocessor()
+    dropped = set(preprocessor.columnas_a_eliminar_inicial) | {'Egresos'} | set(preprocessor.columns_to_drop_detailed)
+    # IdUnico se elimina de la matriz pero se guarda antes como texto
+    dropped -= set(TEXT_COLUMNS)
+    return [col for col in EXPECTED_COLUMNS if col not in dropped]
+
+
+def _input_dtypes(columns: List[str]) -> Dict[str, str]:
+    raw_end = EXPECTED_COLUMNS.index(DERIVED_INPUT_COLUMNS[0])
+    raw_columns = set(EXPECTED_COLUMNS[:raw_end])
+    float_columns = set(MONEY_COLUMNS) | set(COUNT_COLUMNS) | set(DERIVED_INPUT_COLUMNS)
+
+    dtypes = {}
+    for col in columns:
+        if col in CATEGORICAL_INPUT_COLUMNS:
+            dtypes[col] = 'category'
+        elif col in TEXT_COLUMNS:
+            dtypes[col] = 'str'
+        elif col in float_columns:
+            dtypes[col] = 'float64'
+        elif col in raw_columns:
+            # Indicadores de productos (0/1, nulos permitidos)
+            dtypes[col] = 'Int8'
+    return dtypes
+
+
+INPUT_COLUMNS = _input_columns()
+INPUT_DTYPES = _input_dtypes(INPUT_COLUMNS)
+_INPUT_COLUMN_SET = set(INPUT_COLUMNS)
+
+# Fechas y textos de un XLSX pueden venir como celdas de fecha o números: sin forzar a texto
+_XLSX_DTYPES = {col: dtype for col, dtype in INPUT_DTYPES.items() if dtype != 'str'}
+
+
+def _csv_engine() -> str:
+    # Sin pyarrow instalado se usa el parser C (pandas lo importa solo al leer)
+    if INGEST_CSV_ENGINE == "pyarrow" and importlib.util.find_spec("pyarrow") is None:
+        return "c"
+    return INGEST_CSV_ENGINE
+
+
+def read_csv_typed(source: BinaryIO) -> pd.DataFrame:
+    """CSV con las columnas de entrada y sus tipos"""
+    start = source.tell()
+    header = pd.read_csv(source, nrows=0).columns
+    source.seek(start)
+    usecols = [col for col in header if col in _INPUT_COLUMN_SET]
+    return pd.read_csv(
+        source,
+        usecols=usecols,
+        dtype={col: INPUT_DTYPES[col] for col in usecols if col in INPUT_DTYPES},
+        engine=_csv_engine()
+    )
+
+
+# Errores de fórmula que pd.read_excel convierte en NaN
+_XLSX_ERROR_CODES = frozenset(("#NULL!", "#DIV/0!", "#VALUE!", "#REF!", "#NAME?", "#NUM!", "#N/A"))
+
+
+def _xlsx_cell(value):
+    """Mismo valor que pd.read_excel (openpyxl): vacío = "", números enteros como int"""
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, float):
+        as_int = int(value)
+        return as_int if as_int == value else value
+    if isinstance(value, str) and value in _XLSX_ERROR_CODES:
+        return np.nan
+    return value
+
+
+def read_xlsx_typed(source: BinaryIO) -> pd.DataFrame:
+    """
+    Primera hoja de un XLSX recorrida en modo read-only, solo con las columnas de entrada
+
+    Las filas pasan por el mismo TextParser que usa pd.read_excel, de modo que la
+    inferencia de tipos (números como texto, valores NA) es la misma.
+    """
+    from openpyxl import load_workbook
+    from pandas.io.parsers import TextParser
+
+    workbook = load_workbook(source, read_only=True, data_only=True, keep_links=False)
+    try:
+        sheet = workbook.worksheets[0]
+        sheet.reset_dimensions()
+        rows = sheet.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return pd.DataFrame()
+        keep = [j for j, name in enumerate(header) if name is not None and str(name) in _INPUT_COLUMN_SET]
+        names = [str(header[j]) for j in keep]
+        n_cells = len(header)
+        data = [[_xlsx_cell(row[j]) if j < len(row) else "" for j in keep] for row in rows]
+    finally:
+        workbook.close()
+
+    # Filas vacías al final (celdas con formato pero sin valores)
+    while data and all(value == "" for value in data[-1]):
+        data.pop()
+    logger.debug(f"XLSX: {len(names)} de {n_cells} columnas leídas, {len(data)} filas")
+
+    df = TextParser([names] + data, header=0).read()
+    dtypes = {col: _XLSX_DTYPES[col] for col in df.columns if col in _XLSX_DTYPES}
+    return df.astype(dtypes) if dtypes else df
+
+
+def read_upload(source: BinaryIO, filename: str) -> pd.DataFrame:
+    """
+    Lee un archivo CSV o XLSX subido al API
+
+    Con INGEST_TYPED solo se parsean las columnas de entrada y con tipos
+    explícitos; si el archivo no los cumple se lee con la inferencia de pandas.
+    """
+    is_csv = filename.lower().endswith('.csv')
+    if INGEST_TYPED:
+        start = source.tell()
+        try:
+            return read_csv_typed(source) if is_csv else read_xlsx_typed(source)
+        except (ValueError, TypeError) as e:
+            logger.warning(f"⚠️  Lectura tipada falló ({e}); se usa la inferencia de pandas")
+            source.seek(start)
+
+    if is_csv:
+        return pd.read_csv(source)
+    return pd.read_excel(source)
+
+
+def read_upload_sample(source: BinaryIO, filename: str, n_rows: int) -> pd.DataFrame:
+    """
+    Encabezado completo y primeras n_rows filas sin convertir (validación de esquema)
+
+    Todas las columnas del archivo, con los valores como los entrega el lector:
+    texto en el CSV; texto, números o fechas en el XLSX. Celdas vacías = NaN. El
+    archivo queda en la posición en que estaba.
+    """
+    start = source.tell()
+    try:
+        if filename.lower().endswith('.csv'):
+            return pd.read_csv(source, nrows=n_rows, dtype=str, engine="c")
+
+        from openpyxl import load_workbook
+
+        workbook = load_workbook(source, read_only=True, data_only=True, keep_links=False)
+        try:
+            sheet = workbook.worksheets[0]
+            sheet.reset_dimensions()
+            rows = sheet.iter_rows(values_only=True)
+            header = next(rows, None) or ()
+            keep = [j for j, name in enumerate(header) if name is not None]
+            data = []
+            for row in rows:
+                if len(data) >= n_rows:
+                    break
+                data.append([_xlsx_cell(row[j]) if j < len(row) else "" for j in keep])
+        finally:
+            workbook.close()
+        while data and all(value == "" for value in data[-1]):
+            data.pop()
+        df = pd.DataFrame(data, columns=[str(header[j]) for j in keep], dtype=object)
+        return df.where(df != "")
+    finally:
+        source.seek(start)
+
+
+def read_csv_chunks(source: BinaryIO, chunk_rows: int):
+    """
+    Lector por bloques de un CSV (modo streaming) con proyección y tipos
+
+    Los bloques se leen con el motor C (pyarrow no lee por bloques). Las
+    categóricas se leen como texto en todos los casos para que la inferencia no
+    cambie entre bloques.
+    """
+    if not INGEST_TYPED:
+        return pd.read_csv(source, chunksize=chunk_rows, dtype={col: str for col in CATEGORICAL_INPUT_COLUMNS})
+
+    start = source.tell()
+    header = pd.read_csv(source, nrows=0).columns
+    source.seek(start)
+    usecols = [col for col in header if col in _INPUT_COLUMN_SET]
+    return pd.read_csv(
+        source,
+        chunksize=chunk_rows,
+        usecols=usecols,
+        dtype={col: INPUT_DTYPES[col] for col in usecols if col in INPUT_DTYPES}
+    )
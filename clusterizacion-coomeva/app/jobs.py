@@ -0,0 +1,434 @@
+"""
+Jobs asíncronos de clusterización
+
+El archivo se guarda en un JobStore y se procesa en un pool de workers en
+segundo plano; el estado (etapa, progreso, error) y el resultado se consultan
+por id. Los stores son intercambiables: sistema de archivos local o SQLite.
+"""
+import json
+import logging
+import os
+import shutil
+import socket
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from typing import BinaryIO, Callable, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Store (filesystem | sqlite), ubicación, workers y retención de jobs terminados
+JOB_STORE = os.getenv("JOB_STORE", "filesystem").lower()
+JOB_STORE_PATH = os.getenv("JOB_STORE_PATH", "/tmp/coomeva_jobs")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_RETENTION_HOURS = float(os.getenv("JOB_RETENTION_HOURS", "24"))
+
+# En Lambda el proceso se congela al responder: los workers en hilos no avanzan entre invocaciones
+JOBS_SUPPORTED = not os.getenv("AWS_LAMBDA_FUNCTION_NAME")
+
+JOB_STAGES = ("parse", "preprocess", "predict", "format")
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+
+def new_job(filename: str, output_format: str, stages: Tuple[str, ...] = JOB_STAGES,
+            options: Optional[Dict] = None) -> Dict:
+    """Registro inicial de un job (todas las etapas pendientes)"""
+    now = time.time()
+    return {
+        "job_id": uuid.uuid4().hex,
+        "status": QUEUED,
+        "filename": filename,
+        "format": output_format,
+        "options": options or {},
+        "stage": None,
+        "progress": 0.0,
+        "stages": {name: {"status": "pending"} for name in stages},
+        "rows_in": None,
+        "rows_out": None,
+        "error": None,
+        # Proceso que lo encola y procesa: al reiniciar, sus jobs sin terminar se marcan fallidos
+        "owner": {"host": socket.gethostname(), "pid": os.getpid()},
+        "created_at": now,
+        "updated_at": now,
+    }
+
+
+class JobStore(ABC):
+    """Interfaz de persistencia de jobs: registro JSON, archivo de entrada y resultado"""
+
+    @abstractmethod
+    def create(self, job: Dict, input_file: BinaryIO) -> None:
+        """Guarda el registro inicial y copia el archivo de entrada"""
+
+    @abstractmethod
+    def get(self, job_id: str) -> Optional[Dict]:
+        """Registro del job (None si no existe)"""
+
+    @abstractmethod
+    def save(self, job: Dict) -> None:
+        """Reemplaza el registro del job"""
+
+    @abstractmethod
+    def open_input(self, job_id: str) -> BinaryIO:
+        """Archivo de entrada para leer"""
+
+    @abstractmethod
+    def write_result(self, job_id: str, chunks: Iterator[bytes]) -> int:
+        """Guarda el resultado (y descarta la entrada); devuelve los bytes escritos"""
+
+    @abstractmethod
+    def open_result(self, job_id: str) -> BinaryIO:
+        """Resultado para leer (FileNotFoundError si aún no existe)"""
+
+    @abstractmethod
+    def list_ids(self) -> List[str]:
+        """Ids de todos los jobs guardados"""
+
+    @abstractmethod
+    def delete(self, job_id: str) -> None:
+        """Elimina el job con su entrada y resultado"""
+
+
+class FileSystemJobStore(JobStore):
+    """Un directorio por job: job.json, input y result"""
+
+    def __init__(self, root: str = JOB_STORE_PATH):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def _dir(self, job_id: str) -> Path:
+        if not job_id.isalnum():
+            raise KeyError(job_id)
+        return self.root / job_id
+
+    def create(self, job: Dict, input_file: BinaryIO) -> None:
+        job_dir = self._dir(job["job_id"])
+        job_dir.mkdir()
+        with open(job_dir / "input", "wb") as f:
+            shutil.copyfileobj(input_file, f, 1 << 20)
+        self.save(job)
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        try:
+            with open(self._dir(job_id) / "job.json", encoding="utf-8") as f:
+                return json.load(f)
+        except (KeyError, FileNotFoundError):
+            return None
+
+    def save(self, job: Dict) -> None:
+        job_dir = self._dir(job["job_id"])
+        tmp_path = job_dir / f"job.json.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(job, f, ensure_ascii=False)
+        # Reemplazo atómico: los lectores nunca ven un JSON a medio escribir
+        os.replace(tmp_path, job_dir / "job.json")
+
+    def open_input(self, job_id: str) -> BinaryIO:
+        return open(self._dir(job_id) / "input", "rb")
+
+    def write_result(self, job_id: str, chunks: Iterator[bytes]) -> int:
+        job_dir = self._dir(job_id)
+        size = 0
+        with open(job_dir / "result.tmp", "wb") as f:
+            for chunk in chunks:
+                f.write(chunk)
+                size += len(chunk)
+        os.replace(job_dir / "result.tmp", job_dir / "result")
+        # La entrada ya no se necesita una vez generado el resultado
+        (job_dir / "input").unlink(missing_ok=True)
+        return size
+
+    def open_result(self, job_id: str) -> BinaryIO:
+        return open(self._dir(job_id) / "result", "rb")
+
+    def list_ids(self) -> List[str]:
+        return [p.name for p in self.root.iterdir() if p.is_dir()]
+
+    def delete(self, job_id: str) -> None:
+        shutil.rmtree(self._dir(job_id), ignore_errors=True)
+
+
+class SQLiteJobStore(JobStore):
+    """
+    Una tabla con el registro JSON de cada job; la entrada y el resultado se
+    guardan como archivos junto a la base (la tabla solo guarda sus rutas)
+
+    Los archivos se copian y escriben por bloques, igual que en
+    FileSystemJobStore: ni la subida ni el resultado pasan completos por memoria.
+    """
+
+    def __init__(self, path: str = JOB_STORE_PATH):
+        if not path.endswith(".db") and path != ":memory:":
+            Path(path).mkdir(parents=True, exist_ok=True)
+            path = str(Path(path) / "jobs.db")
+        self.path = path
+        if path == ":memory:":
+            import tempfile
+            self.payload_dir = Path(tempfile.mkdtemp(prefix="coomeva_jobs_"))
+        else:
+            self.payload_dir = Path(path).parent / "payloads"
+            self.payload_dir.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        import sqlite3  # solo con JOB_STORE=sqlite (menos imports en el arranque)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+            if "input" in columns:
+                # Esquema anterior con la entrada y el resultado como BLOB (jobs temporales)
+                logger.warning("⚠️  Tabla de jobs con payloads BLOB: se recrea con rutas a archivos")
+                self._conn.execute("DROP TABLE jobs")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs "
+                "(job_id TEXT PRIMARY KEY, record TEXT, input_path TEXT, result_path TEXT, result_size INTEGER)"
+            )
+
+    def _payload(self, job_id: str, name: str) -> Path:
+        if not job_id.isalnum():
+            raise KeyError(job_id)
+        return self.payload_dir / f"{job_id}.{name}"
+
+    def create(self, job: Dict, input_file: BinaryIO) -> None:
+        input_path = self._payload(job["job_id"], "input")
+        with open(input_path, "wb") as f:
+            shutil.copyfileobj(input_file, f, 1 << 20)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO jobs (job_id, record, input_path) VALUES (?, ?, ?)",
+                (job["job_id"], json.dumps(job, ensure_ascii=False), str(input_path))
+            )
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute("SELECT record FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save(self, job: Dict) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE jobs SET record = ? WHERE job_id = ?",
+                (json.dumps(job, ensure_ascii=False), job["job_id"])
+            )
+
+    def _open(self, job_id: str, column: str) -> BinaryIO:
+        with self._lock:
+            row = self._conn.execute(f"SELECT {column} FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        if row is None or row[0] is None:
+            raise FileNotFoundError(f"{column} de {job_id}")
+        return open(row[0], "rb")
+
+    def open_input(self, job_id: str) -> BinaryIO:
+        return self._open(job_id, "input_path")
+
+    def write_result(self, job_id: str, chunks: Iterator[bytes]) -> int:
+        result_path = self._payload(job_id, "result")
+        tmp_path = self._payload(job_id, "result.tmp")
+        size = 0
+        with open(tmp_path, "wb") as f:
+            for chunk in chunks:
+                f.write(chunk)
+                size += len(chunk)
+        os.replace(tmp_path, result_path)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE jobs SET result_path = ?, result_size = ?, input_path = NULL WHERE job_id = ?",
+                (str(result_path), size, job_id)
+            )
+        # La entrada ya no se necesita una vez generado el resultado
+        self._payload(job_id, "input").unlink(missing_ok=True)
+        return size
+
+    def open_result(self, job_id: str) -> BinaryIO:
+        return self._open(job_id, "result_path")
+
+    def list_ids(self) -> List[str]:
+        with self._lock:
+            return [row[0] for row in self._conn.execute("SELECT job_id FROM jobs")]
+
+    def delete(self, job_id: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM jobs WHERE job_id = ?", (job_id,))
+        for name in ("input", "result", "result.tmp"):
+            self._payload(job_id, name).unlink(missing_ok=True)
+
+
+def create_job_store(kind: str = JOB_STORE, path: str = JOB_STORE_PATH) -> JobStore:
+    """Crea el store configurado (JOB_STORE=filesystem|sqlite)"""
+    if kind == "filesystem":
+        return FileSystemJobStore(path)
+    if kind == "sqlite":
+        return SQLiteJobStore(path)
+    raise ValueError(f"JOB_STORE inválido: {kind} (use filesystem o sqlite)")
+
+
+class JobContext:
+    """Acceso del pipeline a su job: archivo de entrada, etapas y métricas"""
+
+    def __init__(self, manager: "JobManager", job: Dict):
+        self._manager = manager
+        self.job = job
+
+    @property
+    def job_id(self) -> str:
+        return self.job["job_id"]
+
+    def open_input(self) -> BinaryIO:
+        return self._manager.store.open_input(self.job_id)
+
+    @contextmanager
+    def stage(self, name: str):
+        """Marca una etapa como en curso y, al salir, como terminada con su duración"""
+        started = time.time()
+        self.update(stage=name, stages={name: {"status": "running", "started_at": started}})
+        yield
+        finished = time.time()
+        stages = list(self.job["stages"])
+        done = stages.index(name) + 1 if name in stages else 0
+        self.update(
+            progress=round(done / len(stages), 4),
+            stages={name: {
+                "status": "done", "started_at": started, "finished_at": finished,
+                "duration_s": round(finished - started, 4)
+            }}
+        )
+
+    def update(self, **fields):
+        self._manager.update(self.job, **fields)
+
+
+# Pipeline: (contexto) -> bloques de bytes del resultado
+JobPipeline = Callable[[JobContext], Iterator[bytes]]
+
+
+class JobManager:
+    """
+    Pool de workers que procesa los jobs guardados en un JobStore
+
+    Args:
+        store: Persistencia de jobs
+        max_workers: Jobs procesados en paralelo
+        retention_hours: Antigüedad a partir de la cual se eliminan jobs terminados
+    """
+
+    def __init__(self, store: JobStore, max_workers: int = JOB_WORKERS,
+                 retention_hours: float = JOB_RETENTION_HOURS):
+        self.store = store
+        self.retention_hours = retention_hours
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="cluster-job")
+        self._lock = threading.Lock()
+
+    def submit(self, filename: str, input_file: BinaryIO, output_format: str,
+               pipeline: JobPipeline, stages: Tuple[str, ...] = JOB_STAGES,
+               options: Optional[Dict] = None) -> Dict:
+        """Guarda la entrada, encola el job y devuelve su registro inicial"""
+        self.purge_expired()
+        job = new_job(filename, output_format, stages, options)
+        self.store.create(job, input_file)
+        self._executor.submit(self._run, job, pipeline)
+        logger.info(f"Job {job['job_id']} encolado: {filename} ({output_format})")
+        return job
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        return self.store.get(job_id)
+
+    def update(self, job: Dict, stages: Optional[Dict] = None, **fields):
+        with self._lock:
+            if stages:
+                for name, state in stages.items():
+                    job["stages"].setdefault(name, {}).update(state)
+            job.update(fields)
+            job["updated_at"] = time.time()
+            self.store.save(job)
+
+    def _run(self, job: Dict, pipeline: JobPipeline):
+        context = JobContext(self, job)
+        self.update(job, status=RUNNING)
+        started = time.time()
+        try:
+            self.store.write_result(job["job_id"], pipeline(context))
+        except Exception as e:
+            logger.error(f"Job {job['job_id']} falló en la etapa {job['stage']}: {e}", exc_info=True)
+            stages = {job["stage"]: {"status": "failed"}} if job["stage"] else None
+            self.update(job, stages=stages, status=FAILED, error=str(e))
+            return
+        self.update(job, status=SUCCEEDED, stage=None, progress=1.0)
+        logger.info(f"Job {job['job_id']} completado en {time.time() - started:.2f}s")
+
+    def fail_interrupted(self) -> int:
+        """
+        Marca como fallidos los jobs encolados o en curso cuyo proceso ya no existe
+
+        Solo se revisan los jobs de este host (el pid de otro host no se puede
+        comprobar); los de otros workers vivos del mismo host no se tocan.
+        """
+        host = socket.gethostname()
+        failed = 0
+        for job_id in self.store.list_ids():
+            job = self.store.get(job_id)
+            if not job or job["status"] not in (QUEUED, RUNNING):
+                continue
+            owner = job.get("owner") or {}
+            if owner.get("host", host) != host or _process_alive(owner.get("pid")):
+                continue
+            stages = {job["stage"]: {"status": "failed"}} if job["stage"] else None
+            self.update(job, stages=stages, status=FAILED,
+                        error="Job interrumpido: el proceso que lo ejecutaba se reinició")
+            failed += 1
+        if failed:
+            logger.warning(f"⚠️  {failed} jobs interrumpidos por un reinicio marcados como fallidos")
+        return failed
+
+    def purge_expired(self):
+        """Elimina jobs terminados más antiguos que la retención configurada"""
+        if self.retention_hours <= 0:
+            return
+        limit = time.time() - self.retention_hours * 3600
+        for job_id in self.store.list_ids():
+            job = self.store.get(job_id)
+            if job and job["status"] in (SUCCEEDED, FAILED) and job["updated_at"] < limit:
+                self.store.delete(job_id)
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait)
+
+
+def _process_alive(pid: Optional[int]) -> bool:
+    if not pid or pid == os.getpid():
+        # Este proceso recién crea su gestor: ningún job suyo puede estar en curso
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+# Instancia global del gestor de jobs
+_job_manager: Optional[JobManager] = None
+_job_manager_lock = threading.Lock()
+
+
+def get_job_manager() -> JobManager:
+    """
+    Obtiene la instancia global del gestor de jobs (patrón singleton)
+
+    Al crearla marca como fallidos los jobs que dejó sin terminar un proceso
+    anterior (reinicio o despliegue), para que no queden en curso para siempre.
+    """
+    global _job_manager
+    if _job_manager is None:
+        with _job_manager_lock:
+            if _job_manager is None:
+                manager = JobManager(create_job_store())
+                manager.fail_interrupted()
+                _job_manager = manager
+    return _job_manager
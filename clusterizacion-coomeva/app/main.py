@@ -1,15 +1,46 @@
 """
 FastAPI application for clustering predictions using UMAP + KMeans
 """
-from fastapi import FastAPI
+import logging
+import os
+import threading
+import time
+
+_imports_started = time.perf_counter()
+
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
 from mangum import Mangum
-from app.routes import clustering
+from app.admission import AdmissionRejected
+from app.jobs import JOBS_SUPPORTED, get_job_manager
+from app.routes import clustering, similarity
+from app import metrics, startup
+
+startup.record_timing("imports_s", time.perf_counter() - _imports_started)
+
+# Nivel de log de la aplicación (DEBUG activa las estadísticas de diagnóstico costosas)
+logging.getLogger("app").setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    uvicorn: calienta el modelo en segundo plano (/health responde 503 hasta terminar)
+    y marca como fallidos los jobs que un proceso anterior dejó sin terminar
+    """
+    startup.start_warm_up_thread()
+    if JOBS_SUPPORTED:
+        threading.Thread(target=get_job_manager, name="job-recovery", daemon=True).start()
+    yield
+
 
 app = FastAPI(
     title="Coomeva Clustering API",
     description="API para clusterizar usuarios usando UMAP + KMeans",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # CORS middleware
@@ -21,8 +52,35 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def server_timing(request: Request, call_next):
+    """Agrega el header Server-Timing con las etapas medidas y registra la request en /metrics"""
+    if not metrics.METRICS_ENABLED:
+        return await call_next(request)
+    
+    stages = metrics.begin_request()
+    started = time.perf_counter()
+    response = await call_next(request)
+    elapsed = time.perf_counter() - started
+    
+    response.headers["Server-Timing"] = metrics.server_timing(stages, elapsed)
+    # Ruta con parámetros sin resolver (/cluster/jobs/{job_id}) para acotar las etiquetas
+    route = request.scope.get("route")
+    path = getattr(route, "path", "unmatched")
+    metrics.observe_request(request.method, path, response.status_code, elapsed)
+    return response
+
+
+@app.exception_handler(AdmissionRejected)
+async def admission_rejected(request: Request, exc: AdmissionRejected):
+    """429/503/413 del control de admisión, con Retry-After para que el cliente reintente más tarde"""
+    headers = {"Retry-After": str(exc.retry_after)} if exc.retry_after is not None else None
+    return JSONResponse({"detail": exc.detail}, status_code=exc.status_code, headers=headers)
+
+
 # Include routers
 app.include_router(clustering.router, prefix="/api/v1", tags=["clustering"])
+app.include_router(similarity.router, prefix="/api/v1", tags=["similarity"])
 
 
 @app.get("/")
@@ -37,12 +95,19 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    """Detailed health check"""
-    return {
-        "status": "healthy",
-        "models_loaded": True
-    }
+    """Readiness: 200 si el servicio puede atender, 503 mientras calienta o si el warm-up falló"""
+    state = startup.readiness()
+    return JSONResponse(state, status_code=200 if state["ready"] else 503)
+
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """Histogramas por etapa y por ruta en formato Prometheus (por proceso)"""
+    return PlainTextResponse(metrics.render_metrics(), media_type="text/plain; version=0.0.4")
 
-# AWS Lambda handler
+
+# AWS Lambda handler (el warm-up corre en la fase de init, antes de la primera invocación)
 handler = Mangum(app, lifespan="off")
+
+if os.getenv("AWS_LAMBDA_FUNCTION_NAME") and startup.WARMUP_ON_STARTUP:
+    startup.warm_up()
@@ -0,0 +1,217 @@
+"""
+Instrumentación por etapa: header Server-Timing y métricas estilo Prometheus
+
+Cada etapa del pipeline (lectura, preprocesamiento, escalado, KNN, KMeans,
+formato, serialización) se mide con stage(). La duración y las filas se
+acumulan en histogramas globales que expone /metrics y, si hay una request en
+curso, en la lista que el middleware convierte en el header Server-Timing.
+Los histogramas son por proceso (cada worker de uvicorn tiene los suyos).
+"""
+import contextvars
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# Desactivar (false) elimina el header Server-Timing y deja /metrics vacío
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+
+# Límites de los buckets (segundos y filas)
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+ROWS_BUCKETS = (1, 10, 100, 1_000, 10_000, 100_000, 1_000_000)
+
+METRIC_PREFIX = "coomeva"
+
+
+def _format_bound(bound: float) -> str:
+    return str(int(bound)) if float(bound).is_integer() else f"{bound:g}"
+
+
+class StageRecord:
+    """Medición de una etapa: nombre, duración y filas procesadas (si aplica)"""
+
+    __slots__ = ("name", "seconds", "rows")
+
+    def __init__(self, name: str, rows: Optional[int] = None):
+        self.name = name
+        self.seconds = 0.0
+        self.rows = rows
+
+
+class Histogram:
+    """Histograma acumulado por conjunto de etiquetas (thread-safe)"""
+
+    def __init__(self, name: str, help_text: str, buckets: Sequence[float], label_names: Tuple[str, ...]):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        self.label_names = label_names
+        self._series: Dict[Tuple[str, ...], List] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * len(self.buckets), 0.0, 0]
+            counts = series[0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = [(labels, list(s[0]), s[1], s[2]) for labels, s in sorted(self._series.items())]
+        for labels, counts, total, count in snapshot:
+            base = ",".join(f'{k}="{v}"' for k, v in zip(self.label_names, labels))
+            sep = "," if base else ""
+            for bound, bucket_count in zip(self.buckets, counts):
+                lines.append(f'{self.name}_bucket{{{base}{sep}le="{_format_bound(bound)}"}} {bucket_count}')
+            lines.append(f'{self.name}_bucket{{{base}{sep}le="+Inf"}} {count}')
+            lines.append(f"{self.name}_sum{{{base}}} {total:.6f}")
+            lines.append(f"{self.name}_count{{{base}}} {count}")
+        return lines
+
+
+class Counter:
+    """Contador acumulado por conjunto de etiquetas (thread-safe)"""
+
+    def __init__(self, name: str, help_text: str, label_names: Tuple[str, ...]):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels: str, value: float = 1.0):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            snapshot = sorted(self._values.items())
+        for labels, value in snapshot:
+            base = ",".join(f'{k}="{v}"' for k, v in zip(self.label_names, labels))
+            lines.append(f"{self.name}{{{base}}} {value:g}")
+        return lines
+
+
+STAGE_SECONDS = Histogram(
+    f"{METRIC_PREFIX}_stage_duration_seconds", "Duración de cada etapa del pipeline",
+    DURATION_BUCKETS, ("stage",)
+)
+STAGE_ROWS = Histogram(
+    f"{METRIC_PREFIX}_stage_rows", "Filas procesadas por etapa", ROWS_BUCKETS, ("stage",)
+)
+REQUEST_SECONDS = Histogram(
+    f"{METRIC_PREFIX}_http_request_duration_seconds", "Duración de las requests hasta el inicio de la respuesta",
+    DURATION_BUCKETS, ("method", "path")
+)
+REQUESTS_TOTAL = Counter(
+    f"{METRIC_PREFIX}_http_requests_total", "Requests atendidas por ruta y código", ("method", "path", "status")
+)
+ADMISSION_REJECTED = Counter(
+    f"{METRIC_PREFIX}_admission_rejected_total", "Requests rechazadas por el control de admisión", ("reason",)
+)
+SCHEMA_REJECTED = Counter(
+    f"{METRIC_PREFIX}_schema_rejected_total", "Archivos rechazados por la validación de esquema, por chequeo",
+    ("check",)
+)
+
+# Etapas medidas durante la request en curso (None fuera de una request)
+_request_stages: contextvars.ContextVar[Optional[List[StageRecord]]] = contextvars.ContextVar(
+    "request_stages", default=None
+)
+
+
+@contextmanager
+def stage(name: str, rows: Optional[int] = None):
+    """
+    Mide una etapa; las filas se pueden pasar o asignar dentro del bloque (record.rows)
+
+    Solo se registran las etapas que terminan sin error.
+    """
+    record = StageRecord(name, rows)
+    started = time.perf_counter()
+    yield record
+    record.seconds = time.perf_counter() - started
+    _record(record)
+
+
+def record_stage(name: str, seconds: float, rows: Optional[int] = None):
+    """Registra una etapa medida por fuera de stage() (p. ej. sumada entre bloques)"""
+    record = StageRecord(name, rows)
+    record.seconds = seconds
+    _record(record)
+
+
+def _record(record: StageRecord):
+    if not METRICS_ENABLED:
+        return
+
+    STAGE_SECONDS.observe(record.seconds, record.name)
+    if record.rows is not None:
+        STAGE_ROWS.observe(record.rows, record.name)
+    stages = _request_stages.get()
+    if stages is not None:
+        stages.append(record)
+
+
+def begin_request() -> List[StageRecord]:
+    """Inicia la lista de etapas de la request actual (la llama el middleware)"""
+    stages: List[StageRecord] = []
+    _request_stages.set(stages)
+    return stages
+
+
+def observe_request(method: str, path: str, status: int, seconds: float):
+    if METRICS_ENABLED:
+        REQUEST_SECONDS.observe(seconds, method, path)
+        REQUESTS_TOTAL.inc(method, path, str(status))
+
+
+def observe_rejection(reason: str):
+    if METRICS_ENABLED:
+        ADMISSION_REJECTED.inc(reason)
+
+
+def observe_schema_rejection(checks: List[str]):
+    if METRICS_ENABLED:
+        for check in set(checks):
+            SCHEMA_REJECTED.inc(check)
+
+
+def server_timing(stages: List[StageRecord], total_seconds: Optional[float] = None) -> str:
+    """
+    Valor del header Server-Timing (duraciones en ms; las filas van en desc)
+
+    Las etapas repetidas (p. ej. un bloque por chunk) se suman en una sola entrada.
+    """
+    totals: Dict[str, List] = {}
+    for record in stages:
+        entry = totals.setdefault(record.name, [0.0, None])
+        entry[0] += record.seconds
+        if record.rows is not None:
+            entry[1] = (entry[1] or 0) + record.rows
+    parts = []
+    for name, (seconds, rows) in totals.items():
+        part = f"{name};dur={seconds * 1000:.1f}"
+        if rows is not None:
+            part += f';desc="{rows} rows"'
+        parts.append(part)
+    if total_seconds is not None:
+        parts.append(f"total;dur={total_seconds * 1000:.1f}")
+    return ", ".join(parts)
+
+
+def render_metrics() -> str:
+    """Texto de /metrics en el formato de exposición de Prometheus"""
+    lines: List[str] = []
+    for metric in (STAGE_SECONDS, STAGE_ROWS, REQUEST_SECONDS, REQUESTS_TOTAL, ADMISSION_REJECTED, SCHEMA_REJECTED):
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
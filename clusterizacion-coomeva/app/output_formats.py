@@ -0,0 +1,231 @@
+"""
+Formatos de salida del endpoint de clustering (CSV, NDJSON, Parquet, Arrow IPC)
+
+Cada formato se escribe directamente desde el DataFrame tipado por el plan de
+salida, bloque a bloque, sin pasar por un string intermedio. Parquet y Arrow
+conservan los tipos del esquema (bool, int64, float64, texto); pyarrow se
+importa solo al usar esos formatos.
+"""
+import io
+import logging
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional
+
+import pandas as pd
+
+from app.output_plan import OutputPlan, get_output_plan
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FORMAT = "csv"
+
+# Formato -> (media type de la respuesta, extensión del archivo)
+OUTPUT_FORMATS = {
+    "csv": ("application/octet-stream", "csv"),
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+    "arrow": ("application/vnd.apache.arrow.stream", "arrow"),
+}
+
+# Media types aceptados en el header Accept
+ACCEPT_MEDIA_TYPES = {
+    "text/csv": "csv",
+    "application/csv": "csv",
+    "application/x-ndjson": "ndjson",
+    "application/ndjson": "ndjson",
+    "application/jsonl": "ndjson",
+    "application/json-lines": "ndjson",
+    "application/vnd.apache.parquet": "parquet",
+    "application/x-parquet": "parquet",
+    "application/parquet": "parquet",
+    "application/vnd.apache.arrow.stream": "arrow",
+    "application/vnd.apache.arrow.file": "arrow",
+}
+
+
+def negotiate_format(format_param: Optional[str] = None, accept: Optional[str] = None) -> str:
+    """
+    Elige el formato de salida: parámetro format, luego header Accept, luego CSV
+
+    Raises:
+        ValueError: Si el parámetro format no es un formato soportado
+    """
+    if format_param:
+        name = format_param.strip().lower()
+        if name not in OUTPUT_FORMATS:
+            raise ValueError(
+                f"Formato de salida no soportado: {format_param}. "
+                f"Use uno de: {', '.join(OUTPUT_FORMATS)}"
+            )
+        return name
+
+    if accept:
+        candidates = []
+        for position, item in enumerate(accept.split(',')):
+            media_type, *params = [part.strip() for part in item.split(';')]
+            quality = 1.0
+            for param in params:
+                if param.startswith('q='):
+                    try:
+                        quality = float(param[2:])
+                    except ValueError:
+                        quality = 0.0
+            name = ACCEPT_MEDIA_TYPES.get(media_type.lower())
+            if name is not None and quality > 0:
+                candidates.append((-quality, position, name))
+        if candidates:
+            return min(candidates)[2]
+
+    return DEFAULT_FORMAT
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.ipc  # noqa: F401
+        import pyarrow.parquet  # noqa: F401
+    except ImportError as e:
+        raise ValueError("Los formatos parquet y arrow requieren pyarrow instalado") from e
+    return pyarrow
+
+
+class ResultWriter(ABC):
+    """
+    Serializa bloques de resultados en un formato
+
+    write() devuelve los bytes de cada bloque y close() los bytes finales, de modo
+    que el mismo writer sirve para la respuesta completa y para el streaming.
+    """
+
+    format_name = DEFAULT_FORMAT
+
+    def __init__(self):
+        self._buffer = io.BytesIO()
+
+    @property
+    def media_type(self) -> str:
+        return OUTPUT_FORMATS[self.format_name][0]
+
+    def _drain(self) -> bytes:
+        data = self._buffer.getvalue()
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        return data
+
+    @abstractmethod
+    def write(self, df_result: pd.DataFrame) -> bytes:
+        """Bytes de un bloque de resultados"""
+
+    def close(self) -> bytes:
+        return b""
+
+
+class CSVResultWriter(ResultWriter):
+    format_name = "csv"
+
+    def __init__(self):
+        super().__init__()
+        self._header = True
+
+    def write(self, df_result: pd.DataFrame) -> bytes:
+        df_result.to_csv(self._buffer, index=False, header=self._header, encoding='utf-8')
+        self._header = False
+        return self._drain()
+
+
+class NDJSONResultWriter(ResultWriter):
+    format_name = "ndjson"
+
+    def write(self, df_result: pd.DataFrame) -> bytes:
+        if len(df_result):
+            df_result.to_json(self._buffer, orient='records', lines=True, force_ascii=False)
+            if not self._buffer.getvalue().endswith(b"\n"):
+                self._buffer.write(b"\n")
+        return self._drain()
+
+
+class _ArrowResultWriter(ResultWriter):
+    """Base de Parquet / Arrow IPC: el esquema se fija con el primer bloque"""
+
+    def __init__(self, plan: Optional[OutputPlan] = None):
+        super().__init__()
+        self.pa = _import_pyarrow()
+        self.plan = plan or get_output_plan()
+        self.schema = None
+        self._writer = None
+
+    def _arrow_type(self, column: str):
+        pa = self.pa
+        kind = self.plan.kind_of(column)
+        if kind in ('onehot', 'bool'):
+            return pa.bool_()
+        if kind == 'int':
+            return pa.int64()
+        if kind == 'float':
+            return pa.float64()
+        if kind in ('date', 'str', 'text'):
+            return pa.string()
+        return None
+
+    def _column(self, series: pd.Series, arrow_type):
+        if arrow_type is not None and arrow_type == self.pa.string() and not pd.api.types.is_string_dtype(series):
+            series = series.where(series.isna(), series.astype(str))
+        return self.pa.array(series, type=arrow_type, from_pandas=True)
+
+    def _table(self, df_result: pd.DataFrame):
+        pa = self.pa
+        columns: List[str] = [str(c) for c in df_result.columns]
+        if self.schema is None:
+            arrays = [self._column(df_result.iloc[:, j], self._arrow_type(c)) for j, c in enumerate(columns)]
+            # Columnas fuera del esquema sin valores en el primer bloque: texto
+            arrays = [a.cast(pa.string()) if pa.types.is_null(a.type) else a for a in arrays]
+            self.schema = pa.schema([pa.field(c, a.type) for c, a in zip(columns, arrays)])
+            return pa.Table.from_arrays(arrays, schema=self.schema)
+        arrays = [
+            self._column(df_result.iloc[:, j], field.type) for j, field in enumerate(self.schema)
+        ]
+        return pa.Table.from_arrays(arrays, schema=self.schema)
+
+    @abstractmethod
+    def _open(self, schema):
+        """Writer de pyarrow sobre el buffer con el esquema del primer bloque"""
+
+    def write(self, df_result: pd.DataFrame) -> bytes:
+        table = self._table(df_result)
+        if self._writer is None:
+            self._writer = self._open(table.schema)
+        self._writer.write_table(table)
+        return self._drain()
+
+    def close(self) -> bytes:
+        if self._writer is not None:
+            self._writer.close()
+        return self._drain()
+
+
+class ParquetResultWriter(_ArrowResultWriter):
+    format_name = "parquet"
+
+    def _open(self, schema):
+        import pyarrow.parquet as pq
+        return pq.ParquetWriter(self._buffer, schema, compression='snappy')
+
+
+class ArrowStreamResultWriter(_ArrowResultWriter):
+    format_name = "arrow"
+
+    def _open(self, schema):
+        return self.pa.ipc.new_stream(self._buffer, schema)
+
+
+_WRITERS: Dict[str, type] = {
+    "csv": CSVResultWriter,
+    "ndjson": NDJSONResultWriter,
+    "parquet": ParquetResultWriter,
+    "arrow": ArrowStreamResultWriter,
+}
+
+
+def get_writer(format_name: str) -> ResultWriter:
+    """Crea un writer nuevo para el formato (uno por respuesta)"""
+    return _WRITERS[format_name]()
@@ -0,0 +1,215 @@
+"""
+Plan de salida compilado desde el esquema SQL de la tabla `datos`
+
+Para cada columna del resultado define una sola vez su nombre final
+(normalizado para Supabase) y su tipo destino, y aplica todas las
+conversiones en bloque en lugar de recalcular listas y prefijos por request.
+"""
+import logging
+import os
+import re
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from app.preprocessing import EXPECTED_COLUMNS, NUMERIC_DTYPES, ONEHOT_COLUMNS
+
+logger = logging.getLogger(__name__)
+
+DB_SCHEMA_PATH = os.getenv(
+    "DB_SCHEMA_PATH",
+    str(Path(__file__).resolve().parent.parent / "coomeva_cluster_db_schema.sql")
+)
+DB_TABLE = "datos"
+
+# Excepciones al tipo SQL que conserva el formato histórico del CSV:
+# - NUMERIC se exporta como entero (bigint), salvo los logaritmos
+# - estrato es TEXT en el esquema, pero la columna numérica (0 si Estrato vino
+#   como categoría y se codificó con one-hot) se exporta como entero
+NUMERIC_FLOAT_COLUMNS = {'log_ingresos', 'log_ingresos_deflactados'}
+TEXT_INT_COLUMNS = {'estrato'}
+TEXT_STR_COLUMNS = {'idunico', 'cluster'}
+
+# Reemplazos de la normalización de nombres (en orden)
+_NAME_REPLACEMENTS = [
+    (' ', '_'), ('/', '_'), ('-', '_'),
+    ('ó', 'o'), ('í', 'i'), ('á', 'a'), ('é', 'e'), ('ú', 'u'), ('ñ', 'n'),
+    ('___', '_'), ('__', '_'),
+]
+
+# Ajustes específicos para nombres que no coinciden exactamente
+_NAME_MAPPING = {
+    'otro.1': 'otro_1',
+    'nombre_ocupacion_ninguno___no_definido': 'nombre_ocupacion_ninguno_no_definido',
+    'nombre_ocupacion_pensionado___jubilado': 'nombre_ocupacion_pensionado_jubilado',
+}
+
+
+def normalize_column_name(name: str) -> str:
+    """Minúsculas, sin espacios, barras, guiones ni acentos (nombres de Supabase)"""
+    name = name.lower()
+    for old, new in _NAME_REPLACEMENTS:
+        name = name.replace(old, new)
+    return _NAME_MAPPING.get(name, name)
+
+
+def parse_table_schema(sql: str, table: str = DB_TABLE) -> Dict[str, str]:
+    """
+    Extrae columnas y tipos de un CREATE TABLE
+
+    Returns:
+        Diccionario ordenado columna -> tipo SQL (TEXT, BOOLEAN, INTEGER, ...)
+    """
+    match = re.search(rf"CREATE TABLE\s+(?:\w+\.)?{table}\s*\((.*?)\n\);", sql, re.S | re.I)
+    if match is None:
+        raise ValueError(f"No se encontró la tabla '{table}' en el esquema")
+    return {
+        name: sql_type.upper()
+        for name, sql_type in re.findall(r"^\s*(\w+)\s+([A-Za-z]+)", match.group(1), re.M)
+    }
+
+
+class OutputPlan:
+    """
+    Nombre final y conversión de cada columna del resultado
+
+    Tipos de conversión:
+        onehot: dummy -> bool (x != 0)
+        bool:   producto -> bool (entero != 0, NaN = False)
+        int:    entero (NaN = 0)
+        float:  float (NaN = 0)
+        date:   fecha -> 'YYYY-MM-DD'
+        str:    texto (astype(str))
+        text:   texto original, sin conversión
+        keep:   fuera del esquema, sin conversión
+    """
+
+    def __init__(self, schema: Dict[str, str], onehot_columns: List[str] = ONEHOT_COLUMNS):
+        self.schema = schema
+        self.onehot_columns = set(onehot_columns)
+        self._steps_cache: Dict[Tuple[str, ...], List[Tuple[str, str, str]]] = {}
+        self._target_kinds: Dict[str, str] = {}
+
+    @classmethod
+    def from_schema_file(cls, path: str = DB_SCHEMA_PATH, table: str = DB_TABLE) -> "OutputPlan":
+        with open(path, encoding='utf-8') as f:
+            return cls(parse_table_schema(f.read(), table))
+
+    def _kind(self, source: str, target: str) -> str:
+        if source in self.onehot_columns:
+            return 'onehot'
+        sql_type = self.schema.get(target)
+        if sql_type is None:
+            logger.warning(f"Columna '{target}' no está en el esquema: se exporta sin conversión")
+            return 'keep'
+        if sql_type == 'BOOLEAN':
+            return 'bool'
+        if sql_type == 'INTEGER':
+            return 'int'
+        if sql_type == 'NUMERIC':
+            return 'float' if target in NUMERIC_FLOAT_COLUMNS else 'int'
+        if sql_type == 'DATE':
+            return 'date'
+        if target in TEXT_INT_COLUMNS:
+            return 'int'
+        if target in TEXT_STR_COLUMNS:
+            return 'str'
+        if sql_type == 'TEXT':
+            return 'text'
+        return 'keep'
+
+    def steps(self, columns: List[str]) -> List[Tuple[str, str, str]]:
+        """(columna origen, nombre final, conversión) para un conjunto de columnas (cacheado)"""
+        key = tuple(columns)
+        steps = self._steps_cache.get(key)
+        if steps is None:
+            steps = []
+            for source in columns:
+                target = normalize_column_name(source)
+                steps.append((source, target, self._kind(source, target)))
+            self._steps_cache[key] = steps
+            self._target_kinds.update((target, kind) for _, target, kind in steps)
+        return steps
+
+    def kind_of(self, target: str) -> str:
+        """Conversión aplicada a una columna del resultado (por nombre final)"""
+        return self._target_kinds.get(target, 'keep')
+
+    @staticmethod
+    def _numeric_block(df: pd.DataFrame, columns: List[str]) -> np.ndarray:
+        block = df[columns]
+        # float64, bool y uint8 (modo compacto) se convierten directo con to_numpy
+        if not block.dtypes.isin(NUMERIC_DTYPES).all():
+            block = block.apply(pd.to_numeric, errors='coerce')
+        return block.to_numpy(dtype=np.float64)
+
+    @staticmethod
+    def _to_int(values: np.ndarray) -> np.ndarray:
+        values = np.where(np.isnan(values), 0.0, values)
+        if not np.isfinite(values).all():
+            raise ValueError("Cannot convert non-finite values (NA or inf) to integer")
+        return values.astype(np.int64)
+
+    def apply(self, df_completo: pd.DataFrame, labels: np.ndarray) -> pd.DataFrame:
+        """
+        Agrega la columna Cluster y aplica nombres y tipos finales
+
+        Args:
+            df_completo: DataFrame preprocesado con las filas válidas
+            labels: Cluster asignado a cada fila
+
+        Returns:
+            DataFrame listo para exportar (mismo orden de columnas + cluster)
+        """
+        df = df_completo.reset_index(drop=True)
+        steps = self.steps(list(df.columns) + ['Cluster'])
+
+        by_kind: Dict[str, List[Tuple[str, str]]] = {}
+        for source, target, kind in steps:
+            by_kind.setdefault(kind, []).append((source, target))
+
+        output: Dict[str, object] = {}
+        for kind in ('onehot', 'bool', 'int', 'float'):
+            pairs = by_kind.get(kind)
+            if not pairs:
+                continue
+            values = self._numeric_block(df, [source for source, _ in pairs])
+            if kind == 'onehot':
+                values = values != 0
+            elif kind == 'bool':
+                values = self._to_int(values) != 0
+            elif kind == 'int':
+                values = self._to_int(values)
+            else:
+                values = np.where(np.isnan(values), 0.0, values)
+            for j, (_, target) in enumerate(pairs):
+                output[target] = values[:, j]
+
+        for source, target in by_kind.get('date', []):
+            output[target] = pd.to_datetime(df[source]).dt.strftime('%Y-%m-%d')
+        for source, target in by_kind.get('str', []):
+            column = pd.Series(labels) if source == 'Cluster' else df[source]
+            output[target] = column.astype(str)
+        for kind in ('text', 'keep'):
+            for source, target in by_kind.get(kind, []):
+                column = df[source]
+                # Texto category del modo compacto: se exporta con el tipo de sus valores
+                if isinstance(column.dtype, pd.CategoricalDtype):
+                    column = column.astype(column.cat.categories.dtype)
+                output[target] = column
+
+        return pd.DataFrame({target: output[target] for _, target, _ in steps})
+
+
+_output_plan: Optional[OutputPlan] = None
+
+
+def get_output_plan() -> OutputPlan:
+    """Plan de salida compilado una sola vez por proceso desde DB_SCHEMA_PATH"""
+    global _output_plan
+    if _output_plan is None:
+        _output_plan = OutputPlan.from_schema_file()
+        _output_plan.steps(EXPECTED_COLUMNS + ['Cluster'])
+    return _output_plan
@@ -0,0 +1,129 @@
+"""
+Preprocesamiento y predicción en paralelo por bloques de filas
+
+El archivo se divide en shards de PARALLEL_SHARD_ROWS filas que se procesan
+en un pool de procesos. Cada worker carga los modelos una sola vez (en su
+initializer) y los resultados se unen en el orden original de las filas. El
+preprocesamiento, el scaler, el KNN y KMeans son independientes por fila, por
+lo que los clusters son idénticos a los del camino serial.
+"""
+import logging
+import os
+import threading
+from typing import List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Workers del pool (0 o 1 desactiva el modo paralelo), filas por shard y mínimo
+# de filas para usar el pool (los archivos pequeños no compensan el envío entre procesos)
+PARALLEL_WORKERS = int(os.getenv("PARALLEL_WORKERS", "0"))
+PARALLEL_SHARD_ROWS = int(os.getenv("PARALLEL_SHARD_ROWS", "10000"))
+PARALLEL_MIN_ROWS = int(os.getenv("PARALLEL_MIN_ROWS", "20000"))
+
+# Estado de cada proceso worker
+_worker_preprocessor = None
+
+
+def _init_worker():
+    """Carga preprocesador y la versión activa del modelo una sola vez por proceso"""
+    global _worker_preprocessor
+    from app.prediction import get_clustering_model
+    from app.preprocessing import DataPreprocessor
+
+    logging.getLogger().setLevel(logging.WARNING)
+    _worker_preprocessor = DataPreprocessor()
+    get_clustering_model()
+
+
+def _process_shard(df_shard: pd.DataFrame, version: Optional[str]) -> Tuple[np.ndarray, pd.DataFrame, pd.DataFrame]:
+    from app.prediction import get_clustering_model
+
+    # La misma versión que resolvió el proceso principal (cada worker la carga una vez)
+    df_processed, _ = _worker_preprocessor.process(df_shard)
+    return get_clustering_model(version).predict(df_processed, allow_empty=True)
+
+
+class ShardedPredictor:
+    """
+    Pool de procesos para preprocesar y predecir por shards
+
+    Args:
+        n_workers: Procesos del pool
+        shard_rows: Filas por shard
+    """
+
+    def __init__(self, n_workers: int = PARALLEL_WORKERS, shard_rows: int = PARALLEL_SHARD_ROWS):
+        self.n_workers = n_workers
+        self.shard_rows = shard_rows
+        # multiprocessing se importa solo si el modo paralelo está activo
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        
+        # spawn: los workers no heredan hilos ni locks del servidor
+        self._executor = ProcessPoolExecutor(
+            max_workers=n_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker
+        )
+
+    def shards(self, df: pd.DataFrame) -> List[pd.DataFrame]:
+        # Al menos un shard por worker para repartir la carga en archivos medianos
+        shard_rows = min(self.shard_rows, -(-len(df) // self.n_workers))
+        return [df.iloc[start:start + shard_rows] for start in range(0, len(df), max(shard_rows, 1))]
+
+    def predict(self, df: pd.DataFrame, version: Optional[str] = None) -> Tuple[np.ndarray, pd.DataFrame, pd.DataFrame]:
+        """
+        Preprocesa y predice un DataFrame crudo en paralelo
+
+        Args:
+            df: DataFrame crudo
+            version: Versión del modelo (None = la activa en cada worker)
+
+        Returns:
+            Tuple (labels, umap_df, df_completo) como ClusteringModel.predict,
+            en el orden original de las filas
+        """
+        shards = self.shards(df)
+        logger.info(f"Procesando {len(df)} filas en {len(shards)} shards con {self.n_workers} workers")
+        results = list(self._executor.map(_process_shard, shards, [version] * len(shards)))
+
+        labels = np.concatenate([r[0] for r in results])
+        if len(labels) == 0:
+            raise ValueError(
+                "No hay datos válidos después de eliminar valores faltantes.\n"
+                "Verifica que tus datos tengan valores en todas las columnas requeridas."
+            )
+        umap_df = pd.concat([r[1] for r in results])
+        df_completo = pd.concat([r[2] for r in results])
+        return labels, umap_df, df_completo
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait)
+
+
+# Instancia global del pool (se crea al primer uso)
+_sharded_predictor: Optional[ShardedPredictor] = None
+_sharded_predictor_lock = threading.Lock()
+
+
+def get_sharded_predictor(n_rows: int) -> Optional[ShardedPredictor]:
+    """
+    Devuelve el pool si el modo paralelo está activo y el archivo lo amerita
+
+    Args:
+        n_rows: Filas del archivo a procesar
+
+    Returns:
+        ShardedPredictor, o None para usar el camino serial
+    """
+    global _sharded_predictor
+    if PARALLEL_WORKERS <= 1 or n_rows < PARALLEL_MIN_ROWS:
+        return None
+    with _sharded_predictor_lock:
+        if _sharded_predictor is None:
+            logger.info(f"Inicializando pool de {PARALLEL_WORKERS} workers (shards de {PARALLEL_SHARD_ROWS} filas)")
+            _sharded_predictor = ShardedPredictor()
+    return _sharded_predictor
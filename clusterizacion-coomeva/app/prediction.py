@@ -2,38 +2,173 @@
 Módulo para cargar modelos y realizar predicciones
 VERSIÓN FINAL - Sin usar UMAP en absoluto
 """
+import hashlib
 import logging
-from typing import Tuple
+import os
+from typing import Optional, Tuple
 from pathlib import Path
 import numpy as np
 import pandas as pd
 import pickle
 
+from app.ann import IVF_FILES, IVFIndex
+from app.artifacts import MANIFEST_NAME, PICKLE_FILES, file_sha256, load_artifacts, share_artifacts
+from app.cache import PredictionCache
+from app.preprocessing import NUMERIC_DTYPES
+from app.runtime import ArrayRuntime, weighted_embeddings
+from app import metrics
+
 logger = logging.getLogger(__name__)
 
+# Formato de artefactos: "auto" (manifest.json si existe), "mmap" o "pickle"
+MODELS_FORMAT = os.getenv("MODELS_FORMAT", "auto")
+
+# Carpeta compartida por los workers (p. ej. /dev/shm/coomeva-models) donde los pickles se
+# exportan una vez al formato plano y se mapean de solo lectura (vacía = copia por proceso)
+MODELS_SHARED_PATH = os.getenv("MODELS_SHARED_PATH", "")
+
+# Parámetros de la aproximación UMAP (configurables por variables de entorno)
+UMAP_N_NEIGHBORS = int(os.getenv("UMAP_N_NEIGHBORS", "15"))
+UMAP_CHUNK_SIZE = int(os.getenv("UMAP_CHUNK_SIZE", "2048"))
+
+# Índice de vecinos: "exact" (índice del entrenamiento) o "ivf" (aproximado, ver app/ann.py)
+KNN_BACKEND = os.getenv("KNN_BACKEND", "exact")
+IVF_N_LISTS = int(os.getenv("IVF_N_LISTS", "0")) or None
+IVF_N_PROBE = int(os.getenv("IVF_N_PROBE", "8"))
+
+# Runtime de predicción: "numpy" (app/runtime.py, sin validaciones de sklearn) o "sklearn"
+# (transform/kneighbors/predict de los objetos cargados). Con KNN_BACKEND=ivf se usa "sklearn"
+INFERENCE_RUNTIME = os.getenv("INFERENCE_RUNTIME", "numpy")
+
 
 class ClusteringModel:
     """Clase para manejar la carga de modelos y predicciones"""
 
-    def __init__(self, models_path: str = "models"):
+    def __init__(
+        self,
+        models_path: str = "models",
+        n_neighbors: int = UMAP_N_NEIGHBORS,
+        chunk_size: int = UMAP_CHUNK_SIZE,
+        knn_backend: str = KNN_BACKEND,
+        models_format: str = MODELS_FORMAT,
+        inference_runtime: str = INFERENCE_RUNTIME,
+        version: Optional[str] = None,
+        shared_path: str = MODELS_SHARED_PATH
+    ):
         """
         Inicializa el modelo de clustering
 
         Args:
             models_path: Ruta a la carpeta de modelos
+            n_neighbors: Vecinos usados en la aproximación UMAP
+            chunk_size: Filas por bloque en la aproximación UMAP
+            knn_backend: "exact" o "ivf" (búsqueda aproximada de vecinos)
+            models_format: "auto", "mmap" o "pickle"
+            inference_runtime: "numpy" o "sklearn"
+            version: Nombre de la versión en el registro (app/registry.py)
+            shared_path: Carpeta compartida para los pickles con models_format="auto" (vacía = no compartir)
         """
         self.models_path = Path(models_path)
+        self.version = version
+        self.n_neighbors = n_neighbors
+        self.chunk_size = chunk_size
+        self.knn_backend = knn_backend
+        self.models_format = models_format
+        self.inference_runtime = inference_runtime
+        self.shared_path = shared_path
+        self.artifacts_path = None   # Carpeta de la que se mapearon los arrays (mmap)
         self.kmeans_model = None
         self.scaler = None
         
         # Datos UMAP pre-calculados (reemplazan al modelo UMAP)
         self.umap_embeddings = None  # Coordenadas UMAP del entrenamiento
-        self.knn_index = None        # Índice KNN para búsqueda rápida
+        self.knn_index = None        # Índice KNN usado en la predicción
+        self.exact_knn_index = None  # Índice KNN exacto del entrenamiento
         self.feature_names = None    # Nombres de features esperados
+        self.manifest = None         # Manifest del formato plano (si aplica)
+        self.fingerprint = None      # Huella de los artefactos cargados
+        self.runtime = None          # ArrayRuntime (INFERENCE_RUNTIME=numpy)
         
         self._load_models()
+        
+        # Caché de predicciones por fila (se invalida si cambian los artefactos o la aproximación)
+        self.cache = PredictionCache.from_env(self.cache_fingerprint(), version)
 
     def _load_models(self):
+        """Carga los modelos desde el formato plano (mmap) o desde archivos pickle"""
+        use_mmap = self.models_format == "mmap" or (
+            self.models_format == "auto" and (self.models_path / MANIFEST_NAME).exists()
+        )
+        if use_mmap:
+            self._load_mmap_artifacts(self.models_path)
+            self.fingerprint = file_sha256(self.models_path / MANIFEST_NAME)
+        elif self.shared_path and self.models_format == "auto":
+            # Misma huella que los pickles: la caché de predicciones sigue siendo válida
+            self.fingerprint = self._pickle_fingerprint()
+            self._load_mmap_artifacts(share_artifacts(self.models_path, self.shared_path, self.fingerprint))
+        else:
+            self._load_pickle_models()
+            self.fingerprint = self._pickle_fingerprint()
+        
+        self.exact_knn_index = self.knn_index
+        if self.knn_backend == "ivf":
+            self.knn_index = self._load_ivf_index()
+        elif self.knn_backend != "exact":
+            raise ValueError(f"KNN_BACKEND no soportado: {self.knn_backend} (use 'exact' o 'ivf')")
+        
+        if self.inference_runtime not in ("numpy", "sklearn"):
+            raise ValueError(
+                f"INFERENCE_RUNTIME no soportado: {self.inference_runtime} (use 'numpy' o 'sklearn')"
+            )
+        if self.inference_runtime == "numpy" and self.knn_backend == "exact":
+            self.runtime = ArrayRuntime.from_model(self)
+
+    def _load_ivf_index(self) -> IVFIndex:
+        """Carga el índice IVF guardado junto a los modelos o lo construye en memoria"""
+        fit_X = self.exact_knn_index._fit_X
+        if all((self.models_path / name).exists() for name in IVF_FILES):
+            index = IVFIndex.load(self.models_path, fit_X, n_probe=IVF_N_PROBE)
+        else:
+            index = IVFIndex.build(fit_X, n_lists=IVF_N_LISTS, n_probe=IVF_N_PROBE)
+        logger.info(f"  ✓ Índice IVF: {index.n_lists} celdas, n_probe={index.n_probe}")
+        return index
+
+    def cache_fingerprint(self) -> str:
+        """
+        Huella de la caché de predicciones: artefactos más los parámetros que cambian
+        el embedding (vecinos de la aproximación UMAP, KNN_BACKEND y el índice IVF)
+        """
+        settings = f"n_neighbors={self.n_neighbors};knn_backend={self.knn_backend}"
+        if self.knn_backend == "ivf":
+            settings += f";ivf_n_lists={self.knn_index.n_lists};ivf_n_probe={self.knn_index.n_probe}"
+        return hashlib.sha256(f"{self.fingerprint};{settings}".encode()).hexdigest()
+
+    def _pickle_fingerprint(self) -> str:
+        return hashlib.sha256(
+            "".join(file_sha256(self.models_path / name) for name in PICKLE_FILES).encode()
+        ).hexdigest()
+
+    def _load_mmap_artifacts(self, path: Path):
+        """Carga los arrays .npy del manifest con memory-mapping (sin copias)"""
+        logger.info(f"Cargando artefactos memory-mapped desde {path / MANIFEST_NAME}...")
+        artifacts = load_artifacts(path)
+        self.artifacts_path = path
+        
+        self.scaler = artifacts['scaler']
+        self.kmeans_model = artifacts['kmeans_model']
+        self.umap_embeddings = artifacts['umap_embeddings']
+        self.knn_index = artifacts['knn_index']
+        self.feature_names = artifacts['feature_names']
+        self.manifest = artifacts['manifest']
+        
+        logger.info(
+            f"  ✓ Artefactos v{self.manifest['format_version']}: "
+            f"{len(self.scaler.feature_names_in_)} features, "
+            f"{self.kmeans_model.n_clusters} clusters, "
+            f"{len(self.umap_embeddings)} muestras indexadas"
+        )
+
+    def _load_pickle_models(self):
         """Carga los modelos desde archivos pickle"""
         try:
             logger.info("="*60)
@@ -73,7 +208,7 @@ class ClusteringModel:
             self.feature_names = umap_data['feature_names']
             
             # Verificar y forzar dtypes correctos
-            logger.info(f"  Verificando dtypes...")
+            logger.info("  Verificando dtypes...")
             logger.info(f"    - umap_embeddings dtype: {self.umap_embeddings.dtype}")
             if hasattr(self.knn_index, '_fit_X'):
                 logger.info(f"    - knn_index._fit_X dtype: {self.knn_index._fit_X.dtype}")
@@ -108,72 +243,161 @@ class ClusteringModel:
             logger.error(f"❌ Error cargando modelos: {e}", exc_info=True)
             raise
     
-    def _approximate_umap(self, X_scaled: np.ndarray, n_neighbors: int = 15) -> np.ndarray:
+    def _approximate_umap(
+        self,
+        X_scaled: np.ndarray,
+        n_neighbors: Optional[int] = None,
+        chunk_size: Optional[int] = None,
+        knn_index=None
+    ) -> np.ndarray:
         """
         Aproxima coordenadas UMAP usando KNN sobre datos de entrenamiento
         
         IMPORTANTE: Este método NO usa umap.transform()
         En su lugar, usa interpolación ponderada basada en vecinos cercanos
         
+        Las muestras se procesan en bloques de tamaño fijo: la búsqueda KNN y
+        el promedio ponderado se hacen por bloque, de modo que la memoria
+        temporal depende de chunk_size × n_neighbors y no del tamaño del archivo.
+        
         Args:
             X_scaled: Datos escalados (shape: [n_samples, n_features])
-            n_neighbors: Número de vecinos para aproximación
+            n_neighbors: Número de vecinos para aproximación (default: self.n_neighbors)
+            chunk_size: Filas por bloque (default: self.chunk_size)
+            knn_index: Índice de vecinos a usar (default: self.knn_index)
             
         Returns:
             Coordenadas UMAP aproximadas (shape: [n_samples, 2])
         """
-        logger.info(f"Aproximando UMAP para {len(X_scaled)} muestras con k={n_neighbors}...")
-        
-        # ⭐ FIX: Asegurar que X_scaled es float64 (requiere copia para evitar warning)
-        if X_scaled.dtype != np.float64:
-            X_scaled = X_scaled.astype(np.float64)
-        else:
-            X_scaled = np.asarray(X_scaled, dtype=np.float64)
-        
-        logger.info(f"    Dtype de X_scaled: {X_scaled.dtype}, shape: {X_scaled.shape}")
+        n_neighbors = n_neighbors or self.n_neighbors
+        chunk_size = chunk_size or self.chunk_size
+        knn_index = knn_index or self.knn_index
         
         # Ajustar k si hay pocas muestras en entrenamiento
         n_neighbors = min(n_neighbors, len(self.umap_embeddings) - 1)
         
-        # ⭐ FIX: Asegurar que el array es contiguo en memoria
+        logger.debug(
+            f"Aproximando UMAP para {len(X_scaled)} muestras con k={n_neighbors} "
+            f"(bloques de {chunk_size} filas)..."
+        )
+        
+        # ⭐ FIX: Asegurar que el array es float64 y contiguo en memoria
         X_scaled = np.ascontiguousarray(X_scaled, dtype=np.float64)
         
-        # Encontrar vecinos más cercanos en espacio ORIGINAL (pre-UMAP)
-        distances, indices = self.knn_index.kneighbors(
-            X_scaled, 
-            n_neighbors=n_neighbors
-        )
+        X_umap = np.empty((len(X_scaled), self.umap_embeddings.shape[1]), dtype=np.float64)
         
-        # Inicializar array de resultados como float64
-        X_umap = np.zeros((len(X_scaled), 2), dtype=np.float64)
+        for start in range(0, len(X_scaled), chunk_size):
+            stop = min(start + chunk_size, len(X_scaled))
+            
+            # Encontrar vecinos más cercanos en espacio ORIGINAL (pre-UMAP)
+            distances, indices = knn_index.kneighbors(
+                X_scaled[start:stop],
+                n_neighbors=n_neighbors
+            )
+            X_umap[start:stop] = self._weighted_embeddings(distances, indices)
+        
+        # min/max recorren toda la matriz: solo con el nivel DEBUG activo
+        if len(X_umap) and logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"  ✓ UMAP aproximado - Rango: [{X_umap.min():.2f}, {X_umap.max():.2f}], dtype={X_umap.dtype}")
+        return X_umap
+    
+    def _weighted_embeddings(self, distances: np.ndarray, indices: np.ndarray) -> np.ndarray:
+        """Promedio ponderado por inverso de la distancia (ver runtime.weighted_embeddings)"""
+        return weighted_embeddings(distances, indices, self.umap_embeddings)
+    
+    def _predict_features(self, X: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Escala, aproxima UMAP y asigna clusters a una matriz de features
         
-        # Para cada muestra nueva
-        for i in range(len(X_scaled)):
-            # Calcular pesos inversamente proporcionales a distancia
-            # Puntos más cercanos tienen más influencia
-            weights = 1.0 / (distances[i] + 1e-10)  # +epsilon para evitar div/0
-            weights = weights / weights.sum()  # Normalizar a suma 1
+        Args:
+            X: Features en el orden de scaler.feature_names_in_ (sin NaN)
             
-            # Obtener embeddings UMAP de los vecinos
-            neighbor_embeddings = self.umap_embeddings[indices[i]]
+        Returns:
+            Tuple (X_umap, labels)
+        """
+        if self.runtime is not None:
+            # Escalado, KNN y KMeans por bloques en NumPy (etapas sumadas entre bloques)
+            X_umap, labels, seconds = self.runtime.predict(X)
+            for name, stage_seconds in seconds.items():
+                metrics.record_stage(name, stage_seconds, rows=len(labels))
+            return X_umap, labels
+        
+        if hasattr(self.scaler, 'feature_names_in_'):
+            X = pd.DataFrame(X, columns=self.scaler.feature_names_in_, copy=False)
+        
+        # 4.1 Escalar datos
+        logger.debug("  [4.1] Escalando datos...")
+        try:
+            with metrics.stage("scale", rows=len(X)):
+                X_scaled = self.scaler.transform(X)
+                
+                # ⭐ FIX: Asegurar dtype float64 y array contiguo (evita error de buffer)
+                if X_scaled.dtype != np.float64:
+                    logger.debug(f"    Convirtiendo de {X_scaled.dtype} a float64")
+                    X_scaled = X_scaled.astype(np.float64)
+                X_scaled = np.ascontiguousarray(X_scaled, dtype=np.float64)
             
-            # Asegurar que neighbor_embeddings sea float64
-            if neighbor_embeddings.dtype != np.float64:
-                neighbor_embeddings = neighbor_embeddings.astype(np.float64)
+            # Media y desviación recorren toda la matriz: solo con el nivel DEBUG activo
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"    ✓ Escalado: media={X_scaled.mean():.3f}, std={X_scaled.std():.3f}, dtype={X_scaled.dtype}")
+        except Exception as e:
+            logger.error(f"    ❌ Error en escalado: {e}", exc_info=True)
+            raise ValueError(f"Error al escalar datos: {e}")
+        
+        # 4.2 Aproximar UMAP (SIN usar umap.transform)
+        logger.debug("  [4.2] Aproximando embeddings UMAP con KNN...")
+        try:
+            with metrics.stage("knn", rows=len(X_scaled)):
+                X_umap = self._approximate_umap(X_scaled)
+                
+                # ⭐ FIX: Asegurar dtype float64 y array contiguo
+                X_umap = np.ascontiguousarray(X_umap, dtype=np.float64)
+            logger.debug(f"    ✓ UMAP aproximado - dtype: {X_umap.dtype}, shape: {X_umap.shape}")
+        except Exception as e:
+            logger.error(f"    ❌ Error en aproximación UMAP: {e}", exc_info=True)
+            raise ValueError(f"Error al aproximar UMAP: {e}")        
+        # 4.3 Predecir clusters
+        logger.debug("  [4.3] Prediciendo clusters con KMeans...")
+        try:
+            # Verificar dtype antes de predecir
+            logger.debug(f"    Dtype de X_umap antes de predict: {X_umap.dtype}")
+            with metrics.stage("kmeans", rows=len(X_umap)):
+                labels = self.kmeans_model.predict(X_umap)
+        except Exception as e:
+            logger.error(f"    ❌ Error en predicción KMeans: {e}", exc_info=True)
+            raise ValueError(f"Error al predecir clusters: {e}")
+        
+        return X_umap, labels
+    
+    def predict_features(self, X: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Embeddings y clusters de una matriz de features ya construida (usa la caché)
+        
+        Args:
+            X: Features en el orden de scaler.feature_names_in_ (float64, sin NaN)
             
-            # Calcular posición UMAP como promedio ponderado
-            X_umap[i] = np.sum(
-                neighbor_embeddings * weights[:, np.newaxis], 
-                axis=0,
-                dtype=np.float64  # Forzar dtype en la suma
-            )
+        Returns:
+            Tuple (X_umap, labels)
+        """
+        if self.cache is not None:
+            return self.cache.resolve(X, self._predict_features)
+        return self._predict_features(X)
+    
+    def warm_up(self) -> None:
+        """
+        Predicción de prueba (una fila con la media del scaler, sin caché)
         
-        # Asegurar que el resultado final sea float64
-        X_umap = X_umap.astype(np.float64)
-        logger.info(f"  ✓ UMAP aproximado - Rango: [{X_umap.min():.2f}, {X_umap.max():.2f}], dtype={X_umap.dtype}")
-        return X_umap
+        Recorre el escalado, el índice KNN y KMeans para que la primera request
+        no pague la inicialización perezosa (páginas mmap, imports de sklearn).
+        """
+        X = np.asarray(self.scaler.mean_, dtype=np.float64).reshape(1, -1)
+        self._predict_features(X)
     
-    def predict(self, df: pd.DataFrame) -> Tuple[np.ndarray, pd.DataFrame, pd.DataFrame]:
+    def predict(
+        self,
+        df: pd.DataFrame,
+        allow_empty: bool = False
+    ) -> Tuple[np.ndarray, pd.DataFrame, pd.DataFrame]:
         """
         Realiza predicción de clusters
         
@@ -185,6 +409,8 @@ class ClusteringModel:
         
         Args:
             df: DataFrame preprocesado completo (con todas las columnas)
+            allow_empty: Devolver resultados vacíos en lugar de error si no
+                         quedan filas válidas (p. ej. un bloque en streaming)
             
         Returns:
             Tuple con:
@@ -192,50 +418,48 @@ class ClusteringModel:
             - umap_df: DataFrame con coordenadas UMAP (UMAP_1, UMAP_2)
             - df_completo: DataFrame original con solo filas válidas
         """
-        logger.info("="*60)
-        logger.info(f"INICIANDO PREDICCIÓN - Input: {df.shape}")
-        logger.info("="*60)
-        
-        # Guardar DataFrame completo
-        df_completo = df.copy()
+        logger.debug("="*60)
+        logger.debug(f"INICIANDO PREDICCIÓN - Input: {df.shape}")
+        logger.debug("="*60)
         
-        # PASO 1: Seleccionar columnas numéricas
-        logger.info("[Paso 1/4] Seleccionando features numéricos...")
-        X = df.select_dtypes(include=["float64", "int64"])
+        # Guardar DataFrame completo (el filtrado con .loc más abajo crea el nuevo objeto)
+        df_completo = df
         
-        # Debug: verificar dtypes del DataFrame de entrada
-        dtypes_count = df.dtypes.value_counts()
-        logger.info(f"  Tipos de datos en df original: {dict(dtypes_count)}")
-        logger.info(f"  ✓ {len(X.columns)} columnas numéricas detectadas")
-        logger.info(f"  Tipos de datos en X: {dict(X.dtypes.value_counts())}")
+        # PASO 1: Seleccionar columnas numéricas (float64 / int64, o bool / uint8 en modo compacto)
+        logger.debug("[Paso 1/4] Seleccionando features numéricos...")
+        numeric_columns = [col for col, dtype in df.dtypes.items() if dtype in NUMERIC_DTYPES]
+        logger.debug(f"  ✓ {len(numeric_columns)} columnas numéricas detectadas")
         
         # PASO 2: Validar features esperados
-        logger.info("[Paso 2/4] Validando features...")
+        logger.debug("[Paso 2/4] Validando features...")
         if hasattr(self.scaler, 'feature_names_in_'):
             expected_features = list(self.scaler.feature_names_in_)
             
             # Verificar columnas faltantes
-            missing_features = set(expected_features) - set(X.columns)
+            missing_features = set(expected_features) - set(numeric_columns)
             if missing_features:
                 logger.error(f"❌ Faltan {len(missing_features)} columnas")
                 raise ValueError(
                     f"Faltan columnas esperadas por el modelo:\n"
                     f"  Faltantes: {sorted(missing_features)}\n"
-                    f"  Disponibles: {sorted(X.columns)}\n\n"
+                    f"  Disponibles: {sorted(numeric_columns)}\n\n"
                     f"El modelo fue entrenado con {len(expected_features)} features."
                 )
             
-            # Seleccionar y ordenar columnas en el orden correcto
-            X = X[expected_features]
-            logger.info(f"  ✓ Features validados: {len(expected_features)} columnas en orden correcto")
+            # Seleccionar y ordenar columnas en el orden correcto (solo estas se copian)
+            X = df[expected_features]
+            logger.debug(f"  ✓ Features validados: {len(expected_features)} columnas en orden correcto")
             
-            # Convertir TODAS las columnas a float64 explícitamente
-            logger.info("  Convirtiendo todas las columnas a float64...")
-            X = X.astype(np.float64)
-            logger.info(f"  Tipos de datos después de conversión: {dict(X.dtypes.value_counts())}")
+            # La matriz float64 de DataPreprocessor se usa tal cual; la compacta se
+            # convierte aquí (solo las features del modelo)
+            if not (X.dtypes == np.float64).all():
+                logger.debug("  Convirtiendo columnas a float64...")
+                X = X.astype(np.float64)
+        else:
+            X = df[numeric_columns]
         
         # PASO 3: Limpiar datos (eliminar NaN)
-        logger.info("[Paso 3/4] Limpiando datos...")
+        logger.debug("[Paso 3/4] Limpiando datos...")
         indices_validos = X.dropna().index
         n_dropped = len(X) - len(indices_validos)
         
@@ -245,7 +469,15 @@ class ClusteringModel:
         if n_dropped > 0:
             logger.warning(f"  ⚠️  {n_dropped} filas eliminadas por valores nulos")
         else:
-            logger.info(f"  ✓ Sin valores nulos")
+            logger.debug("  ✓ Sin valores nulos")
+        
+        if X.empty and allow_empty:
+            logger.warning("  ⚠️  Sin filas válidas en este bloque")
+            return (
+                np.empty(0, dtype=np.int32),
+                pd.DataFrame(columns=['UMAP_1', 'UMAP_2'], index=X.index, dtype=np.float64),
+                df_completo
+            )
         
         if X.empty:
             logger.error("❌ No hay datos válidos")
@@ -254,53 +486,24 @@ class ClusteringModel:
                 "Verifica que tus datos tengan valores en todas las columnas requeridas."
             )
         
-        logger.info(f"  ✓ Datos limpios: {len(X)} muestras × {X.shape[1]} features")
+        logger.debug(f"  ✓ Datos limpios: {len(X)} muestras × {X.shape[1]} features")
         
         # PASO 4: Pipeline de predicción
-        logger.info("[Paso 4/4] Ejecutando pipeline de predicción...")
-        
-        # 4.1 Escalar datos
-        logger.info("  [4.1] Escalando datos...")
-        try:
-            X_scaled = self.scaler.transform(X)
-            
-            # ⭐ FIX: Asegurar dtype float64 y array contiguo (evita error de buffer)
-            if X_scaled.dtype != np.float64:
-                logger.info(f"    Convirtiendo de {X_scaled.dtype} a float64")
-                X_scaled = X_scaled.astype(np.float64)
-            X_scaled = np.ascontiguousarray(X_scaled, dtype=np.float64)
-            
-            logger.info(f"    ✓ Escalado: media={X_scaled.mean():.3f}, std={X_scaled.std():.3f}, dtype={X_scaled.dtype}")
-        except Exception as e:
-            logger.error(f"    ❌ Error en escalado: {e}", exc_info=True)
-            raise ValueError(f"Error al escalar datos: {e}")
+        logger.debug("[Paso 4/4] Ejecutando pipeline de predicción...")
         
-        # 4.2 Aproximar UMAP (SIN usar umap.transform)
-        logger.info("  [4.2] Aproximando embeddings UMAP con KNN...")
-        try:
-            X_umap = self._approximate_umap(X_scaled, n_neighbors=15)
-            
-            # ⭐ FIX: Asegurar dtype float64 y array contiguo
-            X_umap = np.ascontiguousarray(X_umap, dtype=np.float64)
-            logger.info(f"    ✓ UMAP aproximado - dtype: {X_umap.dtype}, shape: {X_umap.shape}")
-        except Exception as e:
-            logger.error(f"    ❌ Error en aproximación UMAP: {e}", exc_info=True)
-            raise ValueError(f"Error al aproximar UMAP: {e}")        
-        # 4.3 Predecir clusters
-        logger.info("  [4.3] Prediciendo clusters con KMeans...")
-        try:
-            # Verificar dtype antes de predecir
-            logger.info(f"    Dtype de X_umap antes de predict: {X_umap.dtype}")
-            labels = self.kmeans_model.predict(X_umap)
-        except Exception as e:
-            logger.error(f"    ❌ Error en predicción KMeans: {e}", exc_info=True)
-            raise ValueError(f"Error al predecir clusters: {e}")
+        if self.cache is not None:
+            logger.debug("  [4.0] Consultando caché de predicciones...")
+        X_umap, labels = self.predict_features(X.to_numpy())
+        if self.cache is not None:
+            stats = self.cache.stats()
+            logger.debug(f"    ✓ Caché: {stats['hits']} aciertos, {stats['misses']} fallos acumulados")
         
-        cluster_counts = np.bincount(labels)
-        logger.info(f"    ✓ Distribución de clusters:")
-        for cluster_id, count in enumerate(cluster_counts):
-            pct = count / len(labels) * 100
-            logger.info(f"      Cluster {cluster_id}: {count:4d} ({pct:5.1f}%)")
+        if logger.isEnabledFor(logging.DEBUG):
+            cluster_counts = np.bincount(labels)
+            logger.debug("    ✓ Distribución de clusters:")
+            for cluster_id, count in enumerate(cluster_counts):
+                pct = count / len(labels) * 100
+                logger.debug(f"      Cluster {cluster_id}: {count:4d} ({pct:5.1f}%)")
         
         # Crear DataFrame con coordenadas UMAP
         umap_df = pd.DataFrame(
@@ -309,31 +512,33 @@ class ClusteringModel:
             index=X.index
         )
         
-        logger.info("="*60)
-        logger.info("PREDICCIÓN COMPLETADA EXITOSAMENTE")
-        logger.info("="*60)
+        logger.info(f"Predicción completada: {len(labels)} filas ({n_dropped} descartadas por valores nulos)")
         
         return labels, umap_df, df_completo
 
 
-# Instancia global del modelo (singleton)
-_clustering_model = None
+def clustering_model_loaded() -> bool:
+    """Indica si la versión activa del modelo ya fue cargada (sin cargarla)"""
+    from app.registry import get_model_registry
+    return get_model_registry().loaded()
 
 
-def get_clustering_model() -> ClusteringModel:
+def get_clustering_model(version: Optional[str] = None) -> ClusteringModel:
     """
-    Obtiene la instancia del modelo de clustering (singleton)
+    Obtiene el modelo de clustering activo o una versión fija del registro
     
-    Este patrón asegura que los modelos se cargan solo una vez
-    y se reutilizan en múltiples invocaciones de Lambda
+    Los modelos se cargan una sola vez por proceso y se reutilizan en
+    múltiples invocaciones de Lambda; la versión activa puede cambiar en
+    caliente (ver app/registry.py)
     
+    Args:
+        version: Versión fija (None = la activa)
+        
     Returns:
         Instancia de ClusteringModel
+        
+    Raises:
+        KeyError: Si la versión pedida no existe
     """
-    global _clustering_model
-    if _clustering_model is None:
-        logger.info("Inicializando modelo de clustering (primera vez)...")
-        _clustering_model = ClusteringModel()
-    else:
-        logger.info("Reutilizando modelo de clustering existente")
-    return _clustering_model
\ No newline at end of file
+    from app.registry import get_model_registry
+    return get_model_registry().get(version)
@@ -1,11 +1,22 @@
 """
 Módulo de preprocesamiento de datos para clusterización
 """
+import logging
+import os
 import pandas as pd
 import numpy as np
-from datetime import datetime
-from typing import Tuple
+from collections import defaultdict
+from typing import Callable, Dict, List, Tuple
 
+logger = logging.getLogger(__name__)
+
+# Representación compacta (false = matriz float64 y texto sin convertir, como antes):
+# dummies bool, indicadores uint8 y columnas de texto category. El modelo recibe
+# float64 igual, convertido al seleccionar sus features
+PREPROCESS_COMPACT = os.getenv("PREPROCESS_COMPACT", "false").lower() in ("1", "true", "yes")
+
+# Tipos de las columnas numéricas del resultado en cualquiera de los dos modos
+NUMERIC_DTYPES = (np.dtype(np.float64), np.dtype(np.int64), np.dtype(np.uint8), np.dtype(np.bool_))
 
 # Lista de columnas esperadas en el output final (175 columnas + Cluster = 176 total)
 EXPECTED_COLUMNS = [
@@ -51,10 +62,181 @@ EXPECTED_COLUMNS = [
 ]
 
 
+class FeatureMatrixEncoder:
+    """
+    Constructor de la matriz de features compilado a partir de EXPECTED_COLUMNS
+    
+    Reemplaza la secuencia get_dummies -> concat -> eliminar duplicados -> reindex ->
+    to_numeric por columna: cada columna de salida sabe de antemano de qué fuente
+    sale (columna numérica, valor de una categórica, Region o Area_Titulo) y se
+    escribe directamente en una única matriz float64 preasignada.
+    
+    La precedencia replica la del concat original (se conserva la primera
+    ocurrencia): columnas numéricas, dummies de categóricas (en orden de columna),
+    dummies de Region y dummies de Area_Titulo. Una fuente solo "ocupa" una
+    columna si get_dummies la habría generado (nivel observado o categoría declarada).
+    """
+    
+    # Columnas que se eliminaban antes del concat (además de las categóricas)
+    SPECIAL_COLUMNS = ('Nombre_Titulo_Obtenido', 'Zona', 'Area_Titulo', 'Region')
+    
+    def __init__(self, columns: List[str]):
+        self.columns = list(columns)
+        self.slots = {col: i for i, col in enumerate(self.columns)}
+        
+        # prefijo -> [(slot, valor)] para cada forma de partir "<columna>_<valor>"
+        self.onehot_candidates: Dict[str, List[Tuple[int, str]]] = defaultdict(list)
+        for i, col in enumerate(self.columns):
+            for pos, char in enumerate(col):
+                if char == '_':
+                    self.onehot_candidates[col[:pos]].append((i, col[pos + 1:]))
+    
+    @staticmethod
+    def _levels(series: pd.Series) -> Tuple[np.ndarray, Dict[str, int]]:
+        """Códigos por fila y posición de cada nivel (por su nombre como texto)"""
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            codes, levels = series.cat.codes.to_numpy(), series.cat.categories
+        else:
+            codes, levels = pd.factorize(series)
+        positions: Dict[str, int] = {}
+        for j, level in enumerate(levels):
+            positions.setdefault(str(level), j)
+        return codes, positions
+    
+    @staticmethod
+    def _compact(values: np.ndarray) -> np.ndarray:
+        """Tipo más chico sin pérdida: bool (dummies), uint8 (enteros 0-255 sin nulos) o float64"""
+        if values.dtype == np.bool_:
+            return values
+        # NaN no cumple el rango: las columnas con nulos quedan en float64
+        if ((values >= 0) & (values <= 255)).all():
+            as_uint8 = values.astype(np.uint8)
+            if np.array_equal(as_uint8, values):
+                return as_uint8
+        return values
+    
+    def encode(self, df: pd.DataFrame, cat_cols: List[str], df_texto: pd.DataFrame,
+               compact: bool = False) -> pd.DataFrame:
+        """
+        Construye el DataFrame final con las columnas de EXPECTED_COLUMNS
+        
+        Args:
+            df: DataFrame con columnas numéricas, categóricas, Region y Area_Titulo
+            cat_cols: Columnas categóricas a codificar con one-hot
+            df_texto: Columnas de texto originales que se conservan tal cual
+            compact: Cada columna numérica con su tipo más chico sin pérdida
+                     (bool, uint8 o float64) en lugar de la matriz float64
+            
+        Returns:
+            DataFrame con columnas numéricas float64 (un solo bloque contiguo) o
+            compactas, y las columnas de texto en su posición
+        """
+        numeric_slots = [i for i, col in enumerate(self.columns) if col not in df_texto.columns]
+        row_of = {slot: k for k, slot in enumerate(numeric_slots)}
+        claimed = set()
+        
+        if compact:
+            values: Dict[int, np.ndarray] = {}
+            
+            def store(slot: int, column: np.ndarray):
+                values[slot] = self._compact(column)
+        else:
+            # (columnas, filas) en orden C: pandas lo usa como bloque sin copiar
+            matrix = np.zeros((len(numeric_slots), len(df)), dtype=np.float64)
+            
+            def store(slot: int, column: np.ndarray):
+                matrix[row_of[slot]] = column
+        
+        def claim(slot: int) -> bool:
+            if slot in claimed:
+                return False
+            claimed.add(slot)
+            return slot in row_of
+        
+        # 1. Columnas numéricas (todo lo que no es categórico ni especial)
+        excluded = set(cat_cols).union(self.SPECIAL_COLUMNS)
+        for col in df.columns:
+            slot = self.slots.get(col)
+            if slot is None or col in excluded:
+                continue
+            if claim(slot):
+                store(slot, pd.to_numeric(df[col], errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan))
+        
+        # 2. One-hot de categóricas ("<columna>_<valor>")
+        for col in cat_cols:
+            candidates = self.onehot_candidates.get(col)
+            if not candidates:
+                continue
+            codes, positions = self._levels(df[col])
+            for slot, value in candidates:
+                j = positions.get(value)
+                if j is not None and claim(slot):
+                    store(slot, codes == j)
+        
+        # 3. One-hot de Region y Area_Titulo (el nombre de la columna es el valor)
+        for col in ('Region', 'Area_Titulo'):
+            if col not in df_texto.columns:
+                continue
+            codes, positions = self._levels(df[col])
+            for value, j in positions.items():
+                slot = self.slots.get(value)
+                if slot is not None and claim(slot):
+                    store(slot, codes == j)
+        
+        numeric_columns = [self.columns[i] for i in numeric_slots]
+        if compact:
+            # Columnas no presentes en el archivo: ceros (False)
+            result = pd.DataFrame(
+                {col: values[slot] if slot in values else np.zeros(len(df), dtype=np.bool_)
+                 for col, slot in zip(numeric_columns, numeric_slots)},
+                index=df.index
+            )
+        else:
+            result = pd.DataFrame(matrix.T, columns=numeric_columns, index=df.index, copy=False)
+        
+        # Columnas de texto con sus valores originales, en su posición de EXPECTED_COLUMNS
+        for i, col in enumerate(self.columns):
+            if col in df_texto.columns:
+                result.insert(i, col, df_texto[col])
+        
+        return result
+
+
+FEATURE_ENCODER = FeatureMatrixEncoder(EXPECTED_COLUMNS)
+
+# Columnas one-hot (dummies de las categóricas, Region y Area_Titulo): el bloque final
+# de EXPECTED_COLUMNS. Se exportan como booleanas
+ONEHOT_COLUMNS = EXPECTED_COLUMNS[EXPECTED_COLUMNS.index("Nombre_Estado_Activo Normal"):]
+
+
+# Columnas crudas que se codifican con one-hot. Al leer por bloques se fuerzan a texto
+# para que la inferencia de tipos no cambie entre bloques (p. ej. un bloque sin
+# "No Cruza" haría numérica a Estrato y perdería sus dummies)
+CATEGORICAL_INPUT_COLUMNS = [
+    "Nombre_Estado", "Nombre_Tipo_Vinculacion", "Estado_Civil", "Sexo", "Estrato",
+    "Nombre_Tipo_Vivienda", "Nombre_Nivel_Academico", "Nombre_Titulo_Obtenido",
+    "Nombre_Ocupacion", "Zona"
+]
+
+# Columnas de texto que se exportan con su valor original (además de Area_Titulo y Region)
+TEXT_COLUMNS = ['IdUnico', 'Fecha_Ingreso', 'Nombre_Estado', 'Nombre_Tipo_Vinculacion',
+                'Estado_Civil', 'Sexo', 'Nombre_Tipo_Vivienda', 'Nombre_Nivel_Academico',
+                'Fecha_Nacimiento', 'Nombre_Titulo_Obtenido', 'Nombre_Ocupacion', 'Zona']
+
+# Columnas sin las cuales la fila se descarta
+CRITICAL_COLUMNS = ['Saldo_aportes', 'Cuotas_canceladas_aportes', 'Cuotas_mora_aportes', 'Vlr_mora', 'Ingresos']
+
+# Resultados de agrupar_titulo / mapear_region por valor distinto, compartidos entre
+# requests (los títulos y zonas distintos son pocos frente al número de filas)
+_TITULO_CACHE: Dict[str, str] = {}
+_REGION_CACHE: Dict[str, str] = {}
+_DISTINCT_CACHE_MAX = 50_000
+
+
 class DataPreprocessor:
     """Clase para manejar todo el preprocesamiento de datos"""
     
-    def __init__(self, fecha_referencia: str = None):
+    def __init__(self, fecha_referencia: str = None, compact: bool = None):
         """
         Inicializa el preprocesador con las columnas a eliminar
         
@@ -62,7 +244,10 @@ class DataPreprocessor:
             fecha_referencia: Fecha de referencia para calcular Antiguedad_dias y Edad.
                             Formato: 'YYYY-MM-DD'. Si es None, usa la fecha actual.
                             IMPORTANTE: Debe coincidir con la fecha usada al entrenar los modelos.
+            compact: Tipos compactos en el resultado (None = PREPROCESS_COMPACT)
         """
+        self.compact = PREPROCESS_COMPACT if compact is None else compact
+        
         # Fecha de referencia para cálculos de antigüedad y edad
         if fecha_referencia:
             self.fecha_referencia = pd.Timestamp(fecha_referencia)
@@ -180,6 +365,38 @@ class DataPreprocessor:
         zona = zona.strip().title()
         return self.region_map.get(zona, "Otro")
     
+    @staticmethod
+    def _map_distinct(series: pd.Series, func: Callable[[str], str], cache: Dict[str, str]) -> pd.Series:
+        """
+        Aplica func una sola vez por valor distinto y lo propaga con los códigos categóricos
+        
+        Equivale a series.apply(func) (incluido el tratamiento de NaN), pero el costo
+        en Python depende del número de valores distintos y no del número de filas.
+        """
+        codes, uniques = pd.factorize(series)
+        if len(cache) > _DISTINCT_CACHE_MAX:
+            cache.clear()
+        
+        mapped = np.empty(len(uniques) + 1, dtype=object)
+        for j, value in enumerate(uniques):
+            result = cache.get(value)
+            if result is None:
+                result = cache[value] = func(value)
+            mapped[j] = result
+        
+        # Código -1 = NaN: se evalúa func igual que lo haría apply
+        if (codes == -1).any():
+            mapped[-1] = func(np.nan)
+        
+        return pd.Series(mapped[codes], index=series.index, name=series.name)
+    
+    def _calcular_edad(self, fechas: pd.Series) -> pd.Series:
+        """Edad cumplida a fecha_referencia, calculada con aritmética vectorizada de año/mes/día"""
+        ref = self.fecha_referencia
+        mes, dia = fechas.dt.month, fechas.dt.day
+        no_ha_cumplido = (ref.month < mes) | ((ref.month == mes) & (ref.day < dia))
+        return (ref.year - fechas.dt.year - no_ha_cumplido.astype(np.float64)).astype(np.float64)
+    
     def process(self, df: pd.DataFrame) -> Tuple[pd.DataFrame, pd.Series]:
         """
         Procesa el DataFrame completo EXACTAMENTE como el notebook
@@ -191,11 +408,7 @@ class DataPreprocessor:
             Tuple con (DataFrame procesado con TODAS las columnas, Series con IdUnico)
         """
         # Guardar IdUnico y otras columnas de texto ANTES de cualquier procesamiento
-        columnas_texto_guardar = ['IdUnico', 'Fecha_Ingreso', 'Nombre_Estado', 'Nombre_Tipo_Vinculacion', 
-                                  'Estado_Civil', 'Sexo', 'Nombre_Tipo_Vivienda', 'Nombre_Nivel_Academico',
-                                  'Fecha_Nacimiento', 'Nombre_Titulo_Obtenido', 'Nombre_Ocupacion', 'Zona']
-        
-        df_texto_original = df[[col for col in columnas_texto_guardar if col in df.columns]].copy()
+        df_texto_original = df[[col for col in TEXT_COLUMNS if col in df.columns]].copy()
         id_unico = df['IdUnico'].copy() if 'IdUnico' in df.columns else None
         
         # 1. Eliminar columnas redundantes iniciales (las que NO tienen prefijo "Nombre_")
@@ -205,10 +418,7 @@ class DataPreprocessor:
         df = df.drop(columns=['Egresos'], errors='ignore')
         
         # 3. Eliminar filas con valores nulos en columnas críticas
-        indices_validos = df.dropna(subset=[
-            'Saldo_aportes', 'Cuotas_canceladas_aportes', 'Cuotas_mora_aportes', 
-            'Vlr_mora', 'Ingresos'
-        ], how='any').index
+        indices_validos = df.dropna(subset=CRITICAL_COLUMNS, how='any').index
         
         df = df.loc[indices_validos]
         
@@ -222,18 +432,22 @@ class DataPreprocessor:
         # 4. Crear variables logarítmicas ANTES de eliminar columnas
         # IMPORTANTE: Solo calcular si NO existen ya en el DataFrame de entrada
         # (el notebook original puede ya tener estos valores con una transformación específica)
+        # Los valores de muestra solo se extraen con el nivel DEBUG activo
+        debug = logger.isEnabledFor(logging.DEBUG)
         if 'log_ingresos' in df.columns:
-            print(f"⚠️ log_ingresos YA EXISTE en df, preservando valores existentes")
-            print(f"  Valores: {df['log_ingresos'].head(3).tolist()}")
+            logger.info("⚠️ log_ingresos YA EXISTE en df, preservando valores existentes")
+            if debug:
+                logger.debug(f"  Valores: {df['log_ingresos'].head(3).tolist()}")
         elif 'Ingresos' in df.columns:
-            print(f"ℹ️ Calculando log_ingresos desde Ingresos")
+            logger.debug("ℹ️ Calculando log_ingresos desde Ingresos")
             df['log_ingresos'] = np.log(df['Ingresos'].replace(0, np.nan))
         
         if 'log_ingresos_deflactados' in df.columns:
-            print(f"⚠️ log_ingresos_deflactados YA EXISTE en df, preservando valores existentes")
-            print(f"  Valores: {df['log_ingresos_deflactados'].head(3).tolist()}")
+            logger.info("⚠️ log_ingresos_deflactados YA EXISTE en df, preservando valores existentes")
+            if debug:
+                logger.debug(f"  Valores: {df['log_ingresos_deflactados'].head(3).tolist()}")
         elif 'Ingresos_Deflactados' in df.columns:
-            print(f"ℹ️ Calculando log_ingresos_deflactados desde Ingresos_Deflactados")
+            logger.debug("ℹ️ Calculando log_ingresos_deflactados desde Ingresos_Deflactados")
             df['log_ingresos_deflactados'] = np.log(df['Ingresos_Deflactados'].replace(0, np.nan))
         
         # 5. Eliminar columnas detalladas
@@ -247,12 +461,7 @@ class DataPreprocessor:
         
         if 'Fecha_Nacimiento' in df.columns:
             df['Fecha_Nacimiento'] = pd.to_datetime(df['Fecha_Nacimiento'], format='%m/%d/%Y', errors='coerce')
-            df['Edad'] = df['Fecha_Nacimiento'].apply(
-                lambda fecha: self.fecha_referencia.year - fecha.year - (
-                    (self.fecha_referencia.month, self.fecha_referencia.day) < (fecha.month, fecha.day)
-                )
-                if pd.notna(fecha) else np.nan
-            )
+            df['Edad'] = self._calcular_edad(df['Fecha_Nacimiento'])
             # NO eliminar Fecha_Nacimiento aquí, la mantenemos para el output
         
         # 7. Procesar variables categóricas
@@ -266,68 +475,26 @@ class DataPreprocessor:
         
         # 8. Procesar título académico
         if 'Nombre_Titulo_Obtenido' in df.columns:
-            df['Area_Titulo'] = df['Nombre_Titulo_Obtenido'].apply(self.agrupar_titulo)
-            # Keep all dummy columns to match the notebook output
-            df_dummies_titulo = pd.get_dummies(df['Area_Titulo'], drop_first=False)
+            df['Area_Titulo'] = self._map_distinct(df['Nombre_Titulo_Obtenido'], self.agrupar_titulo, _TITULO_CACHE)
             # Agregar Area_Titulo al dataframe de texto
             df_texto_original['Area_Titulo'] = df['Area_Titulo']
-        else:
-            df_dummies_titulo = pd.DataFrame()
         
         # 9. Procesar zona/región
         if 'Zona' in df.columns:
-            df['Region'] = df['Zona'].apply(self.mapear_region)
-            # Keep all dummy columns to match the notebook output
-            df_dummies_region = pd.get_dummies(df['Region'], drop_first=False)
+            df['Region'] = self._map_distinct(df['Zona'], self.mapear_region, _REGION_CACHE)
             # Agregar Region al dataframe de texto
             df_texto_original['Region'] = df['Region']
-        else:
-            df_dummies_region = pd.DataFrame()
         
-        # 10. One-hot encoding de categóricas restantes
-        if cat_cols:
-            # Keep all dummy columns (drop_first=False) to preserve the same
-            # encoding as the original notebook/output
-            df_dummies = pd.get_dummies(df[cat_cols], drop_first=False, prefix_sep='_')
-        else:
-            df_dummies = pd.DataFrame()
-        
-        # 11. Eliminar columnas categóricas ANTES de concatenar para evitar duplicados
-        # Solo eliminar 'Nombre_Titulo_Obtenido' y 'Zona' porque ya tenemos Area_Titulo y Region
-        columns_to_drop_before_concat = ['Nombre_Titulo_Obtenido', 'Zona', 'Area_Titulo', 'Region']
-        columns_to_drop_before_concat.extend(cat_cols)  # Añadir todas las categóricas
-        df = df.drop(columns=columns_to_drop_before_concat, errors='ignore')
-        
-        # 12. Concatenar dummies (mantener Area_Titulo y Region en el DataFrame final)
-        df = pd.concat([df, df_dummies, df_dummies_region, df_dummies_titulo], axis=1)
-        
-        # 13. Verificar y eliminar columnas duplicadas antes de reindexar
-        if df.columns.duplicated().any():
-            duplicated_cols = df.columns[df.columns.duplicated()].tolist()
-            print(f"⚠️ Columnas duplicadas detectadas: {duplicated_cols}")
-            # Mantener solo la primera ocurrencia de cada columna
-            df = df.loc[:, ~df.columns.duplicated()]
-        
-        # 14. Reindexar SOLO las columnas numéricas para el modelo
-        # Las columnas que falten se rellenarán con 0 (como float64)
-        df_numerico = df.reindex(columns=EXPECTED_COLUMNS, fill_value=0.0)
-        
-        # 15. Asegurar que las columnas numéricas sean float64
-        for col in df_numerico.columns:
-            # Saltar columnas que están en df_texto_original
-            if col in df_texto_original.columns:
-                continue
-            if col != 'Cluster':
-                # Solo convertir columnas numéricas
-                try:
-                    df_numerico[col] = pd.to_numeric(df_numerico[col], errors='coerce').astype(np.float64)
-                except (ValueError, TypeError):
-                    pass  # Dejar como está si no se puede convertir
-        
-        # 16. Reemplazar las columnas de texto en df_numerico con las originales guardadas
-        for col in df_texto_original.columns:
-            if col in df_numerico.columns:
-                df_numerico[col] = df_texto_original[col]
+        # Texto repetido como category (IdUnico es único por fila: se deja igual)
+        if self.compact:
+            for col in df_texto_original.columns:
+                if col != 'IdUnico' and not isinstance(df_texto_original[col].dtype, pd.CategoricalDtype):
+                    df_texto_original[col] = df_texto_original[col].astype('category')
+        
+        # 10-16. Construir la matriz de features directamente sobre EXPECTED_COLUMNS:
+        # one-hot de categóricas, Region y Area_Titulo, columnas numéricas (float64 o
+        # compactas) y columnas de texto con los valores originales guardados
+        df_numerico = FEATURE_ENCODER.encode(df, cat_cols, df_texto_original, compact=self.compact)
         
         return df_numerico, id_unico
 
@@ -0,0 +1,310 @@
+"""
+Perfiles por cluster acumulados durante la clusterización
+
+Cada frame o bloque predicho suma, por cluster, los montos y conteos
+(ingresos, edad, aportes, mora, ...) y la penetración de cada producto y de
+cada dummy (estrato, región, ocupación, ...). Las sumas se combinan entre
+bloques, shards y corridas sin volver a leer el resultado, y el resumen
+(promedios y proporciones) alimenta la tabla de arquetipos y los prompts de n8n.
+
+Con PROFILES_STATE_PATH las corridas se combinan en un archivo JSON compartido
+por los workers (con lock de archivo); si no, en memoria del proceso. Los
+perfiles se guardan por versión del modelo: el cluster 3 de una versión no es
+el cluster 3 de otra.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from app.ingestion import INPUT_COLUMNS, INPUT_DTYPES
+from app.output_plan import normalize_column_name
+from app.preprocessing import NUMERIC_DTYPES, ONEHOT_COLUMNS
+
+try:
+    import fcntl
+except ImportError:  # Windows: solo lock entre hilos
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Acumular perfiles y archivo compartido con el estado (vacío = en memoria del proceso)
+PROFILES_ENABLED = os.getenv("PROFILES_ENABLED", "true").lower() in ("1", "true", "yes")
+PROFILES_STATE_PATH = os.getenv("PROFILES_STATE_PATH", "")
+
+# Promedio por cluster
+MEAN_COLUMNS = [
+    'Ingresos', 'Ingresos_Deflactados', 'Edad', 'Antiguedad_dias', 'Personas_a_Cargo',
+    'Personas_a_Cargo_Menores_18', 'Saldo_aportes', 'Cuotas_canceladas_aportes', 'Cuotas_mora_aportes',
+    'Vlr_mora', 'numCantidadProductos', 'saldo_VISA', 'MasterCardCupo', 'MasterCardSaldo'
+]
+# Proporción de asociados con valor distinto de 0: indicadores de productos que se leen del archivo y dummies
+PRODUCT_COLUMNS = [col for col in INPUT_COLUMNS if INPUT_DTYPES.get(col) == 'Int8']
+RATE_COLUMNS = PRODUCT_COLUMNS + ONEHOT_COLUMNS
+# Proporción de asociados con cuotas o valor en mora
+ARREARS_COLUMN = 'en_mora'
+
+
+class ClusterProfiles:
+    """
+    Conteo, suma y valores no nulos por cluster de cada columna del perfil
+
+    Las sumas son aditivas: merge() combina bloques, shards o corridas y
+    summary() divide al final (los nulos no cuentan en el promedio).
+    """
+
+    def __init__(self, version: Optional[str] = None):
+        self.version = version
+        self.columns = MEAN_COLUMNS + RATE_COLUMNS + [ARREARS_COLUMN]
+        self.members: Dict[int, int] = {}
+        self.sums: Dict[int, np.ndarray] = {}
+        self.valid: Dict[int, np.ndarray] = {}
+        self.runs = 0
+        self.failed = False
+
+    def _values(self, df: pd.DataFrame) -> np.ndarray:
+        """Matriz [filas, columnas del perfil] en float64 (NaN si falta el valor o la columna)"""
+        block = df.reindex(columns=self.columns)
+        if not block.dtypes.isin(NUMERIC_DTYPES).all():
+            block = block.apply(pd.to_numeric, errors='coerce')
+        values = block.to_numpy(dtype=np.float64, na_value=np.nan)
+
+        # Penetración: 1 si el valor es distinto de 0 (sign(|x|) conserva los NaN)
+        n_mean = len(MEAN_COLUMNS)
+        rates = values[:, n_mean:n_mean + len(RATE_COLUMNS)]
+        np.abs(rates, out=rates)
+        np.sign(rates, out=rates)
+
+        # En mora: cuotas o valor en mora mayores a 0 (nulo si faltan ambos)
+        arrears = values[:, [MEAN_COLUMNS.index('Cuotas_mora_aportes'), MEAN_COLUMNS.index('Vlr_mora')]]
+        values[:, -1] = np.where(np.isnan(arrears).all(axis=1), np.nan, np.nansum(arrears, axis=1) > 0)
+        return values
+
+    def update(self, df_completo: pd.DataFrame, labels: np.ndarray) -> None:
+        """Suma las filas válidas de ClusteringModel.predict a sus clusters"""
+        labels = np.asarray(labels)
+        if len(labels) == 0:
+            return
+        values = self._values(df_completo)
+
+        # Una sola multiplicación [clusters, filas] × [filas, columnas] para todas las sumas
+        clusters, inverse = np.unique(labels, return_inverse=True)
+        onehot = np.zeros((len(clusters), len(labels)))
+        onehot[inverse, np.arange(len(labels))] = 1.0
+        members = onehot.sum(axis=1)
+
+        # Valores no nulos: solo se cuentan en las columnas que tienen algún NaN
+        missing = np.isnan(values)
+        with_nan = np.flatnonzero(missing.any(axis=0))
+        valid = np.repeat(members[:, None], len(self.columns), axis=1)
+        if len(with_nan):
+            valid[:, with_nan] -= onehot @ missing[:, with_nan]
+            values[:, with_nan] = np.nan_to_num(values[:, with_nan], nan=0.0)
+        sums = onehot @ values
+
+        for i, cluster in enumerate(clusters.tolist()):
+            self._add(int(cluster), int(members[i]), sums[i], valid[i])
+
+    def _add(self, cluster: int, members: int, sums: np.ndarray, valid: np.ndarray) -> None:
+        if cluster in self.members:
+            self.members[cluster] += members
+            self.sums[cluster] += sums
+            self.valid[cluster] += valid
+        else:
+            self.members[cluster] = members
+            self.sums[cluster] = np.array(sums, dtype=np.float64)
+            self.valid[cluster] = np.array(valid, dtype=np.float64)
+
+    def merge(self, other: "ClusterProfiles") -> None:
+        """Agrega las sumas de otro acumulador (misma lista de columnas)"""
+        for cluster, members in other.members.items():
+            self._add(cluster, members, other.sums[cluster], other.valid[cluster])
+        self.runs += other.runs
+
+    @property
+    def n_members(self) -> int:
+        return sum(self.members.values())
+
+    def summary(self) -> List[Dict]:
+        """
+        Una fila por cluster: asociados, promedios y proporciones (0-1)
+
+        Los nombres son los de la tabla datos (ingresos, saldo_aportes, estrato_3, andina, ...)
+        """
+        rows = []
+        for cluster in sorted(self.members):
+            with np.errstate(invalid='ignore', divide='ignore'):
+                means = self.sums[cluster] / self.valid[cluster]
+            row = {"cluster": cluster, "n_members": self.members[cluster]}
+            for col, value in zip(self.columns, means.tolist()):
+                row[normalize_column_name(col)] = None if np.isnan(value) else round(value, 4)
+            rows.append(row)
+        return rows
+
+    def to_state(self) -> Dict:
+        return {
+            "columns": self.columns,
+            "runs": self.runs,
+            "clusters": {
+                str(cluster): {
+                    "n": self.members[cluster],
+                    "sum": self.sums[cluster].tolist(),
+                    "valid": self.valid[cluster].tolist(),
+                }
+                for cluster in sorted(self.members)
+            },
+        }
+
+    @classmethod
+    def from_state(cls, state: Dict, version: Optional[str] = None) -> "ClusterProfiles":
+        """Acumulador desde to_state() (columnas alineadas por nombre; las nuevas empiezan en 0)"""
+        profiles = cls(version)
+        profiles.runs = state.get("runs", 0)
+        position = {col: j for j, col in enumerate(profiles.columns)}
+        source = [position.get(col) for col in state.get("columns", [])]
+        keep = [(j, k) for j, k in enumerate(source) if k is not None]
+        for cluster, entry in state.get("clusters", {}).items():
+            sums = np.zeros(len(profiles.columns))
+            valid = np.zeros(len(profiles.columns))
+            for j, k in keep:
+                sums[k] = entry["sum"][j]
+                valid[k] = entry["valid"][j]
+            profiles._add(int(cluster), int(entry["n"]), sums, valid)
+        return profiles
+
+
+class ProfileStore:
+    """
+    Perfiles combinados de todas las corridas, por versión del modelo
+
+    Args:
+        path: Archivo JSON compartido (vacío = en memoria del proceso)
+    """
+
+    def __init__(self, path: str = PROFILES_STATE_PATH):
+        self.path = Path(path) if path else None
+        self._profiles: Dict[str, ClusterProfiles] = {}
+        self._updated_at: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def _locked(self):
+        with self._lock:
+            if self.path is None or fcntl is None:
+                yield
+                return
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(f"{self.path}.lock", "w") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _load(self):
+        if self.path is None or not self.path.exists():
+            return
+        state = json.loads(self.path.read_text())
+        if "versions" not in state:
+            # Estado anterior al registro de versiones: era el modelo de la raíz de MODELS_PATH
+            from app.registry import ROOT_VERSION
+            state = {"versions": {ROOT_VERSION: state}}
+        self._profiles, self._updated_at = {}, {}
+        for version, version_state in state["versions"].items():
+            self._profiles[version] = ClusterProfiles.from_state(version_state, version)
+            if version_state.get("updated_at") is not None:
+                self._updated_at[version] = version_state["updated_at"]
+
+    def _save(self):
+        if self.path is None:
+            return
+        state = {"versions": {
+            version: {**profiles.to_state(), "updated_at": self._updated_at.get(version)}
+            for version, profiles in self._profiles.items()
+        }}
+        tmp_path = self.path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(state))
+        os.replace(tmp_path, self.path)
+
+    def record(self, run: ClusterProfiles) -> None:
+        """Combina una corrida con las anteriores de la misma versión del modelo"""
+        version = str(run.version)
+        with self._locked():
+            self._load()
+            self._profiles.setdefault(version, ClusterProfiles(version)).merge(run)
+            self._updated_at[version] = time.time()
+            self._save()
+
+    def snapshot(self, version: Optional[str]) -> Dict:
+        """Resumen combinado de una versión con corridas, asociados y última actualización"""
+        version = str(version)
+        with self._locked():
+            self._load()
+            profiles = self._profiles.get(version) or ClusterProfiles(version)
+            return {
+                "model_version": version,
+                "runs": profiles.runs,
+                "n_members": profiles.n_members,
+                "updated_at": self._updated_at.get(version),
+                "clusters": profiles.summary(),
+            }
+
+    def reset(self) -> None:
+        with self._locked():
+            self._profiles, self._updated_at = {}, {}
+            if self.path is not None and self.path.exists():
+                self.path.unlink()
+
+
+# Store global (singleton)
+_profile_store: Optional[ProfileStore] = None
+_profile_store_lock = threading.Lock()
+
+
+def get_profile_store() -> Optional[ProfileStore]:
+    """Perfiles combinados del servicio (None si PROFILES_ENABLED=false)"""
+    global _profile_store
+    if not PROFILES_ENABLED:
+        return None
+    with _profile_store_lock:
+        if _profile_store is None:
+            _profile_store = ProfileStore()
+    return _profile_store
+
+
+def new_run(version: Optional[str]) -> Optional[ClusterProfiles]:
+    """Acumulador de una corrida con una versión del modelo (None si los perfiles están desactivados)"""
+    if not PROFILES_ENABLED:
+        return None
+    run = ClusterProfiles(version)
+    run.runs = 1
+    return run
+
+
+def accumulate(run: Optional[ClusterProfiles], df_completo: pd.DataFrame, labels: np.ndarray) -> None:
+    """Suma un frame o bloque predicho a la corrida (un error descarta la corrida, no la request)"""
+    if run is None or run.failed:
+        return
+    try:
+        run.update(df_completo, labels)
+    except Exception as e:
+        logger.warning(f"⚠️  No se pudieron acumular los perfiles por cluster: {e}")
+        run.failed = True
+
+
+def record_run(run: Optional[ClusterProfiles]) -> None:
+    """Combina la corrida en el store (un error no afecta la request)"""
+    store = get_profile_store()
+    if store is None or run is None or run.failed or not run.members:
+        return
+    try:
+        store.record(run)
+    except Exception as e:
+        logger.warning(f"⚠️  No se pudieron guardar los perfiles por cluster: {e}")
@@ -0,0 +1,187 @@
+"""
+Clusterización de registros JSON sin DataFrame (camino rápido para 1-100 filas)
+
+Para cada feature del modelo se precompila de dónde sale en el registro crudo
+(columna numérica directa, fecha -> Antiguedad_dias / Edad, logaritmo de
+ingresos, o columna eliminada por el preprocesamiento = 0) y la matriz se
+arma directamente en NumPy, con la misma semántica que DataPreprocessor.process.
+Si el modelo usa features que requieren el preprocesamiento completo (one-hot,
+Region, Area_Titulo), se usa el camino con DataFrame.
+
+Como en el archivo, una columna ausente vale 0 (DataPreprocessor la agrega en
+cero) y una presente pero nula es NaN (la fila se descarta): en un registro,
+una clave ausente vale 0 y una clave con null, NaN. Las columnas críticas
+ausentes invalidan la fila.
+"""
+import datetime
+import logging
+import math
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from app.preprocessing import (
+    CATEGORICAL_INPUT_COLUMNS, CRITICAL_COLUMNS, EXPECTED_COLUMNS, ONEHOT_COLUMNS, TEXT_COLUMNS,
+    DataPreprocessor
+)
+
+logger = logging.getLogger(__name__)
+
+# Mismo formato que DataPreprocessor (%m/%d/%Y), sin el costo de strptime por registro
+_DATE_PATTERN = re.compile(r'(1[0-2]|0[1-9]|[1-9])/(3[01]|[12][0-9]|0[1-9]|[1-9])/([0-9]{4})\Z')
+
+# Features derivadas de una fecha (la columna derivada del registro se usa solo si falta la fecha)
+DATE_FEATURES = {'Antiguedad_dias': 'Fecha_Ingreso', 'Edad': 'Fecha_Nacimiento'}
+
+# Logaritmos de ingresos (se calculan solo si el registro no los trae)
+LOG_FEATURES = {'log_ingresos': 'Ingresos', 'log_ingresos_deflactados': 'Ingresos_Deflactados'}
+
+
+def _to_float(value: Any, column: str) -> float:
+    """Valor numérico como en un CSV: números, booleanos, texto numérico; None = NaN"""
+    if value is None:
+        return math.nan
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        try:
+            return float(value) if value.strip() else math.nan
+        except ValueError:
+            pass
+    raise ValueError(f"Valor no numérico en '{column}': {value!r}")
+
+
+def _to_date(value: Any) -> Optional[datetime.datetime]:
+    """Fecha en formato MM/DD/YYYY (None si falta o es inválida, como errors='coerce')"""
+    if not isinstance(value, str):
+        return None
+    match = _DATE_PATTERN.match(value)
+    if match is None:
+        return None
+    month, day, year = match.groups()
+    try:
+        return datetime.datetime(int(year), int(month), int(day))
+    except ValueError:
+        return None
+
+
+class RecordFeatureExtractor:
+    """
+    Construye la matriz de features del modelo desde registros crudos (dicts)
+
+    Args:
+        feature_names: Features del modelo en orden (scaler.feature_names_in_)
+    """
+
+    def __init__(self, feature_names: List[str]):
+        self.feature_names = list(feature_names)
+        preprocessor = DataPreprocessor()
+        dropped = set(preprocessor.columnas_a_eliminar_inicial) | {'Egresos'} | set(preprocessor.columns_to_drop_detailed)
+        expected = set(EXPECTED_COLUMNS)
+        not_direct = set(TEXT_COLUMNS) | set(ONEHOT_COLUMNS) | set(CATEGORICAL_INPUT_COLUMNS) | {'Area_Titulo', 'Region'}
+
+        self.steps: List[Tuple[str, str]] = []
+        self.unsupported: List[str] = []
+        for name in self.feature_names:
+            if name not in expected or name in not_direct:
+                self.unsupported.append(name)
+            elif name in DATE_FEATURES:
+                self.steps.append(('date', name))
+            elif name in LOG_FEATURES:
+                self.steps.append(('log', name))
+            elif name in dropped:
+                self.steps.append(('zero', name))
+            else:
+                self.steps.append(('raw', name))
+
+        # Columnas numéricas directas (features + críticas) que se leen en un solo bloque
+        self.raw_columns = [name for kind, name in self.steps if kind == 'raw']
+        self.raw_columns += [col for col in CRITICAL_COLUMNS if col not in self.raw_columns]
+        raw_position = {name: j for j, name in enumerate(self.raw_columns)}
+        self.raw_slots = [(k, raw_position[name]) for k, (kind, name) in enumerate(self.steps) if kind == 'raw']
+        self.critical_slots = [raw_position[col] for col in CRITICAL_COLUMNS]
+        # Valor de una clave ausente: 0 (columna agregada en cero) salvo en las críticas (NaN)
+        self.raw_defaults = [None if name in CRITICAL_COLUMNS else 0.0 for name in self.raw_columns]
+        self.derived_slots = [(k, kind, name) for k, (kind, name) in enumerate(self.steps) if kind in ('date', 'log')]
+
+        if self.unsupported:
+            logger.info(f"Camino rápido de registros desactivado: features no directas {self.unsupported}")
+
+    @property
+    def supported(self) -> bool:
+        return not self.unsupported
+
+    def _value(self, kind: str, name: str, record: Dict[str, Any], ref: datetime.datetime) -> float:
+        """Feature derivada (fecha o logaritmo) de un registro"""
+        if kind == 'log':
+            if name in record:
+                return _to_float(record[name], name)
+            source = LOG_FEATURES[name]
+            if source not in record:
+                return 0.0
+            value = _to_float(record[source], source)
+            return math.log(value) if value > 0 else math.nan
+
+        source = DATE_FEATURES[name]
+        if source not in record:
+            return _to_float(record[name], name) if name in record else 0.0
+        fecha = _to_date(record[source])
+        if fecha is None:
+            return math.nan
+        if name == 'Antiguedad_dias':
+            return float((ref - fecha).days)
+        no_ha_cumplido = (ref.month, ref.day) < (fecha.month, fecha.day)
+        return float(ref.year - fecha.year - no_ha_cumplido)
+
+    def extract(self, records: List[Dict[str, Any]],
+                fecha_referencia: Optional[pd.Timestamp] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Args:
+            records: Registros crudos con las columnas del archivo de entrada
+            fecha_referencia: Fecha para Antiguedad_dias y Edad (default: hoy)
+
+        Returns:
+            Tuple (X, validos): matriz (n_registros, n_features) y máscara de filas
+            sin valores faltantes en features ni en columnas críticas
+
+        Raises:
+            ValueError: Si un valor de una columna numérica no es numérico
+        """
+        ref = (fecha_referencia or pd.Timestamp.today()).to_pydatetime()
+        rows = [
+            [record.get(name, default) for name, default in zip(self.raw_columns, self.raw_defaults)]
+            for record in records
+        ]
+        try:
+            # NumPy convierte números, booleanos, texto numérico y None (NaN) en una sola pasada
+            raw = np.array(rows, dtype=np.float64).reshape(len(records), len(self.raw_columns))
+        except (TypeError, ValueError):
+            # Valor por valor: texto vacío = NaN y error con el nombre de la columna
+            raw = np.array(
+                [[_to_float(v, name) for v, name in zip(row, self.raw_columns)] for row in rows],
+                dtype=np.float64
+            ).reshape(len(records), len(self.raw_columns))
+
+        X = np.zeros((len(records), len(self.steps)), dtype=np.float64)
+        for k, j in self.raw_slots:
+            X[:, k] = raw[:, j]
+        for k, kind, name in self.derived_slots:
+            X[:, k] = [self._value(kind, name, record, ref) for record in records]
+
+        validos = ~np.isnan(raw[:, self.critical_slots]).any(axis=1) & ~np.isnan(X).any(axis=1)
+        return X, validos
+
+
+# Extractores compilados por conjunto de features del modelo
+_extractors: Dict[Tuple[str, ...], RecordFeatureExtractor] = {}
+
+
+def get_record_extractor(feature_names: List[str]) -> RecordFeatureExtractor:
+    """Extractor para las features del modelo (se compila una sola vez)"""
+    key = tuple(feature_names)
+    extractor = _extractors.get(key)
+    if extractor is None:
+        extractor = _extractors[key] = RecordFeatureExtractor(feature_names)
+    return extractor
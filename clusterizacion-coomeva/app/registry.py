@@ -0,0 +1,454 @@
+"""
+Registro de versiones del modelo con recarga en caliente
+
+MODELS_PATH contiene una carpeta por versión (p. ej. models/2025-09/,
+models/2025-10/), cada una con los pickles o el manifest.json del formato mmap.
+Si MODELS_PATH tiene los archivos directamente, esa es la versión "default".
+La versión activa es la indicada en MODELS_PATH/CURRENT, o MODEL_VERSION, o la
+última carpeta en orden alfabético.
+
+Activar una versión la carga y la calienta en segundo plano y después cambia
+la referencia activa de una sola vez: las requests en curso terminan con el
+modelo con el que empezaron. Cada proceso revisa CURRENT como mucho cada
+MODEL_RELOAD_INTERVAL_S segundos al pedir el modelo, así que todos los workers
+(y las instancias que comparten el volumen) siguen el mismo cambio.
+
+    python -m app.registry list --models-path models
+    python -m app.registry activate 2025-10 --models-path models
+"""
+import argparse
+import logging
+import mmap
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from app.artifacts import MANIFEST_NAME, PICKLE_FILES
+
+logger = logging.getLogger(__name__)
+
+# Carpeta de versiones, versión por defecto (si no hay CURRENT), intervalo de revisión
+# de CURRENT (0 = solo al arrancar) y versiones cargadas a la vez (la activa no se descarga)
+MODELS_PATH = os.getenv("MODELS_PATH", "models")
+MODEL_VERSION = os.getenv("MODEL_VERSION", "")
+MODEL_RELOAD_INTERVAL_S = float(os.getenv("MODEL_RELOAD_INTERVAL_S", "30"))
+MODEL_REGISTRY_MAX_LOADED = int(os.getenv("MODEL_REGISTRY_MAX_LOADED", "2"))
+
+CURRENT_FILE = "CURRENT"
+ROOT_VERSION = "default"
+
+
+class ModelLoading(Exception):
+    """La versión fijada se está cargando en segundo plano (la request puede reintentar)"""
+
+    def __init__(self, version: str):
+        super().__init__(f"La versión del modelo '{version}' se está cargando, intente más tarde")
+        self.version = version
+
+
+def _has_models(path: Path) -> bool:
+    return (path / MANIFEST_NAME).exists() or all((path / name).exists() for name in PICKLE_FILES)
+
+
+def _model_memory(model) -> Dict[str, float]:
+    """MB de los arrays del modelo: en memoria del proceso y mapeados desde disco (mmap)"""
+    owners = [model, model.scaler, model.kmeans_model, model.knn_index, model.exact_knn_index, model.runtime]
+    if model.runtime is not None:
+        owners += [model.runtime.knn, model.runtime.kmeans]
+
+    seen = set()
+    resident = mapped = 0
+    for owner in owners:
+        for value in vars(owner).values() if owner is not None and hasattr(owner, '__dict__') else ():
+            if not isinstance(value, np.ndarray):
+                continue
+            base = value
+            while isinstance(base, np.ndarray) and base.base is not None:
+                base = base.base
+            if id(base) in seen:
+                continue
+            seen.add(id(base))
+            if isinstance(value, np.memmap) or isinstance(base, mmap.mmap):
+                mapped += value.nbytes
+            else:
+                resident += value.nbytes
+    return {"memory_mb": round(resident / (1024 * 1024), 1), "mapped_mb": round(mapped / (1024 * 1024), 1)}
+
+
+def _model_format(model) -> str:
+    """pickle (copia por proceso), mmap (manifest junto a los modelos) o shared (MODELS_SHARED_PATH)"""
+    if model.manifest is None:
+        return "pickle"
+    return "mmap" if model.artifacts_path == model.models_path else "shared"
+
+
+class ModelRegistry:
+    """
+    Versiones del modelo cargadas en el proceso y versión activa
+
+    Args:
+        root: Carpeta con una subcarpeta por versión (o los archivos del modelo)
+        default_version: Versión activa si no existe CURRENT
+        max_loaded: Versiones en memoria a la vez (LRU; la activa no se descarga)
+        reload_interval_s: Segundos entre revisiones de CURRENT (0 = no revisar)
+    """
+
+    def __init__(self, root: str = MODELS_PATH, default_version: str = MODEL_VERSION,
+                 max_loaded: int = MODEL_REGISTRY_MAX_LOADED, reload_interval_s: float = MODEL_RELOAD_INTERVAL_S):
+        self.root = Path(root)
+        self.default_version = default_version or None
+        self.max_loaded = max(max_loaded, 1)
+        self.reload_interval_s = reload_interval_s
+        self._models: "OrderedDict[str, object]" = OrderedDict()
+        self._loaded_at: Dict[str, float] = {}
+        self._active: Optional[str] = None
+        self._switching: Optional[str] = None
+        self._last_error: Optional[str] = None
+        # Versión de CURRENT que no se pudo cargar (no se reintenta hasta que CURRENT cambie)
+        self._failed_pointer: Optional[str] = None
+        # Versiones fijadas con ?model_version= cargándose en segundo plano y sus errores de carga
+        self._pinned_loading: set = set()
+        self._pinned_errors: Dict[str, str] = {}
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self._first_load_lock = threading.Lock()
+        self._load_locks: Dict[str, threading.Lock] = {}
+
+    # --- Versiones en disco ---
+
+    def versions(self) -> List[str]:
+        """Versiones disponibles en disco ("default" primero si la raíz tiene modelos)"""
+        versions = [ROOT_VERSION] if _has_models(self.root) else []
+        if self.root.is_dir():
+            versions += sorted(p.name for p in self.root.iterdir() if p.is_dir() and _has_models(p))
+        return versions
+
+    def path_of(self, version: str) -> Path:
+        """
+        Carpeta de una versión
+
+        Raises:
+            KeyError: Si la versión no existe o no tiene modelos
+        """
+        if version == ROOT_VERSION:
+            path = self.root
+        elif not version or version in ('.', '..') or '/' in version or '\\' in version:
+            raise KeyError(version)
+        else:
+            path = self.root / version
+        if not path.is_dir() or not _has_models(path):
+            raise KeyError(version)
+        return path
+
+    def pointer(self) -> Optional[str]:
+        """Versión escrita en CURRENT (None si no existe)"""
+        try:
+            return (self.root / CURRENT_FILE).read_text().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def write_pointer(self, version: str) -> None:
+        """Escribe CURRENT de forma atómica (archivo temporal + rename)"""
+        self.path_of(version)
+        tmp_path = self.root / f".{CURRENT_FILE}.tmp"
+        tmp_path.write_text(version + "\n")
+        os.replace(tmp_path, self.root / CURRENT_FILE)
+
+    def resolve_version(self) -> str:
+        """Versión que debería estar activa según CURRENT, MODEL_VERSION o la última carpeta"""
+        version = self.pointer() or self.default_version
+        if version is not None:
+            return version
+        versions = self.versions()
+        if not versions:
+            raise FileNotFoundError(
+                f"No hay modelos en {self.root}: se espera una carpeta por versión con "
+                "scaler_model.pkl, kmeans_model.pkl y umap_data.pkl (o manifest.json)"
+            )
+        return versions[-1]
+
+    # --- Carga y cambio de versión ---
+
+    def load(self, version: str):
+        """
+        Modelo de una versión (lo carga y lo calienta si no está en memoria)
+
+        Raises:
+            KeyError: Si la versión no existe
+        """
+        from app.prediction import ClusteringModel
+
+        with self._lock:
+            model = self._models.get(version)
+            if model is not None:
+                self._models.move_to_end(version)
+                return model
+            path = self.path_of(version)
+            load_lock = self._load_locks.setdefault(version, threading.Lock())
+
+        # Una sola carga por versión; otras versiones se pueden cargar en paralelo
+        with load_lock:
+            with self._lock:
+                if version in self._models:
+                    return self._models[version]
+            started = time.perf_counter()
+            logger.info(f"Cargando versión del modelo '{version}' desde {path}...")
+            model = ClusteringModel(str(path), version=version)
+            model.warm_up()
+            logger.info(f"✓ Versión '{version}' cargada en {time.perf_counter() - started:.2f}s")
+
+            with self._lock:
+                self._models[version] = model
+                self._loaded_at[version] = time.time()
+                # La versión recién cargada no se descarga antes de que la use quien la pidió
+                self._evict(keep=version)
+        return model
+
+    def _evict(self, keep: Optional[str] = None):
+        """Descarga las versiones menos usadas por encima de max_loaded (nunca la activa)"""
+        for version in list(self._models):
+            if len(self._models) <= self.max_loaded:
+                break
+            if version in (self._active, self._switching, keep):
+                continue
+            # Las requests que ya tienen la referencia la siguen usando hasta terminar
+            del self._models[version]
+            self._loaded_at.pop(version, None)
+            logger.info(f"Versión '{version}' descargada de memoria")
+
+    def _switch(self, version: str, raise_errors: bool = False, persist: bool = False) -> None:
+        """
+        Carga la versión y la deja activa (el cambio es una sola asignación)
+
+        Con persist, CURRENT se escribe solo si la carga funcionó: una versión
+        rota no queda como activa para los demás workers ni para el próximo arranque.
+        """
+        try:
+            self.load(version)
+        except Exception as e:
+            with self._lock:
+                self._last_error = f"{version}: {e}"
+                if self._switching == version:
+                    self._switching = None
+                if not persist and version == self.pointer():
+                    self._failed_pointer = version
+            if raise_errors:
+                raise
+            logger.error(f"❌ No se pudo activar la versión '{version}': {e}", exc_info=True)
+            return
+        if persist:
+            self.write_pointer(version)
+        with self._lock:
+            previous, self._active = self._active, version
+            self._switching = None
+            self._last_error = None
+            self._evict()
+        if previous != version:
+            logger.info(f"✓ Versión activa del modelo: '{previous}' -> '{version}'")
+
+    def activate(self, version: str, persist: bool = True, background: bool = True) -> None:
+        """
+        Activa una versión sin cortar las requests en curso
+
+        Args:
+            version: Versión a activar
+            persist: Escribir CURRENT cuando termine de cargar (los demás workers la
+                     toman en su próxima revisión)
+            background: Cargar en un hilo y cambiar al terminar (False = esperar)
+
+        Raises:
+            KeyError: Si la versión no existe
+        """
+        self.path_of(version)
+        with self._lock:
+            if version == self._switching:
+                return
+            if version == self._active:
+                if persist and self.pointer() != version:
+                    self.write_pointer(version)
+                return
+            self._switching = version
+        if background:
+            threading.Thread(
+                target=self._switch, args=(version,), kwargs={"persist": persist},
+                name=f"model-load-{version}", daemon=True
+            ).start()
+        else:
+            self._switch(version, persist=persist)
+
+    def _check_pointer(self) -> None:
+        """Si CURRENT cambió, activa la nueva versión en segundo plano (como mucho una vez por intervalo)"""
+        now = time.monotonic()
+        if self.reload_interval_s <= 0 or now - self._checked_at < self.reload_interval_s:
+            return
+        self._checked_at = now
+        version = self.pointer()
+        if version != self._failed_pointer:
+            self._failed_pointer = None
+        if version is None or version in (self._active, self._switching, self._failed_pointer):
+            return
+        try:
+            logger.info(f"CURRENT cambió a '{version}': cargando en segundo plano")
+            self.activate(version, persist=False)
+        except KeyError:
+            logger.warning(f"⚠️  CURRENT apunta a una versión inexistente: '{version}'")
+
+    def _load_pinned(self, version: str) -> None:
+        try:
+            self.load(version)
+        except Exception as e:
+            logger.error(f"❌ No se pudo cargar la versión fijada '{version}': {e}", exc_info=True)
+            with self._lock:
+                self._pinned_errors[version] = str(e)
+        finally:
+            with self._lock:
+                self._pinned_loading.discard(version)
+
+    def get_pinned(self, version: str):
+        """
+        Versión fijada por una request sin bloquearla mientras carga
+
+        Si la versión no está en memoria se carga en segundo plano y se lanza
+        ModelLoading (la request responde 503 y el cliente reintenta).
+
+        Raises:
+            KeyError: Si la versión no existe
+            ModelLoading: Si se está cargando
+            RuntimeError: Si la última carga en segundo plano falló (se reintenta en la próxima)
+        """
+        with self._lock:
+            model = self._models.get(version)
+            if model is not None:
+                self._models.move_to_end(version)
+                return model
+            self.path_of(version)
+            error = self._pinned_errors.pop(version, None)
+            if error is not None:
+                raise RuntimeError(f"No se pudo cargar la versión '{version}': {error}")
+            if version not in self._pinned_loading:
+                self._pinned_loading.add(version)
+                threading.Thread(
+                    target=self._load_pinned, args=(version,), name=f"model-load-{version}", daemon=True
+                ).start()
+        raise ModelLoading(version)
+
+    def get(self, version: Optional[str] = None):
+        """
+        Modelo activo o una versión fija
+
+        La primera llamada carga la versión activa de forma síncrona; los cambios
+        posteriores de CURRENT se cargan en segundo plano. Una versión fija se
+        carga de forma síncrona (ver get_pinned para no bloquear una request).
+
+        Raises:
+            KeyError: Si la versión pedida no existe
+        """
+        if version is not None:
+            return self.load(version)
+
+        if self._active is None:
+            # El warm-up del arranque y una request pueden llegar a la vez: una sola carga
+            with self._first_load_lock:
+                if self._active is None:
+                    initial = self.resolve_version()
+                    try:
+                        self.path_of(initial)
+                    except KeyError:
+                        raise FileNotFoundError(f"La versión '{initial}' no existe en {self.root}")
+                    with self._lock:
+                        self._switching = initial
+                    self._switch(initial, raise_errors=True)
+                    self._checked_at = time.monotonic()
+        else:
+            self._check_pointer()
+
+        with self._lock:
+            return self._models[self._active]
+
+    @property
+    def active_version(self) -> Optional[str]:
+        return self._active
+
+    def loaded(self) -> bool:
+        return self._active is not None
+
+    def info(self) -> Dict:
+        """Versión activa, versiones en disco y versiones cargadas con su memoria"""
+        with self._lock:
+            models = list(self._models.items())
+            active, switching, last_error = self._active, self._switching, self._last_error
+        loaded = []
+        for version, model in models:
+            loaded.append({
+                "version": version,
+                "active": version == active,
+                "path": str(model.models_path),
+                "format": _model_format(model),
+                "fingerprint": model.fingerprint[:12],
+                "n_clusters": int(model.kmeans_model.n_clusters),
+                "n_features": len(model.scaler.feature_names_in_),
+                "n_samples": int(len(model.umap_embeddings)),
+                "loaded_at": self._loaded_at.get(version),
+                **_model_memory(model),
+            })
+        return {
+            "active": active,
+            "pointer": self.pointer(),
+            "loading": switching,
+            "last_error": last_error,
+            "available": self.versions(),
+            "loaded": loaded,
+        }
+
+
+# Registro global (singleton)
+_model_registry: Optional[ModelRegistry] = None
+_model_registry_lock = threading.Lock()
+
+
+def get_model_registry() -> ModelRegistry:
+    """Registro de versiones del proceso (MODELS_PATH)"""
+    global _model_registry
+    if _model_registry is None:
+        with _model_registry_lock:
+            if _model_registry is None:
+                _model_registry = ModelRegistry()
+    return _model_registry
+
+
+def main(argv=None) -> int:
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--models-path', default=MODELS_PATH, help="Carpeta con una subcarpeta por versión")
+    parser = argparse.ArgumentParser(description="Versiones del modelo de clustering")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('list', parents=[common], help="Versiones disponibles y versión de CURRENT")
+    activate_parser = subparsers.add_parser('activate', parents=[common],
+                                            help="Escribe CURRENT (los servicios la cargan solos)")
+    activate_parser.add_argument('version')
+
+    args = parser.parse_args(argv)
+    registry = ModelRegistry(args.models_path, reload_interval_s=0)
+
+    if args.command == 'list':
+        pointer = registry.pointer()
+        for version in registry.versions():
+            print(f"{'*' if version == pointer else ' '} {version}")
+        return 0
+
+    try:
+        registry.write_pointer(args.version)
+    except KeyError:
+        print(f"❌ La versión '{args.version}' no existe en {registry.root} (disponibles: {registry.versions()})")
+        return 1
+    print(f"✓ CURRENT -> {args.version}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,233 +1,228 @@
 """
 Router para endpoints de clustering
 """
-from fastapi import APIRouter, UploadFile, File, HTTPException
+from fastapi import APIRouter, Body, Depends, UploadFile, File, Header, HTTPException, Query
 from fastapi.responses import StreamingResponse
 import pandas as pd
 import numpy as np
+import asyncio
 import io
 import logging
-from typing import Optional
+import os
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Tuple
 
+from app.admission import ADMISSION_RETRY_AFTER_S, AdmissionRejected, estimate_cost_mb, get_admission_controller
 from app.preprocessing import DataPreprocessor
+from app.ingestion import read_csv_chunks, read_upload
+from app.parallel import get_sharded_predictor
 from app.prediction import get_clustering_model
+from app.registry import ModelLoading, get_model_registry
+from app.jobs import FAILED, JOB_STAGES, JOBS_SUPPORTED, SUCCEEDED, JobContext, get_job_manager
+from app.output_formats import OUTPUT_FORMATS, ResultWriter, get_writer, negotiate_format
+from app.output_plan import get_output_plan
+from app.records import get_record_extractor
+from app.similarity import index_members, index_results
+from app.profiles import ClusterProfiles, accumulate, get_profile_store, new_run, record_run
+from app import metrics
+from app.sink import PostgresSink, get_postgres_sink
+from app.security import require_admin
+from app.validation import SCHEMA_VALIDATION, validate_upload
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+# Filas por bloque en el modo streaming de /cluster
+STREAM_CHUNK_ROWS = int(os.getenv("STREAM_CHUNK_ROWS", "20000"))
+
+# Registros máximos por request en /cluster/records (lotes mayores: usar /cluster)
+RECORDS_MAX_ROWS = int(os.getenv("RECORDS_MAX_ROWS", "1000"))
+
+
+def format_results(df_completo: pd.DataFrame, labels: np.ndarray) -> pd.DataFrame:
+    """
+    Agrega la columna Cluster y convierte nombres y tipos al formato de Supabase
+    
+    Args:
+        df_completo: DataFrame preprocesado con las filas válidas
+        labels: Cluster asignado a cada fila
+        
+    Returns:
+        DataFrame listo para exportar
+    """
+    # Nombres y tipos precompilados desde el esquema de la tabla datos
+    df_result = get_output_plan().apply(df_completo, labels)
+    
+    logger.info(f"Clusterización completada. Clusters encontrados: {df_result['cluster'].nunique()}")
+    logger.debug(f"Columnas normalizadas: {list(df_result.columns)}")
+    
+    return df_result
+
+
+def _get_model_or_404(version: Optional[str] = None):
+    """
+    Modelo activo o la versión fijada con ?model_version=
+
+    404 si la versión no existe; 503 con Retry-After mientras una versión fijada
+    que no estaba en memoria se carga en segundo plano.
+    """
+    try:
+        if version is None:
+            return get_clustering_model()
+        return get_model_registry().get_pinned(version)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Versión del modelo no encontrada: {version}")
+    except ModelLoading as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(ADMISSION_RETRY_AFTER_S)})
+
+
+def _cluster_frame(df: pd.DataFrame, preprocessor: DataPreprocessor, model,
+                   profiles: Optional[ClusterProfiles] = None) -> pd.DataFrame:
+    """Preprocesa, predice, indexa, acumula perfiles y formatea un bloque de filas crudas"""
+    with metrics.stage("preprocess", rows=len(df)):
+        df_processed, _ = preprocessor.process(df)
+    with metrics.stage("predict", rows=len(df_processed)):
+        labels, _, df_completo = model.predict(df_processed, allow_empty=True)
+    with metrics.stage("index", rows=len(labels)):
+        index_results(df_completo, labels, model)
+    with metrics.stage("profile", rows=len(labels)):
+        accumulate(profiles, df_completo, labels)
+    with metrics.stage("format", rows=len(labels)):
+        return format_results(df_completo, labels)
+
+
+def _stream_results(first_result: pd.DataFrame, chunks: Iterator[pd.DataFrame],
+                    preprocessor: DataPreprocessor, model, writer: ResultWriter,
+                    sink: Optional[PostgresSink] = None,
+                    profiles: Optional[ClusterProfiles] = None) -> Iterator[bytes]:
+    """
+    Genera la salida bloque a bloque en el formato del writer
+    
+    El primer bloque ya viene procesado (y cargado, si hay sink) para que los
+    errores de validación se reporten como HTTP 400 antes de iniciar la respuesta.
+    Los perfiles de la corrida se guardan solo si se completan todos los bloques.
+    """
+    yield writer.write(first_result)
+    n_rows = len(first_result)
+    
+    for chunk in chunks:
+        df_result = _cluster_frame(chunk, preprocessor, model, profiles)
+        if sink is not None:
+            with metrics.stage("load", rows=len(df_result)):
+                sink.write(df_result)
+        n_rows += len(df_result)
+        yield writer.write(df_result)
+    
+    yield writer.close()
+    record_run(profiles)
+    logger.info(f"Clusterización en streaming completada: {n_rows} filas ({writer.format_name})")
+
+
+async def _validate_upload_or_422(source: BinaryIO, filename: str):
+    """Rechaza con 422 y el reporte de validación un archivo que no cumple el esquema de entrada"""
+    if not SCHEMA_VALIDATION:
+        return
+    # Solo el encabezado y las primeras filas, fuera del event loop (un XLSX se descomprime)
+    report = await asyncio.to_thread(validate_upload, source, filename)
+    if not report["valid"]:
+        raise HTTPException(status_code=422, detail=report)
+
+
+def _download_headers(format_name: str, model_version: Optional[str]) -> dict:
+    media_type, extension = OUTPUT_FORMATS[format_name]
+    return {
+        "Content-Disposition": f"attachment; filename=clustered_users.{extension}",
+        "Content-Type": media_type,
+        "X-Model-Version": model_version or ""
+    }
+
 
 @router.post("/cluster")
 async def cluster_users(
-    file: UploadFile = File(..., description="Archivo CSV o XLSX con datos de usuarios")
+    file: UploadFile = File(..., description="Archivo CSV o XLSX con datos de usuarios"),
+    stream: bool = Query(False, description="Procesar un CSV por bloques y transmitir el resultado"),
+    chunk_rows: int = Query(STREAM_CHUNK_ROWS, gt=0, description="Filas por bloque en modo streaming"),
+    output_format: Optional[str] = Query(
+        None, alias="format", description=f"Formato de salida: {', '.join(OUTPUT_FORMATS)}"
+    ),
+    accept: Optional[str] = Header(None),
+    load_db: bool = Query(False, alias="sink", description="Cargar el resultado en la tabla datos de Postgres"),
+    model_version: Optional[str] = Query(None, description="Versión fija del modelo (default: la activa)")
 ):
     """
     Endpoint para clusterizar usuarios
     
+    Con stream=true (solo CSV) el archivo se lee, procesa y devuelve por bloques
+    de chunk_rows filas: la memoria pico depende del bloque y no del archivo.
+    
+    El formato de salida se elige con el parámetro format o el header Accept:
+    csv (default), ndjson, parquet o arrow (Arrow IPC stream).
+    
+    Antes de procesarlo se valida el encabezado y una muestra de las primeras
+    filas (app.validation): si no cumple el esquema, 422 con el reporte en detail.
+    
     Args:
         file: Archivo CSV o XLSX con datos de usuarios
+        stream: Procesar por bloques y transmitir el resultado
+        chunk_rows: Filas por bloque en modo streaming
+        output_format: Formato de salida (tiene prioridad sobre Accept)
+        accept: Header Accept para negociar el formato
+        load_db: Además de responder el archivo, hacer upsert en la tabla datos
+        model_version: Versión del registro de modelos (header X-Model-Version en la respuesta)
         
     Returns:
-        Archivo CSV con los datos originales más la columna 'Cluster'
+        Archivo con los datos originales más la columna 'Cluster'
     """
+    # Validar tipo de archivo
+    filename = file.filename.lower()
+    if not (filename.endswith('.csv') or filename.endswith('.xlsx')):
+        raise HTTPException(
+            status_code=400,
+            detail="Formato de archivo no soportado. Use CSV o XLSX"
+        )
+    streaming = stream and filename.endswith('.csv')
+    
+    # Esquema del archivo antes de admitirlo: uno inválido falla en milisegundos y no ocupa cupo
+    await _validate_upload_or_422(file.file, filename)
+    
+    # Cupo en el pool de CPU según el tamaño del archivo (429/503 con Retry-After si no hay)
+    admission = get_admission_controller()
+    ticket = admission.admit(estimate_cost_mb(file.file, chunk_rows if streaming else None))
     try:
-        # Validar tipo de archivo
-        filename = file.filename.lower()
-        if not (filename.endswith('.csv') or filename.endswith('.xlsx')):
-            raise HTTPException(
-                status_code=400,
-                detail="Formato de archivo no soportado. Use CSV o XLSX"
+        # Se resuelve una vez: un cambio de versión durante la request no la afecta
+        model = await admission.run(_get_model_or_404, model_version)
+        writer = get_writer(negotiate_format(output_format, accept))
+        sink = get_postgres_sink() if load_db else None
+        
+        if streaming:
+            preprocessor = DataPreprocessor()
+            profiles = new_run(model.version)
+            chunks = read_csv_chunks(file.file, chunk_rows)
+            first_result = await admission.run(_first_chunk, chunks, preprocessor, model, sink, profiles)
+            logger.info(f"Archivo recibido: {file.filename}, streaming por bloques de {chunk_rows} filas")
+            
+            # Los bloques siguientes también se procesan en el pool; el cupo se libera al terminar el stream
+            response = StreamingResponse(
+                admission.iterate(
+                    _stream_results(first_result, chunks, preprocessor, model, writer, sink, profiles), ticket
+                ),
+                media_type=writer.media_type,
+                headers=_download_headers(writer.format_name, model.version)
             )
+            ticket = None
+            return response
         
-        # Leer archivo
-        contents = await file.read()
-        
-        if filename.endswith('.csv'):
-            df_original = pd.read_csv(io.BytesIO(contents))
-        else:
-            df_original = pd.read_excel(io.BytesIO(contents))
-        
-        logger.info(f"Archivo recibido: {file.filename}, filas: {len(df_original)}")
-        
-        # Preprocesar datos
-        preprocessor = DataPreprocessor()
-        df_processed, _ = preprocessor.process(df_original.copy())
-        
-        logger.info(f"Datos preprocesados: {len(df_processed)} filas")
-        
-        # Obtener predicciones
-        model = get_clustering_model()
-        labels, _, df_completo = model.predict(df_processed)
-        
-        # Usar df_completo que ya tiene todas las transformaciones aplicadas
-        df_result = df_completo.copy()
-        
-        # Resetear índices
-        df_result = df_result.reset_index(drop=True)
-        
-        # Agregar columna Cluster
-        df_result['Cluster'] = labels
-        
-        # Convertir columnas one-hot de float64 a bool
-        # Identificar columnas one-hot por sus nombres y tipos
-        onehot_columns = [col for col in df_result.columns if any(
-            col.startswith(prefix) for prefix in [
-                'Nombre_Estado_', 'Nombre_Tipo_Vinculacion_', 'Estado_Civil_',
-                'Sexo_', 'Estrato_', 'Nombre_Tipo_Vivienda_', 'Nombre_Nivel_Academico_',
-                'Nombre_Ocupacion_', 'Andina', 'Caribe', 'Orinoquía', 'Otro', 'Pacífica',
-                'Arquitectura', 'Ciencias Sociales', 'Comunicaciones', 'Educación',
-                'Ingeniería', 'Salud', 'Tecnología'
-            ]
-        )]
-        
-        for col in onehot_columns:
-            if col in df_result.columns and df_result[col].dtype in [np.float64, np.float32, float]:
-                # Convertir float64 (0.0, 1.0) a bool (False, True)
-                df_result[col] = df_result[col].astype(bool)
-        
-        # Convertir fechas a formato compatible con Supabase (YYYY-MM-DD)
-        if 'Fecha_Ingreso' in df_result.columns:
-            df_result['Fecha_Ingreso'] = pd.to_datetime(df_result['Fecha_Ingreso']).dt.strftime('%Y-%m-%d')
-        if 'Fecha_Nacimiento' in df_result.columns:
-            df_result['Fecha_Nacimiento'] = pd.to_datetime(df_result['Fecha_Nacimiento']).dt.strftime('%Y-%m-%d')
-        
-        # Convertir IdUnico y Cluster a texto
-        if 'IdUnico' in df_result.columns:
-            df_result['IdUnico'] = df_result['IdUnico'].astype(str)
-        if 'Cluster' in df_result.columns:
-            df_result['Cluster'] = df_result['Cluster'].astype(str)
-        
-        logger.info(f"Clusterización completada. Clusters encontrados: {df_result['Cluster'].nunique()}")
-        
-        # Normalizar nombres de columnas para compatibilidad con Supabase
-        # Convertir a minúsculas, reemplazar espacios por guiones bajos, eliminar caracteres especiales
-        df_result.columns = (
-            df_result.columns
-            .str.lower()  # Minúsculas
-            .str.replace(' ', '_', regex=False)  # Espacios a guiones bajos
-            .str.replace('/', '_', regex=False)  # Slashes a guiones bajos
-            .str.replace('-', '_', regex=False)  # Guiones a guiones bajos
-            .str.replace('ó', 'o', regex=False)  # Acentos
-            .str.replace('í', 'i', regex=False)
-            .str.replace('á', 'a', regex=False)
-            .str.replace('é', 'e', regex=False)
-            .str.replace('ú', 'u', regex=False)
-            .str.replace('ñ', 'n', regex=False)
-            .str.replace('___', '_', regex=False)  # Triple guion bajo a uno
-            .str.replace('__', '_', regex=False)  # Doble guion bajo a uno
-        )
-        
-        # Ajustes específicos para nombres que no coinciden exactamente
-        column_mapping = {
-            'otro.1': 'otro_1',
-            'nombre_ocupacion_ninguno___no_definido': 'nombre_ocupacion_ninguno_no_definido',
-            'nombre_estado_activo_normal': 'nombre_estado_activo_normal',
-            'nombre_estado_suspendido_cobranza_interna': 'nombre_estado_suspendido_cobranza_interna',
-            'nombre_tipo_vinculacion_tecnicos_y_tecnologos': 'nombre_tipo_vinculacion_tecnicos_y_tecnologos',
-            'nombre_tipo_vinculacion_recien_graduado': 'nombre_tipo_vinculacion_recien_graduado',
-            'nombre_nivel_academico_tecnologo': 'nombre_nivel_academico_tecnologo',
-            'nombre_nivel_academico_tecnico': 'nombre_nivel_academico_tecnico',
-            'nombre_ocupacion_pensionado___jubilado': 'nombre_ocupacion_pensionado_jubilado',
-            'orinoquia': 'orinoquia'
-        }
-        
-        df_result.rename(columns=column_mapping, inplace=True)
-        
-        logger.info(f"Columnas normalizadas: {list(df_result.columns)}")
-        
-        # Convertir columnas booleanas que son productos/servicios
-        # Estas columnas deben ser boolean en Supabase
-        boolean_columns = [
-            'cta_dep', 'cta_juve', 'fondo_soc', 'cheque_cta', 'cupo_activ', 'tarj_debit',
-            'cdat', 'pap', 'creditos', 'cred_vivienda', 'cred_lib_inv_con_garant',
-            'cred_lib_inv_sin_garant', 'cred_vehic', 'cred_creac_empr', 'cred_educac',
-            'cred_otros', 'pila', 'bancaseguro', 'afc', 'tienevisa', 'microcreditos',
-            'credisolidario', 'solidaridad', 'exequial', 'herencia', 'hospitalizacion',
-            'recuperacion', 'solvencia', 'tranquilidad', 'vida', 'vidaclasica', 'seguros2',
-            'seguroauto', 'segurosinauto', 'hogarmasytotalhome', 'soat', 'totalrcmedica',
-            'otraspolizas', 'mi', 'cem', 'saor', 'mpt', 'planeducativo', 'tarjetas',
-            'credimutual', 'solidaridadpbi', 'libranza', 'reestructuracionconsumo',
-            'coerotativo', 'originadores', 'coe', 'cupoeducar', 'creditoturismo',
-            'creditosaludbienestar', 'reestructuracioncomercial', 'reestructuracionvivienda',
-            'creditocapitaldetrabajo', 'findeter', 'bancoldex', 'sobregiro',
-            'creditocalamidad', 'creditoproductivo', 'findeterrotativo', 'nominafacil',
-            'pagodeobligaciones', 'desempleo', 'fondosocialviviendapatrimonial',
-            'fondosocialviviendavida', 'fondosocialviviendabanco', 'primanivelada',
-            'crediasociado', 'cuentapension'
-        ]
-        
-        # También incluir las columnas one-hot categóricas (después de normalización)
-        categorical_boolean_columns = [col for col in df_result.columns if any(
-            col.startswith(prefix) for prefix in [
-                'nombre_estado_', 'nombre_tipo_vinculacion_', 'estado_civil_',
-                'sexo_', 'estrato_', 'nombre_tipo_vivienda_', 'nombre_nivel_academico_',
-                'nombre_ocupacion_', 'andina', 'caribe', 'orinoquia', 'otro', 'pacifica',
-                'arquitectura', 'ciencias_sociales', 'comunicaciones', 'educacion',
-                'ingenieria', 'salud', 'tecnologia'
-            ]
-        )]
-        
-        all_boolean_columns = list(set(boolean_columns + categorical_boolean_columns))
-        
-        # Convertir a boolean (True/False en lugar de 0.0/1.0)
-        for col in all_boolean_columns:
-            if col in df_result.columns:
-                # Convertir a numérico primero, luego a int, luego a bool
-                df_result[col] = pd.to_numeric(df_result[col], errors='coerce').fillna(0).astype(int).astype(bool)
-        
-        # Convertir columnas float que deberían ser int (compatibilidad con Supabase)
-        # Estas son columnas pequeñas (booleanos, contadores, flags)
-        small_int_columns = [
-            'personas_a_cargo', 'personas_a_cargo_menores_18', 'cuotas_canceladas_aportes',
-            'cuotas_mora_aportes', 'numedad', 'numcantidadproductos',
-            'antiguedad_dias', 'edad', 'estrato'
-        ]
-        
-        # Convertir a int las columnas pequeñas
-        for col in small_int_columns:
-            if col in df_result.columns:
-                df_result[col] = pd.to_numeric(df_result[col], errors='coerce').fillna(0).astype(int)
-        
-        # Para columnas monetarias/grandes, convertir a int también (Supabase usa bigint)
-        big_int_columns = [
-            'ingresos', 'saldo_aportes', 'vlr_mora', 'ingresos_deflactados',
-            'saldo_visa', 'cuotamanejo', 'mastercardcupo', 'mastercardsaldo',
-            'fic_365', 'fic_90', 'fic_vista', 'inversiones_no_tradicionales',
-            'renta_fija_corto_plazo'
-        ]
-        
-        for col in big_int_columns:
-            if col in df_result.columns:
-                df_result[col] = pd.to_numeric(df_result[col], errors='coerce').fillna(0).astype(int)
-        
-        # Solo log_ingresos y log_ingresos_deflactados se mantienen como float
-        float_columns = ['log_ingresos', 'log_ingresos_deflactados']
-        
-        for col in float_columns:
-            if col in df_result.columns:
-                df_result[col] = pd.to_numeric(df_result[col], errors='coerce').fillna(0)
-        
-        # Crear archivo CSV en memoria como bytes
-        csv_buffer = io.BytesIO()
-        
-        # Guardar DataFrame como CSV en el buffer de bytes
-        csv_string = df_result.to_csv(index=False, encoding='utf-8')
-        csv_buffer.write(csv_string.encode('utf-8'))
-        
-        # Resetear puntero al inicio
-        csv_buffer.seek(0)
+        output, headers = await admission.run(_cluster_file, file, model, writer, sink)
         
         # Preparar respuesta como descarga binaria
         return StreamingResponse(
-            csv_buffer,
-            media_type="application/octet-stream",
-            headers={
-                "Content-Disposition": "attachment; filename=clustered_users.csv",
-                "Content-Type": "application/octet-stream",
-                "Accept-Ranges": "bytes"
-            }
+            output,
+            media_type=writer.media_type,
+            headers=headers
         )
         
+    except (HTTPException, AdmissionRejected):
+        raise
     except ValueError as e:
         logger.error(f"Error de validación: {e}", exc_info=True)
         raise HTTPException(status_code=400, detail=str(e))
@@ -237,6 +232,183 @@ async def cluster_users(
             status_code=500,
             detail=f"Error procesando el archivo: {str(e)}"
         )
+    finally:
+        if ticket is not None:
+            ticket.release()
+
+
+def _first_chunk(chunks: Iterator[pd.DataFrame], preprocessor: DataPreprocessor, model,
+                 sink: Optional[PostgresSink], profiles: Optional[ClusterProfiles]) -> pd.DataFrame:
+    """Procesa (y carga, si hay sink) el primer bloque antes de iniciar la respuesta en streaming"""
+    with metrics.stage("parse") as parse_stage:
+        first_chunk = next(chunks, None)
+        if first_chunk is None:
+            raise ValueError("El archivo no contiene filas")
+        parse_stage.rows = len(first_chunk)
+    first_result = _cluster_frame(first_chunk, preprocessor, model, profiles)
+    if sink is not None:
+        with metrics.stage("load", rows=len(first_result)):
+            sink.write(first_result)
+    return first_result
+
+
+def _cluster_file(file: UploadFile, model, writer: ResultWriter,
+                  sink: Optional[PostgresSink]) -> Tuple[io.BytesIO, dict]:
+    """
+    Pipeline completo de un archivo (se ejecuta en el pool de admisión, fuera del event loop)
+    
+    Returns:
+        Tuple (salida serializada, headers de la descarga)
+    """
+    # Leer archivo
+    with metrics.stage("parse") as parse_stage:
+        df_original = read_upload(file.file, file.filename.lower())
+        parse_stage.rows = len(df_original)
+    
+    logger.info(f"Archivo recibido: {file.filename}, filas: {len(df_original)}")
+    
+    sharded = get_sharded_predictor(len(df_original))
+    if sharded is not None:
+        # Preprocesar y predecir por shards en el pool de procesos
+        with metrics.stage("preprocess_predict", rows=len(df_original)):
+            labels, _, df_completo = sharded.predict(df_original, model.version)
+    else:
+        # Preprocesar datos
+        preprocessor = DataPreprocessor()
+        with metrics.stage("preprocess", rows=len(df_original)):
+            df_processed, _ = preprocessor.process(df_original)
+        
+        logger.info(f"Datos preprocesados: {len(df_processed)} filas")
+        
+        # Obtener predicciones
+        with metrics.stage("predict", rows=len(df_processed)):
+            labels, _, df_completo = model.predict(df_processed)
+    
+    # Índice de similitud (/similar) con los asociados recién clusterizados
+    with metrics.stage("index", rows=len(labels)):
+        index_results(df_completo, labels, model)
+    
+    # Perfiles por cluster (promedios y penetración de productos) combinados con las corridas anteriores
+    with metrics.stage("profile", rows=len(labels)):
+        profiles = new_run(model.version)
+        accumulate(profiles, df_completo, labels)
+        record_run(profiles)
+    
+    with metrics.stage("format", rows=len(labels)):
+        df_result = format_results(df_completo, labels)
+    
+    headers = {**_download_headers(writer.format_name, model.version), "Accept-Ranges": "bytes"}
+    if sink is not None:
+        with metrics.stage("load", rows=len(df_result)):
+            headers["X-DB-Rows-Upserted"] = str(sink.write(df_result))
+    
+    # Serializar directamente al formato negociado (sin string intermedio)
+    with metrics.stage("serialize", rows=len(df_result)):
+        output = io.BytesIO()
+        output.write(writer.write(df_result))
+        output.write(writer.close())
+        output.seek(0)
+    return output, headers
+
+
+def _predict_records(records: List[Dict[str, Any]], model) -> Dict[int, tuple]:
+    """
+    Predice registros crudos: (umap_1, umap_2, cluster) por posición de las filas válidas
+    
+    Usa el camino rápido en NumPy si todas las features del modelo salen
+    directamente del registro; si no, el preprocesamiento completo con DataFrame.
+    """
+    extractor = get_record_extractor([str(c) for c in model.scaler.feature_names_in_])
+    if extractor.supported:
+        with metrics.stage("extract", rows=len(records)):
+            X, validos = extractor.extract(records)
+            positions = np.flatnonzero(validos)
+        if len(positions) == 0:
+            return {}
+        with metrics.stage("predict", rows=len(positions)):
+            X_umap, labels = model.predict_features(X[positions])
+        with metrics.stage("index", rows=len(positions)):
+            index_members([records[pos].get("IdUnico") for pos in positions], X[positions], labels, model)
+    else:
+        with metrics.stage("preprocess", rows=len(records)):
+            df_processed, _ = DataPreprocessor().process(pd.DataFrame.from_records(records))
+        with metrics.stage("predict", rows=len(df_processed)):
+            labels, umap_df, df_completo = model.predict(df_processed, allow_empty=True)
+        with metrics.stage("index", rows=len(labels)):
+            index_results(df_completo, labels, model)
+        positions, X_umap = umap_df.index, umap_df.to_numpy()
+    
+    return {
+        int(pos): (float(X_umap[k, 0]), float(X_umap[k, 1]), int(labels[k]))
+        for k, pos in enumerate(positions)
+    }
+
+
+@router.post("/cluster/records")
+async def cluster_records(
+    records: List[Dict[str, Any]] = Body(
+        ..., description="Registros con las mismas columnas del archivo de entrada"
+    ),
+    model_version: Optional[str] = Query(None, description="Versión fija del modelo (default: la activa)")
+):
+    """
+    Clusteriza registros enviados como JSON (un cliente o lotes pequeños)
+    
+    Pensado para flujos interactivos: sin archivo multipart, sin CSV y, cuando
+    el modelo lo permite, sin DataFrame. Los registros con valores faltantes
+    se devuelven con cluster null.
+    
+    Args:
+        records: Lista de objetos con las columnas crudas (Fecha_Ingreso, Ingresos, ...)
+        model_version: Versión del registro de modelos
+        
+    Returns:
+        Versión usada, cluster y coordenadas UMAP de cada registro, en el orden recibido
+    """
+    if not records:
+        raise HTTPException(status_code=400, detail="La lista de registros está vacía")
+    if len(records) > RECORDS_MAX_ROWS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Máximo {RECORDS_MAX_ROWS} registros por request; use /cluster para archivos"
+        )
+    
+    admission = get_admission_controller()
+    ticket = admission.admit()
+    try:
+        def predict():
+            model = _get_model_or_404(model_version)
+            return model, _predict_records(records, model)
+        
+        model, predictions = await admission.run(predict)
+    except (HTTPException, AdmissionRejected):
+        raise
+    except ValueError as e:
+        logger.error(f"Error de validación: {e}")
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error procesando registros: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Error procesando los registros: {str(e)}")
+    finally:
+        ticket.release()
+    
+    results = []
+    for i, record in enumerate(records):
+        umap_1, umap_2, cluster = predictions.get(i, (None, None, None))
+        results.append({
+            "index": i,
+            "idunico": record.get("IdUnico"),
+            "cluster": cluster,
+            "umap_1": umap_1,
+            "umap_2": umap_2
+        })
+    
+    return {
+        "model_version": model.version,
+        "n_records": len(records),
+        "n_clustered": len(predictions),
+        "results": results
+    }
 
 
 @router.get("/cluster/info")
@@ -245,23 +417,293 @@ async def get_cluster_info():
     Obtiene información sobre el modelo de clustering
     
     Returns:
-        Información del modelo
+        Información del modelo activo y del registro de versiones
+        (versiones disponibles, cargadas y memoria de cada una)
     """
     try:
-        model = get_clustering_model()
-        return {
-            "status": "ready",
-            "n_clusters": int(model.kmeans_model.n_clusters),
-            "umap_components": int(model.umap_model.n_components),
-            "models_loaded": {
-                "umap": model.umap_model is not None,
-                "kmeans": model.kmeans_model is not None,
-                "scaler": model.scaler is not None
-            }
-        }
+        # Cargar el modelo (worker en frío) y recorrer MODELS_PATH son bloqueantes: fuera del event loop
+        return await asyncio.to_thread(_cluster_info)
     except Exception as e:
         logger.error(f"Error obteniendo info del modelo: {e}")
         raise HTTPException(
             status_code=500,
             detail=f"Error obteniendo información del modelo: {str(e)}"
         )
+
+
+def _cluster_info() -> Dict[str, Any]:
+    model = get_clustering_model()
+    return {
+        "status": "ready",
+        "model_version": model.version,
+        "n_clusters": int(model.kmeans_model.n_clusters),
+        "umap_components": int(model.umap_embeddings.shape[1]),
+        "models_loaded": {
+            "umap_embeddings": model.umap_embeddings is not None,
+            "knn_index": model.knn_index is not None,
+            "kmeans": model.kmeans_model is not None,
+            "scaler": model.scaler is not None
+        },
+        "prediction_cache": model.cache.stats() if model.cache is not None else {"enabled": False},
+        "registry": get_model_registry().info(),
+        "admission": get_admission_controller().stats()
+    }
+
+
+@router.post("/cluster/models/activate", status_code=202, dependencies=[Depends(require_admin)])
+async def activate_model_version(
+    version: str = Query(..., description="Versión (carpeta en MODELS_PATH) a activar")
+):
+    """
+    Activa otra versión del modelo sin reiniciar el servicio
+    
+    Carga la versión en segundo plano y, solo si la carga funciona, escribe
+    MODELS_PATH/CURRENT; las requests siguen usando la versión anterior hasta que
+    la nueva está lista. Los demás workers la toman en su próxima revisión de
+    CURRENT (MODEL_RELOAD_INTERVAL_S). Si falla, el error queda en "last_error".
+    Requiere ADMIN_TOKEN (app/security.py).
+    
+    Returns:
+        Estado del registro (HTTP 202): la versión aparece en "loading" hasta quedar activa
+    """
+    registry = get_model_registry()
+    
+    def activate():
+        registry.activate(version)
+        return registry.info()
+    
+    try:
+        # Revisa y recorre MODELS_PATH en disco: fuera del event loop
+        return await asyncio.to_thread(activate)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Versión del modelo no encontrada: {version}")
+
+
+@router.get("/cluster/profiles")
+async def get_cluster_profiles(
+    output_format: str = Query("json", alias="format", description="json o csv (tabla de arquetipos)"),
+    model_version: Optional[str] = Query(None, description="Versión del modelo (default: la activa)")
+):
+    """
+    Perfil de cada cluster combinado de todas las corridas (sin releer los resultados)
+
+    Promedios de montos y conteos (ingresos, edad, saldo_aportes, vlr_mora, ...) y
+    proporción (0-1) de asociados con cada producto, cada dummy (estrato_3, andina, ...)
+    y en mora. Se acumulan por bloque durante la predicción de /cluster y de los jobs.
+
+    Los perfiles son por versión del modelo: los clusters de versiones distintas no se mezclan.
+    
+    Returns:
+        Versión, corridas, asociados, última actualización y una fila por cluster (JSON o CSV)
+    """
+    if output_format not in ("json", "csv"):
+        raise HTTPException(status_code=400, detail="Formato no soportado: use json o csv")
+    store = get_profile_store()
+    if store is None:
+        raise HTTPException(status_code=503, detail="Los perfiles por cluster están desactivados")
+
+    # Sin versión: la activa (o la que se activaría) sin forzar la carga del modelo
+    def snapshot_of_version():
+        if model_version is not None:
+            return store.snapshot(model_version)
+        registry = get_model_registry()
+        return store.snapshot(registry.active_version or registry.resolve_version())
+    
+    try:
+        # El store puede leer su archivo de disco: fuera del event loop
+        snapshot = await asyncio.to_thread(snapshot_of_version)
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    if output_format == "json":
+        return snapshot
+
+    output = io.BytesIO()
+    pd.DataFrame(snapshot["clusters"]).to_csv(output, index=False, encoding='utf-8')
+    output.seek(0)
+    return StreamingResponse(
+        output,
+        media_type="text/csv",
+        headers={"Content-Disposition": "attachment; filename=cluster_profiles.csv"}
+    )
+
+
+@router.delete("/cluster/profiles", status_code=204, dependencies=[Depends(require_admin)])
+async def reset_cluster_profiles():
+    """
+    Reinicia los perfiles acumulados de todas las versiones (antes de reclusterizar toda la población)
+    
+    Requiere ADMIN_TOKEN (app/security.py).
+    """
+    store = get_profile_store()
+    if store is None:
+        raise HTTPException(status_code=503, detail="Los perfiles por cluster están desactivados")
+    # Borra el archivo de estado compartido: fuera del event loop
+    await asyncio.to_thread(store.reset)
+
+
+def _job_pipeline(context: JobContext) -> Iterator[bytes]:
+    """Procesa un job por etapas (parse, preprocess, predict, format y load opcional)"""
+    job = context.job
+    writer = get_writer(job["format"])
+    
+    # Memoria del presupuesto de admisión compartido con /cluster (espera a que quepa)
+    ticket = get_admission_controller().reserve(job["options"].get("cost_mb", 0.0))
+    try:
+        yield from _job_stages(context, writer)
+    finally:
+        ticket.release()
+
+
+def _job_stages(context: JobContext, writer: ResultWriter) -> Iterator[bytes]:
+    """Etapas del job con la memoria ya reservada"""
+    job = context.job
+    
+    with context.stage("parse"):
+        with context.open_input() as f:
+            df_original = read_upload(f, job["filename"])
+        context.update(rows_in=len(df_original))
+    
+    # Versión fijada al crear el job (o la activa al empezar a procesarlo)
+    model = get_clustering_model(job["options"].get("model_version"))
+    context.update(model_version=model.version)
+    
+    sharded = get_sharded_predictor(len(df_original))
+    if sharded is not None:
+        # En paralelo cada shard se preprocesa y predice de una vez: ambas etapas avanzan juntas
+        with context.stage("preprocess"), context.stage("predict"):
+            labels, _, df_completo = sharded.predict(df_original, model.version)
+    else:
+        with context.stage("preprocess"):
+            df_processed, _ = DataPreprocessor().process(df_original)
+        
+        with context.stage("predict"):
+            labels, _, df_completo = model.predict(df_processed)
+    
+    index_results(df_completo, labels, model)
+    profiles = new_run(model.version)
+    accumulate(profiles, df_completo, labels)
+    record_run(profiles)
+    
+    with context.stage("format"):
+        df_result = format_results(df_completo, labels)
+        data = writer.write(df_result) + writer.close()
+        context.update(rows_out=len(df_result))
+    
+    if job["options"].get("sink"):
+        with context.stage("load"):
+            context.update(rows_upserted=get_postgres_sink().write(df_result))
+    
+    yield data
+
+
+def _job_response(job: dict) -> dict:
+    job_id = job["job_id"]
+    return {
+        **job,
+        "status_url": f"/api/v1/cluster/jobs/{job_id}",
+        "result_url": f"/api/v1/cluster/jobs/{job_id}/result"
+    }
+
+
+def _get_job_or_404(job_id: str) -> dict:
+    """Registro del job (lectura del store: llamar con asyncio.to_thread)"""
+    job = get_job_manager().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job no encontrado: {job_id}")
+    return job
+
+
+@router.post("/cluster/jobs", status_code=202)
+async def create_cluster_job(
+    file: UploadFile = File(..., description="Archivo CSV o XLSX con datos de usuarios"),
+    output_format: Optional[str] = Query(
+        None, alias="format", description=f"Formato de salida: {', '.join(OUTPUT_FORMATS)}"
+    ),
+    load_db: bool = Query(False, alias="sink", description="Cargar el resultado en la tabla datos de Postgres"),
+    model_version: Optional[str] = Query(None, description="Versión fija del modelo (default: la activa)")
+):
+    """
+    Encola la clusterización de un archivo y devuelve el id del job
+    
+    Pensado para archivos que superan el timeout del API Gateway: el progreso se
+    consulta en GET /cluster/jobs/{job_id} y el archivo en .../result.
+    
+    Returns:
+        Registro del job (HTTP 202) con status_url y result_url (501 en Lambda)
+    """
+    if not JOBS_SUPPORTED:
+        raise HTTPException(
+            status_code=501,
+            detail="Los jobs asíncronos no están disponibles en Lambda: use el contenedor con uvicorn"
+        )
+    
+    filename = file.filename.lower()
+    if not (filename.endswith('.csv') or filename.endswith('.xlsx')):
+        raise HTTPException(
+            status_code=400,
+            detail="Formato de archivo no soportado. Use CSV o XLSX"
+        )
+    
+    await _validate_upload_or_422(file.file, filename)
+    
+    try:
+        # El header Accept aplica a esta respuesta (JSON): el formato del resultado va en format
+        job_format = negotiate_format(output_format)
+        if load_db:
+            get_postgres_sink()
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if model_version is not None:
+        try:
+            get_model_registry().path_of(model_version)
+        except KeyError:
+            raise HTTPException(status_code=404, detail=f"Versión del modelo no encontrada: {model_version}")
+    
+    # Un archivo que no cabría ni con el servicio vacío se rechaza al encolar (413)
+    cost_mb = estimate_cost_mb(file.file)
+    get_admission_controller().check_cost(cost_mb, "divida el archivo")
+    
+    stages = JOB_STAGES + ("load",) if load_db else JOB_STAGES
+    # Copiar la entrada al store y purgar jobs vencidos es I/O: fuera del event loop
+    job = await asyncio.to_thread(
+        lambda: get_job_manager().submit(
+            file.filename, file.file, job_format, _job_pipeline, stages=stages,
+            options={"sink": load_db, "model_version": model_version, "cost_mb": cost_mb}
+        )
+    )
+    return _job_response(job)
+
+
+@router.get("/cluster/jobs/{job_id}")
+async def get_cluster_job(job_id: str):
+    """
+    Estado de un job: etapa actual, progreso (0-1) y duración de cada etapa
+    
+    Etapas: parse, preprocess, predict, format (y load si se pidió sink=true)
+    """
+    return _job_response(await asyncio.to_thread(_get_job_or_404, job_id))
+
+
+@router.get("/cluster/jobs/{job_id}/result")
+async def get_cluster_job_result(job_id: str):
+    """
+    Descarga el resultado de un job terminado
+    
+    Returns:
+        Archivo en el formato solicitado al crear el job (409 si aún no termina)
+    """
+    job = await asyncio.to_thread(_get_job_or_404, job_id)
+    if job["status"] == FAILED:
+        raise HTTPException(status_code=409, detail=f"El job falló: {job['error']}")
+    if job["status"] != SUCCEEDED:
+        raise HTTPException(
+            status_code=409,
+            detail=f"El job aún no termina (estado: {job['status']}, etapa: {job['stage']})"
+        )
+    
+    result = await asyncio.to_thread(get_job_manager().store.open_result, job_id)
+    return StreamingResponse(
+        result,
+        media_type=OUTPUT_FORMATS[job["format"]][0],
+        headers=_download_headers(job["format"], job.get("model_version"))
+    )
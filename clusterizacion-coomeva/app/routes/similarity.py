@@ -0,0 +1,139 @@
+"""
+Búsqueda por arquetipo: asociados más parecidos a un asociado, un perfil o un cluster
+"""
+from fastapi import APIRouter, Body, HTTPException
+import asyncio
+import numpy as np
+import pandas as pd
+import logging
+from typing import Any, Dict, Optional
+
+from app.admission import AdmissionRejected, get_admission_controller
+from app.preprocessing import DataPreprocessor
+from app.prediction import get_clustering_model
+from app.records import get_record_extractor
+from app.similarity import SIMILARITY_ENABLED, SIMILARITY_MAX_K, get_similarity_index
+from app import metrics, startup
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+
+def _profile_features(profile: Dict[str, Any], model) -> np.ndarray:
+    """
+    Features sin escalar de un registro crudo (mismas columnas del archivo de entrada)
+
+    Raises:
+        ValueError: Si al perfil le faltan valores para alguna feature del modelo
+    """
+    feature_names = [str(c) for c in model.scaler.feature_names_in_]
+    extractor = get_record_extractor(feature_names)
+    if extractor.supported:
+        X, validos = extractor.extract([profile])
+        if not validos[0]:
+            raise ValueError("El perfil tiene valores faltantes en las features del modelo")
+        return X[:1]
+
+    df_processed, _ = DataPreprocessor().process(pd.DataFrame.from_records([profile]))
+    X = df_processed[feature_names].to_numpy(dtype=np.float64)
+    if np.isnan(X).any():
+        raise ValueError("El perfil tiene valores faltantes en las features del modelo")
+    return X
+
+
+def _search(query_type: str, idunico: Optional[str], profile: Optional[Dict[str, Any]],
+            cluster: Optional[int], k: int):
+    """Resuelve la consulta y busca los k vecinos: (cluster de la consulta, resultados, asociados indexados)"""
+    # El índice sigue a la versión activa: pedirlo puede cargar el modelo
+    index = get_similarity_index()
+    # En Lambda (sin siembra en el init) la primera consulta siembra el índice
+    startup.seed_similarity_index()
+    with metrics.stage("query"):
+        if query_type == "idunico":
+            try:
+                query, query_cluster = index.member(idunico)
+            except KeyError:
+                raise HTTPException(status_code=404, detail=f"Asociado '{idunico}' no está en el índice")
+        elif query_type == "cluster":
+            try:
+                query, query_cluster = index.cluster_center(cluster), cluster
+            except KeyError:
+                raise HTTPException(status_code=404, detail=f"El cluster {cluster} no tiene asociados indexados")
+        else:
+            # El modelo del índice (no necesariamente el activo si se cambió de versión)
+            model = get_clustering_model(index.version)
+            X = _profile_features(profile, model)
+            _, labels = model.predict_features(X)
+            query, query_cluster = index.scale_features(X)[0], int(labels[0])
+
+    with metrics.stage("search", rows=len(index)):
+        return query_cluster, index.search(query, k, exclude=idunico), len(index)
+
+
+@router.post("/similar")
+async def similar_members(
+    idunico: Optional[str] = Body(None, description="Asociado de referencia (ya clusterizado)"),
+    profile: Optional[Dict[str, Any]] = Body(None, description="Registro crudo con las columnas del archivo"),
+    cluster: Optional[int] = Body(None, description="Cluster: asociados más cercanos a su centro"),
+    k: int = Body(10, description="Cantidad de asociados a devolver")
+):
+    """
+    Asociados más parecidos en el espacio de features escalado del modelo
+
+    Se consulta con exactamente uno de idunico, profile o cluster. La búsqueda
+    se hace sobre el índice en memoria de los asociados ya clusterizados por el
+    servicio (y los de la tabla datos si se sembró al arrancar).
+
+    Args:
+        idunico: IdUnico de un asociado indexado (se excluye de los resultados)
+        profile: Registro crudo (Fecha_Ingreso, Ingresos, ...), como en /cluster/records
+        cluster: Cluster cuyo centro (promedio de sus asociados) se usa como arquetipo
+        k: Vecinos a devolver (máximo SIMILARITY_MAX_K)
+
+    Returns:
+        Consulta resuelta (tipo y cluster) y asociados con idunico, cluster y distancia
+    """
+    given = [name for name, value in (("idunico", idunico), ("profile", profile), ("cluster", cluster))
+             if value is not None]
+    if len(given) != 1:
+        raise HTTPException(status_code=400, detail="Indique exactamente uno de: idunico, profile, cluster")
+    if not 1 <= k <= SIMILARITY_MAX_K:
+        raise HTTPException(status_code=400, detail=f"k debe estar entre 1 y {SIMILARITY_MAX_K}")
+
+    if not SIMILARITY_ENABLED:
+        raise HTTPException(status_code=503, detail="La búsqueda por similitud está desactivada")
+
+    query_type = given[0]
+    # Consulta y búsqueda (preprocesamiento, predicción, distancias) en el pool de admisión
+    admission = get_admission_controller()
+    ticket = admission.admit()
+    try:
+        query_cluster, results, n_indexed = await admission.run(
+            _search, query_type, idunico, profile, cluster, k
+        )
+    except (HTTPException, AdmissionRejected):
+        raise
+    except ValueError as e:
+        logger.error(f"Error de validación: {e}")
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error en la búsqueda por similitud: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Error en la búsqueda: {str(e)}")
+    finally:
+        ticket.release()
+
+    return {
+        "query": {"type": query_type, "cluster": query_cluster},
+        "n_indexed": n_indexed,
+        "results": results
+    }
+
+
+@router.get("/similar/index")
+async def similarity_index_info():
+    """Asociados indexados por cluster y memoria del índice (de este proceso)"""
+    if not SIMILARITY_ENABLED:
+        raise HTTPException(status_code=503, detail="La búsqueda por similitud está desactivada")
+    # get_similarity_index puede cargar el modelo activo: fuera del event loop
+    return await asyncio.to_thread(lambda: get_similarity_index().stats())
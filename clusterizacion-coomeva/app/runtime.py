@@ -0,0 +1,221 @@
+"""
+Runtime de inferencia solo con NumPy (sin scikit-learn en el camino de predicción)
+
+Toma los arrays del modelo (media y escala del scaler, matriz de referencia del
+KNN, embeddings UMAP y centroides de KMeans) y recorre el pipeline completo por
+bloques: cada bloque se escala justo antes de su producto contra la matriz de
+referencia, se interpola en UMAP y se asigna a su centroide, sin matrices
+intermedias del tamaño del archivo ni validaciones de sklearn por llamada.
+
+Verificación contra los modelos pickle de sklearn (mismos clusters, fila a fila):
+    python -m app.runtime verify --models-path models --data datos_usuarios.csv
+"""
+import argparse
+import json
+import logging
+import sys
+import time
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from app.artifacts import ArrayKMeans, BruteForceKNN
+
+logger = logging.getLogger(__name__)
+
+
+def weighted_embeddings(distances: np.ndarray, indices: np.ndarray, embeddings: np.ndarray) -> np.ndarray:
+    """
+    Promedio ponderado por inverso de la distancia de los embeddings vecinos
+
+    Args:
+        distances: Distancias a los vecinos (shape: [n_chunk, k])
+        indices: Índices de los vecinos en el entrenamiento (shape: [n_chunk, k])
+        embeddings: Coordenadas UMAP del entrenamiento (shape: [n_samples, 2])
+
+    Returns:
+        Coordenadas UMAP del bloque (shape: [n_chunk, 2])
+    """
+    # Puntos más cercanos tienen más influencia (+epsilon para evitar div/0)
+    weights = 1.0 / (distances.astype(np.float64, copy=False) + 1e-10)
+    weights /= weights.sum(axis=1, keepdims=True)
+
+    # [n_chunk, k] × [n_chunk, k, 2] -> [n_chunk, 2]
+    return np.einsum('ij,ijk->ik', weights, embeddings[indices])
+
+
+class ArrayRuntime:
+    """
+    Escalado + KNN + interpolación UMAP + KMeans por bloques sobre arrays planos
+
+    Args:
+        mean, scale: Parámetros del StandardScaler
+        fit_X: Matriz de referencia escalada del KNN (shape: [n_samples, n_features])
+        embeddings: Coordenadas UMAP de la referencia (shape: [n_samples, 2])
+        centers: Centroides de KMeans (shape: [n_clusters, 2])
+        n_neighbors: Vecinos de la interpolación
+        chunk_size: Filas por bloque
+        fit_sq_norms: Normas al cuadrado de fit_X ya calculadas (None = calcularlas)
+    """
+
+    def __init__(self, mean: np.ndarray, scale: np.ndarray, fit_X: np.ndarray, embeddings: np.ndarray,
+                 centers: np.ndarray, n_neighbors: int, chunk_size: int,
+                 fit_sq_norms: Optional[np.ndarray] = None):
+        self.mean = np.asarray(mean, dtype=np.float64)
+        self.scale = np.asarray(scale, dtype=np.float64)
+        self.knn = BruteForceKNN(np.asarray(fit_X, dtype=np.float64), sq_norms=fit_sq_norms)
+        self.embeddings = np.asarray(embeddings, dtype=np.float64)
+        self.kmeans = ArrayKMeans(np.asarray(centers, dtype=np.float64))
+        # Ajustar k si hay pocas muestras en entrenamiento
+        self.n_neighbors = min(n_neighbors, len(self.embeddings) - 1)
+        self.chunk_size = chunk_size
+
+    @classmethod
+    def from_model(cls, model) -> "ArrayRuntime":
+        """Runtime con los arrays de un ClusteringModel ya cargado (pickle o mmap)"""
+        n_features = len(model.scaler.feature_names_in_)
+        mean = model.scaler.mean_ if model.scaler.mean_ is not None else np.zeros(n_features)
+        scale = model.scaler.scale_ if model.scaler.scale_ is not None else np.ones(n_features)
+        return cls(
+            mean, scale, model.exact_knn_index._fit_X, model.umap_embeddings,
+            model.kmeans_model.cluster_centers_, model.n_neighbors, model.chunk_size,
+            # Mismas normas que el índice exacto (BruteForceKNN): sin un segundo array por proceso
+            fit_sq_norms=getattr(model.exact_knn_index, '_fit_sq_norms', None)
+        )
+
+    def predict(self, X: np.ndarray) -> Tuple[np.ndarray, np.ndarray, Dict[str, float]]:
+        """
+        Embeddings y clusters de una matriz de features
+
+        Args:
+            X: Features en el orden del scaler (sin NaN)
+
+        Returns:
+            Tuple (X_umap, labels, segundos por etapa: scale, knn, kmeans)
+        """
+        X = np.asarray(X)
+        X_umap = np.empty((len(X), self.embeddings.shape[1]), dtype=np.float64)
+        labels = np.empty(len(X), dtype=np.int32)
+        seconds = {"scale": 0.0, "knn": 0.0, "kmeans": 0.0}
+
+        for start in range(0, len(X), self.chunk_size):
+            stop = min(start + self.chunk_size, len(X))
+            t0 = time.perf_counter()
+            # Mismas operaciones que StandardScaler.transform (resta y división)
+            chunk = np.array(X[start:stop], dtype=np.float64)
+            chunk -= self.mean
+            chunk /= self.scale
+            t1 = time.perf_counter()
+            distances, indices = self.knn.kneighbors(chunk, n_neighbors=self.n_neighbors)
+            X_umap[start:stop] = weighted_embeddings(distances, indices, self.embeddings)
+            t2 = time.perf_counter()
+            labels[start:stop] = self.kmeans.predict(X_umap[start:stop])
+            t3 = time.perf_counter()
+            seconds["scale"] += t1 - t0
+            seconds["knn"] += t2 - t1
+            seconds["kmeans"] += t3 - t2
+
+        return X_umap, labels, seconds
+
+
+def verify_runtime(reference, X: np.ndarray, artifacts_path: Optional[str] = None) -> Dict:
+    """
+    Compara el runtime NumPy contra el pipeline de sklearn
+
+    Args:
+        reference: ClusteringModel cargado desde los pickles con inference_runtime="sklearn"
+        X: Features sin escalar (en el orden del scaler)
+        artifacts_path: Carpeta con manifest.json (default: los arrays de los pickles)
+
+    Returns:
+        Diccionario con filas, clusters distintos y error máximo de los embeddings
+    """
+    from app.artifacts import load_artifacts
+
+    ref_umap, ref_labels = reference._predict_features(X)
+
+    if artifacts_path:
+        artifacts = load_artifacts(artifacts_path)
+        runtime = ArrayRuntime(
+            artifacts['scaler'].mean_, artifacts['scaler'].scale_, artifacts['knn_index']._fit_X,
+            artifacts['umap_embeddings'], artifacts['kmeans_model'].cluster_centers_,
+            reference.n_neighbors, reference.chunk_size
+        )
+    else:
+        runtime = ArrayRuntime.from_model(reference)
+    X_umap, labels, _ = runtime.predict(X)
+
+    # Empate exacto entre el vecino k y el k+1: el vecino elegido depende del orden
+    # de las operaciones (sklearn tampoco da el mismo resultado en lote y por fila)
+    mismatches = np.flatnonzero(labels != ref_labels)
+    n_ties = 0
+    if len(mismatches):
+        chunk = (np.asarray(X[mismatches], dtype=np.float64) - runtime.mean) / runtime.scale
+        distances, _ = runtime.knn.kneighbors(chunk, n_neighbors=runtime.n_neighbors + 1)
+        k = runtime.n_neighbors
+        n_ties = int(np.isclose(distances[:, k], distances[:, k - 1], rtol=1e-12, atol=0.0).sum())
+
+    return {
+        'n_rows': int(len(X)),
+        'label_mismatches': int(len(mismatches)),
+        'mismatches_at_neighbor_ties': n_ties,
+        'max_embedding_error': float(np.abs(X_umap - ref_umap).max()) if len(X) else 0.0,
+    }
+
+
+def _features_from_upload(feature_names, data_path: str) -> np.ndarray:
+    """Features sin escalar de un archivo crudo, preprocesado como en /cluster"""
+    from app.ingestion import read_upload
+    from app.preprocessing import DataPreprocessor
+
+    with open(data_path, 'rb') as f:
+        df = read_upload(f, data_path)
+    df_processed, _ = DataPreprocessor().process(df)
+    return df_processed[list(feature_names)].astype(np.float64).dropna().to_numpy()
+
+
+def main(argv=None) -> int:
+    from app.prediction import ClusteringModel
+
+    parser = argparse.ArgumentParser(description="Runtime de inferencia NumPy")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    verify_parser = subparsers.add_parser('verify', help="Mismos clusters que los modelos pickle de sklearn")
+    verify_parser.add_argument('--models-path', default="models", help="Carpeta con los pickles")
+    verify_parser.add_argument('--artifacts-path', default=None, help="Carpeta con manifest.json a verificar")
+    verify_parser.add_argument('--data', default=None, help="CSV/XLSX crudo para la verificación")
+    verify_parser.add_argument('--n-queries', type=int, default=20000, help="Consultas sintéticas si no hay --data")
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.WARNING, format="%(message)s")
+
+    # Referencia: pipeline de sklearn sobre los pickles, sin caché
+    model = ClusteringModel(args.models_path, models_format="pickle", inference_runtime="sklearn")
+    model.cache = None
+    if args.data:
+        X = _features_from_upload(model.scaler.feature_names_in_, args.data)
+    else:
+        # Puntos entre pares de referencia (no en el punto medio, que deja a ambos
+        # extremos a la misma distancia), llevados a la escala original
+        fit_X = np.asarray(model.exact_knn_index._fit_X)
+        rng = np.random.default_rng(0)
+        a, b = rng.integers(0, len(fit_X), (2, args.n_queries))
+        t = rng.uniform(0.2, 0.4, (args.n_queries, 1))
+        X_scaled = fit_X[a] + t * (fit_X[b] - fit_X[a])
+        X = X_scaled * model.scaler.scale_ + model.scaler.mean_
+
+    report = verify_runtime(model, X, args.artifacts_path)
+    print(json.dumps(report, indent=2))
+    untied = report['label_mismatches'] - report['mismatches_at_neighbor_ties']
+    if untied:
+        print(f"❌ {untied} filas con cluster distinto al de sklearn")
+        return 1
+    if report['label_mismatches']:
+        print(f"⚠️  {report['label_mismatches']} filas distintas, todas con empate exacto en el vecino k")
+        return 0
+    print("✓ Mismos clusters que sklearn en todas las filas")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
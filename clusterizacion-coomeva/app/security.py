@@ -0,0 +1,53 @@
+"""
+Autorización de los endpoints administrativos
+
+Activar una versión del modelo o reiniciar los perfiles cambia el estado de
+todos los workers, así que esos endpoints exigen ADMIN_TOKEN en el header
+Authorization (Bearer) o X-Admin-Token. Un header personalizado no lo envía el
+navegador por su cuenta, de modo que el CORS abierto no permite usarlos desde
+otro origen. Sin ADMIN_TOKEN configurado los endpoints quedan deshabilitados
+(403) y el cambio de versión se hace con el CLI del registro.
+"""
+import hmac
+import logging
+import os
+from typing import Optional
+
+from fastapi import Header, HTTPException
+
+logger = logging.getLogger(__name__)
+
+# Token de los endpoints administrativos (vacío = deshabilitados)
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
+
+def _bearer(authorization: Optional[str]) -> Optional[str]:
+    if authorization and authorization[:7].lower() == "bearer ":
+        return authorization[7:].strip()
+    return None
+
+
+async def require_admin(
+    authorization: Optional[str] = Header(None),
+    x_admin_token: Optional[str] = Header(None)
+) -> None:
+    """
+    Dependencia de FastAPI para los endpoints administrativos
+
+    Raises:
+        HTTPException: 403 si ADMIN_TOKEN no está configurado, 401 si el token falta o no coincide
+    """
+    if not ADMIN_TOKEN:
+        raise HTTPException(
+            status_code=403,
+            detail="Endpoint administrativo deshabilitado: configure ADMIN_TOKEN "
+                   "(o use python -m app.registry para activar versiones)"
+        )
+    token = _bearer(authorization) or x_admin_token
+    if not token or not hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode()):
+        logger.warning("⚠️  Request administrativa rechazada: token ausente o inválido")
+        raise HTTPException(
+            status_code=401,
+            detail="Token administrativo ausente o inválido",
+            headers={"WWW-Authenticate": "Bearer"}
+        )
@@ -0,0 +1,268 @@
+"""
+Índice en memoria de asociados clusterizados para la búsqueda por similitud
+
+Guarda el vector de features escalado (el mismo espacio del KNN del modelo),
+el IdUnico y el cluster de cada asociado que pasa por el servicio: cada
+archivo o lote clusterizado actualiza el índice. Con DATABASE_URL el índice se
+puede sembrar al arrancar desde la tabla `datos` (población completa). Las
+consultas son una búsqueda exacta por fuerza bruta (un producto matriz-vector
+sobre todo el índice), sin consultar la base de datos.
+
+El índice es por proceso: con varios workers de uvicorn cada uno tiene el suyo.
+Es de la versión activa del modelo: al activarse otra versión se reconstruye
+vacío (los vectores y clusters de otra versión no son comparables) y las
+predicciones fijadas a otra versión con ?model_version= no lo actualizan.
+"""
+import logging
+import os
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Índice activo, máximo de vecinos por consulta y siembra desde la tabla `datos` al arrancar
+SIMILARITY_ENABLED = os.getenv("SIMILARITY_ENABLED", "true").lower() in ("1", "true", "yes")
+SIMILARITY_MAX_K = int(os.getenv("SIMILARITY_MAX_K", "100"))
+SIMILARITY_SEED_FROM_DB = os.getenv("SIMILARITY_SEED_FROM_DB", "true").lower() in ("1", "true", "yes")
+
+# Candidatos por vecino pedido que se recalculan en float64 antes del orden final
+CANDIDATE_FACTOR = 4
+
+# IdUnico que no identifican a un asociado (nulos convertidos a texto)
+_MISSING_IDS = frozenset(("", "nan", "None", "<NA>"))
+
+
+class SimilarityIndex:
+    """
+    Vectores escalados de asociados con upsert por IdUnico y búsqueda top-k
+
+    Los vectores se guardan en float32 (la mitad de memoria; las distancias se
+    reportan con 6 cifras significativas de sobra para ordenar vecinos).
+
+    Args:
+        feature_names: Features del modelo en orden (scaler.feature_names_in_)
+        mean, scale: Parámetros del StandardScaler
+        version: Versión del modelo cuyos clusters guarda el índice
+    """
+
+    def __init__(self, feature_names: Sequence[str], mean: np.ndarray, scale: np.ndarray, capacity: int = 1024,
+                 version: Optional[str] = None):
+        self.feature_names = [str(c) for c in feature_names]
+        self.version = version
+        self.mean = np.asarray(mean, dtype=np.float64)
+        self.scale = np.asarray(scale, dtype=np.float64)
+        n_features = len(self.feature_names)
+        self._vectors = np.empty((capacity, n_features), dtype=np.float32)
+        self._sq_norms = np.empty(capacity, dtype=np.float32)
+        self._clusters = np.empty(capacity, dtype=np.int32)
+        self._ids: List[str] = []
+        self._row_of: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_model(cls, model) -> "SimilarityIndex":
+        n_features = len(model.scaler.feature_names_in_)
+        mean = model.scaler.mean_ if model.scaler.mean_ is not None else np.zeros(n_features)
+        scale = model.scaler.scale_ if model.scaler.scale_ is not None else np.ones(n_features)
+        return cls(model.scaler.feature_names_in_, mean, scale, version=model.version)
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def scale_features(self, X: np.ndarray) -> np.ndarray:
+        """Features sin escalar -> espacio del índice (float32)"""
+        X = np.array(X, dtype=np.float64, ndmin=2)
+        X -= self.mean
+        X /= self.scale
+        return X.astype(np.float32)
+
+    def _grow(self, size: int):
+        """Duplica la capacidad hasta que quepan `size` filas (copia las filas ocupadas)"""
+        capacity = len(self._vectors)
+        if size <= capacity:
+            return
+        while capacity < size:
+            capacity *= 2
+        n_rows = len(self._ids)
+        for name in ('_vectors', '_sq_norms', '_clusters'):
+            old = getattr(self, name)
+            new = np.empty((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:n_rows] = old[:n_rows]
+            setattr(self, name, new)
+
+    def upsert(self, ids: Sequence, X: np.ndarray, clusters: np.ndarray) -> int:
+        """
+        Agrega o actualiza asociados (el último gana si un IdUnico se repite)
+
+        Args:
+            ids: IdUnico de cada fila
+            X: Features sin escalar en el orden del modelo (sin NaN)
+            clusters: Cluster asignado a cada fila
+
+        Returns:
+            Filas indexadas (se omiten las que no tienen IdUnico)
+        """
+        keep = [j for j, id_unico in enumerate(ids) if str(id_unico) not in _MISSING_IDS]
+        if not keep:
+            return 0
+        vectors = self.scale_features(np.asarray(X)[keep])
+        sq_norms = np.einsum('ij,ij->i', vectors, vectors)
+        clusters = np.asarray(clusters)[keep]
+
+        with self._lock:
+            new_ids = {str(ids[j]) for j in keep} - self._row_of.keys()
+            self._grow(len(self._ids) + len(new_ids))
+            rows = np.empty(len(keep), dtype=np.intp)
+            for n, j in enumerate(keep):
+                id_unico = str(ids[j])
+                row = self._row_of.get(id_unico)
+                if row is None:
+                    row = self._row_of[id_unico] = len(self._ids)
+                    self._ids.append(id_unico)
+                rows[n] = row
+            self._vectors[rows] = vectors
+            self._sq_norms[rows] = sq_norms
+            self._clusters[rows] = clusters
+        return len(keep)
+
+    def member(self, id_unico: str) -> Tuple[np.ndarray, int]:
+        """Vector escalado y cluster de un asociado indexado (KeyError si no está)"""
+        with self._lock:
+            row = self._row_of[str(id_unico)]
+            return self._vectors[row].copy(), int(self._clusters[row])
+
+    def cluster_center(self, cluster: int) -> np.ndarray:
+        """Centro (promedio escalado) de los asociados indexados de un cluster"""
+        with self._lock:
+            members = self._clusters[:len(self._ids)] == cluster
+            if not members.any():
+                raise KeyError(cluster)
+            return self._vectors[:len(self._ids)][members].mean(axis=0, dtype=np.float64).astype(np.float32)
+
+    def search(self, query: np.ndarray, k: int = 10, exclude: Optional[str] = None) -> List[Dict]:
+        """
+        Asociados más cercanos a un vector escalado (distancia euclidiana)
+
+        Args:
+            query: Vector en el espacio del índice
+            k: Vecinos a devolver
+            exclude: IdUnico a excluir (el propio asociado en una búsqueda por id)
+
+        Returns:
+            Lista ordenada por distancia con idunico, cluster y distance
+        """
+        query = np.asarray(query, dtype=np.float32).ravel()
+        with self._lock:
+            size = len(self._ids)
+            vectors, clusters = self._vectors[:size], self._clusters[:size]
+            # Candidatos con ||y||² - 2·x·y (el término de la consulta es constante)
+            sq_dist = vectors @ query
+            sq_dist *= -2.0
+            sq_dist += self._sq_norms[:size]
+            excluded = self._row_of.get(str(exclude)) if exclude is not None else None
+            if excluded is not None:
+                sq_dist[excluded] = np.inf
+            k = min(k, size - (excluded is not None))
+            if k <= 0:
+                return []
+            # Más candidatos que k: la expansión en float32 pierde precisión con normas grandes
+            n_candidates = min(CANDIDATE_FACTOR * k, size)
+            top = np.argpartition(sq_dist, n_candidates - 1)[:n_candidates] if n_candidates < size else np.arange(size)
+            top = top[np.isfinite(sq_dist[top])]
+
+            # Distancias exactas de los candidatos y orden final
+            diff = vectors[top].astype(np.float64) - query
+            distances = np.sqrt(np.einsum('ij,ij->i', diff, diff))
+            order = np.argsort(distances, kind='stable')[:k]
+            return [
+                {"idunico": self._ids[top[j]], "cluster": int(clusters[top[j]]), "distance": float(distances[j])}
+                for j in order
+            ]
+
+    def stats(self) -> Dict:
+        with self._lock:
+            size = len(self._ids)
+            return {
+                "model_version": self.version,
+                "members": size,
+                "clusters": {int(c): int(n) for c, n in zip(*np.unique(self._clusters[:size], return_counts=True))},
+                "memory_mb": round(self._vectors.nbytes / (1024 * 1024), 1),
+            }
+
+
+def seed_from_db(index: SimilarityIndex, sink) -> int:
+    """
+    Carga en el índice los asociados de la tabla `datos`
+
+    Las columnas de la tabla tienen los tipos de salida (montos enteros, nulos
+    como 0), por lo que los vectores pueden diferir levemente de los calculados
+    desde el archivo original; las siguientes cargas los reemplazan.
+
+    Returns:
+        Asociados indexados
+    """
+    from app.output_plan import normalize_column_name
+
+    columns = [normalize_column_name(name) for name in index.feature_names]
+    df = sink.read_columns(['idunico', 'cluster'] + columns)
+    if df.empty:
+        return 0
+    X = df[columns].astype(np.float64).to_numpy()
+    valid = ~np.isnan(X).any(axis=1) & df['cluster'].notna().to_numpy()
+    clusters = pd.to_numeric(df['cluster'], errors='coerce').to_numpy()[valid].astype(np.int32)
+    return index.upsert(df['idunico'].astype(str).to_numpy()[valid], X[valid], clusters)
+
+
+# Índice global (singleton)
+_similarity_index: Optional[SimilarityIndex] = None
+_similarity_index_lock = threading.Lock()
+
+
+def get_similarity_index() -> Optional[SimilarityIndex]:
+    """Índice de similitud del proceso para la versión activa del modelo (None si SIMILARITY_ENABLED=false)"""
+    global _similarity_index
+    if not SIMILARITY_ENABLED:
+        return None
+    from app.prediction import get_clustering_model
+    model = get_clustering_model()
+    index = _similarity_index
+    if index is None or index.version != model.version:
+        with _similarity_index_lock:
+            if _similarity_index is None or _similarity_index.version != model.version:
+                if _similarity_index is not None:
+                    logger.info(
+                        f"Modelo activo cambió ({_similarity_index.version} -> {model.version}): "
+                        f"índice de similitud reiniciado"
+                    )
+                _similarity_index = SimilarityIndex.from_model(model)
+            index = _similarity_index
+    return index
+
+
+def index_members(ids: Sequence, X: np.ndarray, labels: np.ndarray, model=None) -> int:
+    """Agrega asociados clusterizados al índice (un error no afecta la request)"""
+    index = get_similarity_index()
+    if index is None or len(labels) == 0:
+        return 0
+    if model is not None and model.version != index.version:
+        # Predicción fijada a otra versión: sus clusters no son los del índice
+        return 0
+    try:
+        return index.upsert(ids, X, labels)
+    except Exception as e:
+        logger.warning(f"⚠️  No se pudo actualizar el índice de similitud: {e}")
+        return 0
+
+
+def index_results(df_completo: pd.DataFrame, labels: np.ndarray, model=None) -> int:
+    """Agrega el resultado de ClusteringModel.predict al índice (filas válidas y sus clusters)"""
+    index = get_similarity_index()
+    if index is None or len(labels) == 0 or 'IdUnico' not in df_completo.columns:
+        return 0
+    if model is not None and model.version != index.version:
+        return 0
+    X = df_completo[index.feature_names].to_numpy(dtype=np.float64)
+    return index_members(df_completo['IdUnico'].astype(str).to_numpy(), X, labels, model)
@@ -0,0 +1,185 @@
+"""
+Carga de resultados en la tabla `datos` de Postgres (Supabase)
+
+Escribe el DataFrame formateado directamente en la base de datos con
+COPY FROM STDIN (CSV) sobre una tabla temporal y un único
+INSERT ... ON CONFLICT (idunico) DO UPDATE, usando un pool de conexiones.
+Reemplaza la inserción fila por fila desde n8n. psycopg se importa solo si
+DATABASE_URL está configurada.
+"""
+import io
+import logging
+import os
+import threading
+import time
+from typing import List, Optional
+
+import pandas as pd
+
+from app.output_plan import get_output_plan
+
+logger = logging.getLogger(__name__)
+
+# Conexión (vacía = carga desactivada), tabla destino, tamaño del pool y filas por bloque de COPY
+DATABASE_URL = os.getenv("DATABASE_URL", "")
+DB_SINK_TABLE = os.getenv("DB_SINK_TABLE", "public.datos")
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "1"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "4"))
+DB_COPY_BATCH_ROWS = int(os.getenv("DB_COPY_BATCH_ROWS", "50000"))
+
+KEY_COLUMN = "idunico"
+STAGE_TABLE = "datos_stage"
+
+
+class PostgresSink:
+    """
+    Upsert masivo de resultados por idunico
+
+    Args:
+        dsn: Cadena de conexión de Postgres
+        table: Tabla destino (esquema.tabla)
+        min_size: Conexiones mínimas del pool
+        max_size: Conexiones máximas del pool
+        batch_rows: Filas por bloque de COPY (acota la memoria del buffer CSV)
+    """
+
+    def __init__(self, dsn: str, table: str = DB_SINK_TABLE, min_size: int = DB_POOL_MIN_SIZE,
+                 max_size: int = DB_POOL_MAX_SIZE, batch_rows: int = DB_COPY_BATCH_ROWS):
+        try:
+            from psycopg import sql
+            from psycopg_pool import ConnectionPool
+        except ImportError as e:
+            raise RuntimeError("La carga en Postgres requiere psycopg y psycopg-pool instalados") from e
+
+        self.sql = sql
+        self.table = sql.Identifier(*table.split("."))
+        self.table_name = table
+        self.batch_rows = batch_rows
+        self.schema_columns = set(get_output_plan().schema)
+        self.pool = ConnectionPool(dsn, min_size=min_size, max_size=max_size, open=True,
+                                   name="coomeva-sink")
+
+    def _columns(self, df_result: pd.DataFrame) -> List[str]:
+        columns = [col for col in df_result.columns if col in self.schema_columns]
+        skipped = [col for col in df_result.columns if col not in self.schema_columns]
+        if skipped:
+            logger.warning(f"Columnas fuera del esquema, no se cargan: {skipped}")
+        if KEY_COLUMN not in columns:
+            raise ValueError(f"El resultado no tiene la columna clave '{KEY_COLUMN}'")
+        return columns
+
+    def _statements(self, columns: List[str]):
+        sql = self.sql
+        stage = sql.Identifier(STAGE_TABLE)
+        column_list = sql.SQL(", ").join(sql.Identifier(col) for col in columns)
+        updates = sql.SQL(", ").join(
+            sql.SQL("{col} = EXCLUDED.{col}").format(col=sql.Identifier(col))
+            for col in columns if col != KEY_COLUMN
+        )
+        create = sql.SQL(
+            "CREATE TEMP TABLE IF NOT EXISTS {stage} (LIKE {table} INCLUDING DEFAULTS) ON COMMIT DELETE ROWS"
+        ).format(stage=stage, table=self.table)
+        copy = sql.SQL("COPY {stage} ({columns}) FROM STDIN (FORMAT csv)").format(
+            stage=stage, columns=column_list
+        )
+        upsert = sql.SQL(
+            "INSERT INTO {table} ({columns}) SELECT {columns} FROM {stage} "
+            "ON CONFLICT ({key}) DO UPDATE SET {updates}"
+        ).format(table=self.table, columns=column_list, stage=stage,
+                 key=sql.Identifier(KEY_COLUMN), updates=updates)
+        return create, copy, upsert
+
+    def write(self, df_result: pd.DataFrame) -> int:
+        """
+        Inserta o actualiza las filas del resultado en una sola transacción
+
+        Args:
+            df_result: DataFrame formateado (nombres y tipos de la tabla datos)
+
+        Returns:
+            Filas insertadas o actualizadas
+        """
+        if df_result.empty:
+            return 0
+
+        columns = self._columns(df_result)
+        df_load = df_result[columns]
+        # Un mismo idunico dos veces en un INSERT ... ON CONFLICT falla: gana la última fila
+        df_load = df_load[df_load[KEY_COLUMN] != 'nan'].drop_duplicates(KEY_COLUMN, keep='last')
+        n_dropped = len(df_result) - len(df_load)
+        if n_dropped:
+            logger.warning(f"  ⚠️  {n_dropped} filas sin idunico o duplicadas omitidas en la carga")
+
+        create, copy_statement, upsert = self._statements(columns)
+        started = time.perf_counter()
+        buffer = io.BytesIO()
+        with self.pool.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(create)
+                with cur.copy(copy_statement) as copy:
+                    for start in range(0, len(df_load), self.batch_rows):
+                        df_load.iloc[start:start + self.batch_rows].to_csv(
+                            buffer, index=False, header=False, encoding='utf-8'
+                        )
+                        copy.write(buffer.getbuffer())
+                        buffer.seek(0)
+                        buffer.truncate()
+                cur.execute(upsert)
+                n_rows = cur.rowcount
+        # pool.connection() hace commit al salir sin errores (y rollback si falla)
+
+        logger.info(
+            f"✓ {n_rows} filas cargadas en {self.table_name} en {time.perf_counter() - started:.2f}s"
+        )
+        return n_rows
+
+    def read_columns(self, columns: List[str]) -> pd.DataFrame:
+        """
+        Lee columnas de la tabla destino con COPY TO STDOUT (CSV)
+
+        Args:
+            columns: Columnas a leer (nombres de la tabla)
+
+        Returns:
+            DataFrame con una fila por registro de la tabla (BOOLEAN como bool)
+        """
+        sql = self.sql
+        missing = [col for col in columns if col not in self.schema_columns]
+        if missing:
+            raise ValueError(f"Columnas fuera del esquema: {missing}")
+        copy_statement = sql.SQL("COPY (SELECT {columns} FROM {table}) TO STDOUT (FORMAT csv, HEADER)").format(
+            columns=sql.SQL(", ").join(sql.Identifier(col) for col in columns), table=self.table
+        )
+        buffer = io.BytesIO()
+        with self.pool.connection() as conn:
+            with conn.cursor() as cur:
+                with cur.copy(copy_statement) as copy:
+                    for data in copy:
+                        buffer.write(data)
+        buffer.seek(0)
+        return pd.read_csv(buffer, dtype={KEY_COLUMN: str}, true_values=['t'], false_values=['f'])
+
+    def close(self):
+        self.pool.close()
+
+
+# Instancia global del sink (se crea al primer uso)
+_postgres_sink: Optional[PostgresSink] = None
+_postgres_sink_lock = threading.Lock()
+
+
+def get_postgres_sink() -> PostgresSink:
+    """
+    Obtiene el sink de Postgres configurado con DATABASE_URL
+
+    Raises:
+        ValueError: Si DATABASE_URL no está configurada
+    """
+    global _postgres_sink
+    if not DATABASE_URL:
+        raise ValueError("La carga en base de datos no está configurada (DATABASE_URL)")
+    with _postgres_sink_lock:
+        if _postgres_sink is None:
+            logger.info(f"Inicializando pool de conexiones a Postgres ({DB_POOL_MIN_SIZE}-{DB_POOL_MAX_SIZE})")
+            _postgres_sink = PostgresSink(DATABASE_URL)
+    return _postgres_sink
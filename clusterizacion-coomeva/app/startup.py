@@ -0,0 +1,186 @@
+"""
+Arranque del servicio: warm-up del modelo y estado de readiness
+
+El modelo se carga y se ejercita con una predicción de prueba durante el init
+de Lambda o el lifespan de uvicorn, para que la primera request no pague la
+carga. /health reporta el estado real y los tiempos medidos de cada fase.
+"""
+import logging
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Cargar y calentar el modelo al arrancar (false = carga perezosa en la primera request)
+WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "true").lower() in ("1", "true", "yes")
+
+# En Lambda el proceso se congela entre invocaciones: nada de trabajo en segundo plano tras el init
+ON_LAMBDA = bool(os.getenv("AWS_LAMBDA_FUNCTION_NAME"))
+
+# Estados del warm-up
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+DISABLED = "disabled"
+
+_started_at = time.time()
+_state: Dict = {
+    "warmup": PENDING if WARMUP_ON_STARTUP else DISABLED,
+    "error": None,
+    "timings": {},
+}
+_state_lock = threading.Lock()
+_warm_up_thread: Optional[threading.Thread] = None
+_seed_lock = threading.Lock()
+_seeded = False
+
+
+def record_timing(name: str, seconds: float) -> None:
+    """Registra la duración de una fase del arranque (en segundos)"""
+    with _state_lock:
+        _state["timings"][name] = round(seconds, 4)
+
+
+def warm_up() -> bool:
+    """
+    Carga el modelo, hace una predicción de prueba y compila los planes de salida
+
+    Es idempotente: si ya se ejecutó (o está en curso en otro hilo) no repite el trabajo.
+
+    Returns:
+        True si el servicio quedó listo
+    """
+    with _state_lock:
+        if _state["warmup"] in (RUNNING, DONE):
+            return _state["warmup"] == DONE
+        _state["warmup"] = RUNNING
+
+    from app.output_plan import get_output_plan
+    from app.prediction import get_clustering_model
+    from app.records import get_record_extractor
+
+    logger.info("Warm-up del modelo de clustering...")
+    try:
+        # El registro carga y calienta la versión activa (predicción de prueba incluida)
+        started = time.perf_counter()
+        model = get_clustering_model()
+        record_timing("model_load_s", time.perf_counter() - started)
+
+        started = time.perf_counter()
+        get_output_plan()
+        get_record_extractor(list(model.scaler.feature_names_in_))
+        record_timing("warmup_s", time.perf_counter() - started)
+    except Exception as e:
+        logger.error(f"❌ Warm-up falló: {e}", exc_info=True)
+        with _state_lock:
+            _state["warmup"] = FAILED
+            _state["error"] = str(e)
+        return False
+
+    with _state_lock:
+        _state["warmup"] = DONE
+    logger.info(f"✓ Servicio listo: {_state['timings']}")
+
+    # Después de marcar el servicio listo y en otro hilo: la siembra no retrasa la readiness.
+    # En Lambda no se siembra en el init: la primera consulta a /similar lo hace
+    if not ON_LAMBDA:
+        threading.Thread(target=seed_similarity_index, name="similarity-seed", daemon=True).start()
+    return True
+
+
+def seed_similarity_index() -> int:
+    """
+    Siembra el índice de /similar desde la tabla datos (si hay DATABASE_URL)
+
+    Se ejecuta una sola vez por proceso (aunque falle); las llamadas concurrentes
+    esperan a que termine la primera.
+
+    Returns:
+        Asociados sembrados (0 si ya se sembró, está desactivado o falló)
+    """
+    global _seeded
+    from app.similarity import SIMILARITY_SEED_FROM_DB, get_similarity_index, seed_from_db
+    from app.sink import DATABASE_URL, get_postgres_sink
+
+    if _seeded or not (SIMILARITY_SEED_FROM_DB and DATABASE_URL):
+        return 0
+    with _seed_lock:
+        if _seeded:
+            return 0
+        _seeded = True
+        index = get_similarity_index()
+        if index is None:
+            return 0
+        try:
+            started = time.perf_counter()
+            n_rows = seed_from_db(index, get_postgres_sink())
+            record_timing("similarity_seed_s", time.perf_counter() - started)
+        except Exception as e:
+            logger.warning(f"⚠️  No se pudo sembrar el índice de similitud desde la base de datos: {e}")
+            return 0
+    logger.info(f"✓ Índice de similitud sembrado con {n_rows} asociados")
+    return n_rows
+
+
+def start_warm_up_thread() -> Optional[threading.Thread]:
+    """
+    Lanza el warm-up en segundo plano (el servidor acepta /health mientras tanto)
+
+    Solo lanza un hilo por proceso; las llamadas siguientes devuelven el mismo.
+    """
+    global _warm_up_thread
+    if not WARMUP_ON_STARTUP:
+        return None
+    with _state_lock:
+        if _warm_up_thread is None:
+            _warm_up_thread = threading.Thread(target=warm_up, name="model-warmup", daemon=True)
+            _warm_up_thread.start()
+        return _warm_up_thread
+
+
+def readiness() -> Dict:
+    """
+    Estado de readiness para /health
+
+    Si el warm-up nunca arrancó (servidor sin lifespan, p. ej. lifespan="off"),
+    lo lanza en segundo plano: /health no queda en "starting" para siempre. Un
+    modelo ya cargado por una request cuenta como listo.
+
+    Returns:
+        Dict con ready (bool), status, models_loaded, warmup, error, timings y uptime_s
+    """
+    from app.prediction import clustering_model_loaded
+
+    with _state_lock:
+        warmup = _state["warmup"]
+        error = _state["error"]
+        timings = dict(_state["timings"])
+
+    models_loaded = clustering_model_loaded()
+    if warmup == PENDING:
+        start_warm_up_thread()
+    # Sin warm-up el servicio atiende igual (carga el modelo en la primera request)
+    ready = (
+        warmup == DONE
+        or (warmup == DISABLED and error is None)
+        or (warmup == PENDING and models_loaded)
+    )
+    if warmup == FAILED:
+        status = "unhealthy"
+    elif ready:
+        status = "healthy"
+    else:
+        status = "starting"
+
+    return {
+        "ready": ready,
+        "status": status,
+        "models_loaded": models_loaded,
+        "warmup": warmup,
+        "error": error,
+        "timings": timings,
+        "uptime_s": round(time.time() - _started_at, 1),
+    }
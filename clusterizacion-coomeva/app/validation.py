@@ -0,0 +1,238 @@
+"""
+Validación rápida del esquema de entrada antes del pipeline pesado
+
+Se revisa el encabezado y una muestra de las primeras filas (SCHEMA_SAMPLE_ROWS,
+SCHEMA_XLSX_SAMPLE_ROWS en XLSX) contra el esquema crudo que espera DataPreprocessor:
+
+- columnas críticas presentes (sin ellas ninguna fila es válida)
+- fechas en formato %m/%d/%Y (las demás quedan NaT y la fila se descarta)
+- montos, conteos e indicadores numéricos (el texto queda NaN)
+- valores de las categóricas: con dummy en el modelo (los demás se
+  codifican con todas las dummies de la columna en cero)
+
+Un archivo con errores se rechaza en milisegundos con un reporte estructurado
+(HTTP 422) en lugar de fallar después de leerlo y preprocesarlo completo; los
+problemas menores van como warnings al log.
+"""
+import logging
+import os
+from datetime import date
+from typing import Any, BinaryIO, Dict, List, Optional
+
+import pandas as pd
+
+from app import metrics
+from app.ingestion import DERIVED_INPUT_COLUMNS, INPUT_COLUMNS, INPUT_DTYPES, read_upload_sample
+from app.preprocessing import CATEGORICAL_INPUT_COLUMNS, CRITICAL_COLUMNS, EXPECTED_COLUMNS
+
+logger = logging.getLogger(__name__)
+
+# Validación antes de procesar /cluster y /cluster/jobs (false = sin validar, como antes)
+SCHEMA_VALIDATION = os.getenv("SCHEMA_VALIDATION", "true").lower() in ("1", "true", "yes")
+
+# Filas de la muestra y fracción de valores inválidos de una columna a partir de la cual se rechaza
+SCHEMA_SAMPLE_ROWS = int(os.getenv("SCHEMA_SAMPLE_ROWS", "1000"))
+# openpyxl recorre ~0,5 ms por fila de ~100 columnas: muestra más chica para XLSX
+SCHEMA_XLSX_SAMPLE_ROWS = int(os.getenv("SCHEMA_XLSX_SAMPLE_ROWS", "200"))
+SCHEMA_MAX_INVALID_RATE = float(os.getenv("SCHEMA_MAX_INVALID_RATE", "0.1"))
+
+# Valores de categóricas sin dummy en el modelo: warn (log), error (rechazo) u off
+SCHEMA_UNKNOWN_CATEGORIES = os.getenv("SCHEMA_UNKNOWN_CATEGORIES", "warn").lower()
+
+DATE_FORMAT = "%m/%d/%Y"
+DATE_COLUMNS = ['Fecha_Ingreso', 'Fecha_Nacimiento']
+
+# Columnas crudas del archivo (antes de las derivadas en EXPECTED_COLUMNS) que usa el preprocesamiento
+RAW_INPUT_COLUMNS = INPUT_COLUMNS[:INPUT_COLUMNS.index(DERIVED_INPUT_COLUMNS[0])]
+
+# Columnas que se leen como números (float64 o Int8 en la lectura tipada)
+NUMERIC_INPUT_COLUMNS = [col for col, dtype in INPUT_DTYPES.items() if dtype in ('float64', 'Int8')]
+
+# Ejemplos de valores inválidos incluidos en el reporte por columna
+_MAX_EXAMPLES = 5
+
+
+def _known_levels() -> Dict[str, frozenset]:
+    """
+    Valores con dummy en EXPECTED_COLUMNS por categórica (Zona y el título se mapean aparte)
+    
+    El nivel que get_dummies descartó al entrenar no se puede deducir de los nombres
+    de las columnas, así que cualquier otro valor se reporta como desconocido.
+    """
+    levels = {}
+    for column in CATEGORICAL_INPUT_COLUMNS:
+        if column in ('Nombre_Titulo_Obtenido', 'Zona'):
+            continue
+        prefix = f"{column}_"
+        dummies = {c[len(prefix):] for c in EXPECTED_COLUMNS if c.startswith(prefix)}
+        levels[column] = frozenset(dummies)
+    return levels
+
+
+KNOWN_LEVELS = _known_levels()
+
+
+def _examples(values: pd.Series) -> List[Any]:
+    return [str(v) for v in values.drop_duplicates().head(_MAX_EXAMPLES)]
+
+
+def _invalid_issue(check: str, column: str, invalid: pd.Series, checked: int, message: str) -> Dict:
+    return {
+        "check": check,
+        "column": column,
+        "message": message,
+        "invalid": int(len(invalid)),
+        "checked": checked,
+        "examples": _examples(invalid),
+    }
+
+
+def _invalid_dates(values: pd.Series) -> pd.Series:
+    """Valores que pd.to_datetime(format=DATE_FORMAT) dejaría en NaT (las celdas fecha del XLSX son válidas)"""
+    is_date = values.map(lambda v: isinstance(v, date))
+    text = values[~is_date].astype(str)
+    parsed = pd.to_datetime(text, format=DATE_FORMAT, errors='coerce')
+    return text[parsed.isna()]
+
+
+def _invalid_numbers(values: pd.Series) -> pd.Series:
+    """Valores que pd.to_numeric dejaría en NaN"""
+    parsed = pd.to_numeric(values, errors='coerce')
+    return values[parsed.isna()]
+
+
+def validate_sample(df: pd.DataFrame) -> Dict:
+    """
+    Valida el encabezado y las filas de una muestra del archivo
+
+    Args:
+        df: Muestra sin convertir (read_upload_sample)
+
+    Returns:
+        Reporte: valid, rows_sampled, columns, errors y warnings (cada uno con
+        check, column(s), message y, si aplica, invalid / checked / examples)
+    """
+    errors: List[Dict] = []
+    warnings: List[Dict] = []
+    header = set(df.columns)
+
+    def by_rate(issue: Dict):
+        # Unos pocos valores inválidos se descartan fila a fila; muchos indican un archivo mal formado
+        rate = issue["invalid"] / issue["checked"]
+        (errors if rate > SCHEMA_MAX_INVALID_RATE else warnings).append(issue)
+
+    if len(df) == 0:
+        errors.append({"check": "empty", "message": "El archivo no contiene filas"})
+
+    missing = [col for col in CRITICAL_COLUMNS if col not in header]
+    if missing:
+        errors.append({
+            "check": "missing_columns",
+            "columns": missing,
+            "message": f"Faltan columnas obligatorias: {', '.join(missing)}",
+        })
+
+    optional = [col for col in RAW_INPUT_COLUMNS if col not in header and col not in CRITICAL_COLUMNS]
+    if optional:
+        warnings.append({
+            "check": "optional_columns",
+            "columns": optional,
+            "message": f"{len(optional)} columnas de entrada ausentes (sus features quedan en 0)",
+        })
+
+    for column in DATE_COLUMNS:
+        if column not in header:
+            continue
+        values = df[column].dropna()
+        invalid = _invalid_dates(values)
+        if len(invalid):
+            by_rate(_invalid_issue(
+                "date_format", column, invalid, len(values),
+                f"{len(invalid)} de {len(values)} fechas de '{column}' no tienen el formato MM/DD/YYYY"
+            ))
+
+    for column in NUMERIC_INPUT_COLUMNS:
+        if column not in header:
+            continue
+        values = df[column].dropna()
+        invalid = _invalid_numbers(values)
+        if len(invalid):
+            by_rate(_invalid_issue(
+                "numeric", column, invalid, len(values),
+                f"{len(invalid)} de {len(values)} valores de '{column}' no son numéricos"
+            ))
+
+    if len(df) and not missing:
+        critical = df[CRITICAL_COLUMNS].apply(pd.to_numeric, errors='coerce')
+        if critical.isna().any(axis=1).all():
+            errors.append({
+                "check": "no_valid_rows",
+                "columns": CRITICAL_COLUMNS,
+                "message": "Ninguna fila de la muestra tiene todas las columnas obligatorias con valor numérico",
+            })
+
+    if SCHEMA_UNKNOWN_CATEGORIES != "off":
+        for column, known in KNOWN_LEVELS.items():
+            if column not in header:
+                continue
+            values = df[column].dropna().astype(str)
+            unknown = values[~values.isin(known)].value_counts()
+            if len(unknown):
+                issue = {
+                    "check": "unknown_categories",
+                    "column": column,
+                    "message": f"Valores de '{column}' sin dummy en el modelo (se codifican con todas sus dummies en cero)",
+                    "invalid": int(unknown.sum()),
+                    "checked": len(values),
+                    "examples": [str(v) for v in unknown.index[:_MAX_EXAMPLES]],
+                }
+                (errors if SCHEMA_UNKNOWN_CATEGORIES == "error" else warnings).append(issue)
+
+    return {
+        "valid": not errors,
+        "rows_sampled": len(df),
+        "columns": len(df.columns),
+        "errors": errors,
+        "warnings": warnings,
+    }
+
+
+def validate_upload(source: BinaryIO, filename: str, sample_rows: Optional[int] = None) -> Dict:
+    """
+    Valida un archivo subido leyendo solo su encabezado y las primeras filas
+
+    Args:
+        source: Archivo subido (queda en la posición en que estaba)
+        filename: Nombre del archivo (define el lector, CSV o XLSX)
+        sample_rows: Filas de la muestra (None = SCHEMA_SAMPLE_ROWS o SCHEMA_XLSX_SAMPLE_ROWS)
+
+    Returns:
+        Reporte de validate_sample; si el archivo no se puede leer, un reporte
+        inválido con el error de lectura. Con errores incluye message (resumen)
+    """
+    if sample_rows is None:
+        sample_rows = SCHEMA_SAMPLE_ROWS if filename.lower().endswith('.csv') else SCHEMA_XLSX_SAMPLE_ROWS
+
+    with metrics.stage("validate") as stage:
+        try:
+            sample = read_upload_sample(source, filename, sample_rows)
+        except Exception as e:
+            report = {
+                "valid": False, "rows_sampled": 0, "columns": 0,
+                "errors": [{"check": "unreadable", "message": f"No se pudo leer el archivo: {e}"}],
+                "warnings": [],
+            }
+        else:
+            stage.rows = len(sample)
+            report = validate_sample(sample)
+
+    for warning in report["warnings"]:
+        examples = f" (p. ej. {', '.join(warning['examples'])})" if warning.get("examples") else ""
+        logger.warning(f"⚠️  {filename}: {warning['message']}{examples}")
+    if not report["valid"]:
+        report["message"] = "El archivo no cumple el esquema de entrada: " + "; ".join(
+            error["message"] for error in report["errors"]
+        )
+        metrics.observe_schema_rejection([error["check"] for error in report["errors"]])
+        logger.warning(f"❌ {filename} rechazado: {report['message']}")
+    return report
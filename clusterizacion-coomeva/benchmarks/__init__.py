@@ -0,0 +1,10 @@
+"""
+Benchmarks del pipeline de clusterización con datos sintéticos
+
+    python -m benchmarks --rows 1000 10000 100000 --save-baseline
+    python -m benchmarks --rows 1000 10000 100000 --check
+
+Cada etapa (lectura CSV/XLSX, preprocesamiento, escalado, proyección KNN,
+KMeans, formato de salida y serialización) se mide por separado con su
+throughput y el pico de memoria (RSS).
+"""
@@ -0,0 +1,120 @@
+"""
+Reporte de memoria del preprocesamiento: matriz float64 frente a tipos compactos
+
+Para cada tamaño se preprocesa el mismo archivo sintético en los dos modos de
+DataPreprocessor y se reporta el tamaño del DataFrame resultante, el pico de
+RSS del preprocesamiento y el de la conversión a float64 de las features del
+modelo. También mide cuántos clusters coinciden si la entrada del scaler se
+materializa en float32 en lugar de float64.
+
+    python -m benchmarks.memory --rows 10000 100000 200000
+"""
+import argparse
+import gc
+import io
+import json
+import logging
+import sys
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from benchmarks.run import measure
+from benchmarks.synthetic import generate_members
+
+DEFAULT_ROWS = [10_000, 100_000]
+MODES = {"float64": False, "compact": True}
+
+
+def _frame_mb(df) -> float:
+    return round(df.memory_usage(deep=True).sum() / (1024 * 1024), 1)
+
+
+def report_size(model, n_rows: int, seed: int = 0) -> Dict[str, Dict]:
+    """
+    Preprocesa n_rows filas en ambos modos
+
+    Returns:
+        Dict modo -> métricas (más "float32" con la coincidencia de clusters)
+    """
+    from app.ingestion import read_upload
+    from app.preprocessing import DataPreprocessor
+
+    csv_bytes = generate_members(n_rows, seed=seed).to_csv(index=False).encode("utf-8")
+    feature_names = list(model.scaler.feature_names_in_)
+    report = {}
+    X = None
+
+    for mode, compact in MODES.items():
+        df_raw = read_upload(io.BytesIO(csv_bytes), "bench.csv")
+        gc.collect()
+        (df_processed, _), preprocess = measure(
+            lambda df: DataPreprocessor(compact=compact).process(df), n_rows, df_raw
+        )
+        del df_raw
+        gc.collect()
+        X, features = measure(
+            lambda df: df[feature_names].astype(np.float64).dropna().to_numpy(), n_rows, df_processed
+        )
+        report[mode] = {
+            "frame_mb": _frame_mb(df_processed),
+            "numeric_mb": _frame_mb(df_processed.select_dtypes(include=["number", "bool"])),
+            "text_mb": _frame_mb(df_processed.select_dtypes(exclude=["number", "bool"])),
+            "preprocess_peak_rss_mb": preprocess["peak_rss_mb"],
+            "features_peak_rss_mb": features["peak_rss_mb"],
+            "features_mb": round(X.nbytes / (1024 * 1024), 1),
+        }
+        del df_processed
+        gc.collect()
+
+    _, labels64 = model._predict_features(X)
+    _, labels32 = model._predict_features(X.astype(np.float32))
+    report["float32"] = {
+        "features_mb": round(X.nbytes / 2 / (1024 * 1024), 1),
+        "label_agreement": round(float((labels32 == labels64).mean()), 6),
+    }
+    return report
+
+
+def _print_table(results: Dict):
+    print(f"{'filas':>9} {'modo':<8} {'frame MB':>9} {'numérico':>9} {'texto':>8} "
+          f"{'pico prep':>10} {'pico feat':>10}")
+    for size, report in results.items():
+        for mode in MODES:
+            m = report[mode]
+            print(
+                f"{size:>9} {mode:<8} {m['frame_mb']:>9.1f} {m['numeric_mb']:>9.1f} {m['text_mb']:>8.1f} "
+                f"{m['preprocess_peak_rss_mb']:>10.1f} {m['features_peak_rss_mb']:>10.1f}"
+            )
+        f32 = report["float32"]
+        print(f"{size:>9} float32: features {f32['features_mb']:.1f} MB, "
+              f"clusters iguales a float64: {f32['label_agreement']:.4%}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    from app.prediction import ClusteringModel
+
+    parser = argparse.ArgumentParser(description="Memoria del preprocesamiento: float64 vs compacto")
+    parser.add_argument('--models-path', default="models")
+    parser.add_argument('--rows', type=int, nargs='+', default=DEFAULT_ROWS)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=None, help="JSON con el reporte")
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.WARNING, format="%(message)s")
+
+    model = ClusteringModel(args.models_path)
+    results = {}
+    for n_rows in args.rows:
+        print(f"Reporte de memoria de {n_rows} filas...", file=sys.stderr)
+        results[str(n_rows)] = report_size(model, n_rows, args.seed)
+    _print_table(results)
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
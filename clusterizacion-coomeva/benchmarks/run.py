@@ -0,0 +1,241 @@
+"""
+Ejecución de los benchmarks por etapa y comparación contra el baseline
+
+Para cada tamaño se genera un archivo sintético y se mide cada etapa del
+pipeline por separado (segundos, filas/s y pico de RSS de la etapa). Los
+resultados se guardan en JSON; con --check se comparan contra el baseline y el
+proceso termina con código 1 si alguna etapa es más lenta o usa más memoria
+que el baseline más la tolerancia.
+"""
+import argparse
+import io
+import json
+import logging
+import platform
+import resource
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from benchmarks.synthetic import generate_members
+
+DEFAULT_ROWS = [1_000, 10_000, 100_000]
+DEFAULT_BASELINE = Path(__file__).with_name("baseline.json")
+
+# Generar XLSX de más filas tarda minutos y el límite práctico del API es menor
+XLSX_MAX_ROWS = 100_000
+
+# Margen aceptado frente al baseline (0.25 = 25% menos throughput o 25% más memoria)
+DEFAULT_TOLERANCE = 0.25
+
+
+def _reset_peak_rss() -> bool:
+    """Reinicia el pico de RSS del proceso (Linux: /proc/self/clear_refs)"""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _peak_rss_mb() -> float:
+    """Pico de RSS desde el último reinicio (o desde el inicio del proceso)"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # ru_maxrss: KB en Linux, bytes en macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def measure(func: Callable, n_rows: int, *args):
+    """
+    Ejecuta func(*args) y mide tiempo, throughput y pico de memoria
+
+    Los datos que la etapa libera después (del) se pasan en args y no en el
+    closure de func.
+
+    Returns:
+        Tuple (resultado de func, métricas)
+    """
+    _reset_peak_rss()
+    started = time.perf_counter()
+    result = func(*args)
+    seconds = time.perf_counter() - started
+    return result, {
+        "seconds": round(seconds, 4),
+        "rows_per_s": round(n_rows / seconds, 1) if seconds > 0 else None,
+        "peak_rss_mb": round(_peak_rss_mb(), 1),
+    }
+
+
+def bench_size(model, n_rows: int, formats: List[str], xlsx_max_rows: int = XLSX_MAX_ROWS,
+               seed: int = 0) -> Dict[str, Dict]:
+    """
+    Mide todas las etapas para un archivo sintético de n_rows filas
+
+    Returns:
+        Dict etapa -> métricas
+    """
+    from app.output_formats import get_writer
+    from app.output_plan import get_output_plan
+    from app.preprocessing import DataPreprocessor
+    from app.ingestion import read_upload
+
+    stages = {}
+    df_raw = generate_members(n_rows, seed=seed)
+
+    csv_bytes = df_raw.to_csv(index=False).encode("utf-8")
+    df_raw, stages["parse_csv"] = measure(
+        lambda data: read_upload(io.BytesIO(data), "bench.csv"), n_rows, csv_bytes
+    )
+    del csv_bytes
+
+    if "xlsx" in formats and n_rows <= xlsx_max_rows:
+        xlsx_buffer = io.BytesIO()
+        df_raw.to_excel(xlsx_buffer, index=False)
+        _, stages["parse_xlsx"] = measure(
+            lambda buffer: read_upload(io.BytesIO(buffer.getvalue()), "bench.xlsx"), n_rows, xlsx_buffer
+        )
+        del xlsx_buffer
+
+    (df_processed, _), stages["preprocess"] = measure(lambda df: DataPreprocessor().process(df), n_rows, df_raw)
+    del df_raw
+
+    # Mismo camino que /cluster: selección de features, filas sin NaN y el runtime
+    # configurado (INFERENCE_RUNTIME: ArrayRuntime de NumPy o sklearn)
+    (labels, _, df_completo), stages["predict"] = measure(model.predict, n_rows, df_processed)
+    del df_processed
+    n_valid = len(labels)
+
+    df_result, stages["format"] = measure(lambda: get_output_plan().apply(df_completo, labels), n_valid)
+    for name in formats:
+        if name == "xlsx":
+            continue
+        writer = get_writer(name)
+        _, stages[f"serialize_{name}"] = measure(lambda: writer.write(df_result) + writer.close(), n_valid)
+
+    return stages
+
+
+def compare(results: Dict, baseline: Dict, tolerance: float = DEFAULT_TOLERANCE) -> List[str]:
+    """
+    Compara resultados contra el baseline (solo tamaños y etapas presentes en ambos)
+
+    Returns:
+        Lista de regresiones (vacía si todo está dentro de la tolerancia)
+    """
+    regressions = []
+    for size, stages in results["results"].items():
+        for stage, metrics in stages.items():
+            reference = baseline.get("results", {}).get(size, {}).get(stage)
+            if reference is None:
+                continue
+            if reference["rows_per_s"] and metrics["rows_per_s"] < reference["rows_per_s"] * (1 - tolerance):
+                regressions.append(
+                    f"{size} filas / {stage}: {metrics['rows_per_s']:.0f} filas/s "
+                    f"(baseline {reference['rows_per_s']:.0f})"
+                )
+            if metrics["peak_rss_mb"] > reference["peak_rss_mb"] * (1 + tolerance):
+                regressions.append(
+                    f"{size} filas / {stage}: pico {metrics['peak_rss_mb']:.0f} MB "
+                    f"(baseline {reference['peak_rss_mb']:.0f} MB)"
+                )
+    return regressions
+
+
+def _print_table(results: Dict):
+    print(f"{'filas':>9} {'etapa':<20} {'segundos':>9} {'filas/s':>12} {'pico MB':>9}")
+    for size, stages in results["results"].items():
+        for stage, metrics in stages.items():
+            print(
+                f"{size:>9} {stage:<20} {metrics['seconds']:>9.3f} "
+                f"{metrics['rows_per_s'] or 0:>12.0f} {metrics['peak_rss_mb']:>9.1f}"
+            )
+
+
+def run(models_path: str, sizes: List[int], formats: List[str], xlsx_max_rows: int = XLSX_MAX_ROWS,
+        seed: int = 0) -> Dict:
+    """Carga el modelo (sin caché de predicciones) y mide cada tamaño"""
+    from app.prediction import ClusteringModel
+
+    model = ClusteringModel(models_path)
+    # La caché convertiría las repeticiones en aciertos: se mide el cómputo real
+    model.cache = None
+
+    results = {}
+    for n_rows in sizes:
+        print(f"Benchmark de {n_rows} filas...", file=sys.stderr)
+        results[str(n_rows)] = bench_size(model, n_rows, formats, xlsx_max_rows, seed)
+
+    return {
+        "meta": {
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "processor": platform.processor(),
+            "models_path": models_path,
+            "knn_backend": model.knn_backend,
+            "inference_runtime": model.inference_runtime,
+            "seed": seed,
+        },
+        "results": results,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    from app.output_formats import OUTPUT_FORMATS
+
+    parser = argparse.ArgumentParser(description="Benchmarks por etapa con datos sintéticos")
+    parser.add_argument('--models-path', default="models")
+    parser.add_argument('--rows', type=int, nargs='+', default=DEFAULT_ROWS, help="Tamaños (1k a 1M filas)")
+    parser.add_argument('--formats', nargs='+', default=["xlsx", *OUTPUT_FORMATS],
+                        choices=["xlsx", *OUTPUT_FORMATS], help="Lectura XLSX y formatos de salida a medir")
+    parser.add_argument('--xlsx-max-rows', type=int, default=XLSX_MAX_ROWS)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=None, help="JSON con los resultados de esta corrida")
+    parser.add_argument('--baseline', default=str(DEFAULT_BASELINE))
+    parser.add_argument('--save-baseline', action='store_true', help="Guardar esta corrida como baseline")
+    parser.add_argument('--check', action='store_true', help="Fallar si hay regresiones frente al baseline")
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE)
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.WARNING, format="%(message)s")
+
+    # Sin baseline no hay contra qué comparar: se avisa antes de correr las mediciones
+    if args.check and not args.save_baseline and not Path(args.baseline).exists():
+        print(
+            f"❌ No existe el baseline {args.baseline}: guarde uno primero con --save-baseline",
+            file=sys.stderr
+        )
+        return 2
+
+    results = run(args.models_path, args.rows, args.formats, args.xlsx_max_rows, args.seed)
+    _print_table(results)
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2))
+    if args.save_baseline:
+        Path(args.baseline).write_text(json.dumps(results, indent=2))
+        print(f"Baseline guardado en {args.baseline}")
+
+    if args.check:
+        baseline = json.loads(Path(args.baseline).read_text())
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"❌ {len(regressions)} regresiones (tolerancia {args.tolerance:.0%}):")
+            for regression in regressions:
+                print(f"  - {regression}")
+            return 1
+        print(f"✓ Sin regresiones frente a {args.baseline} (tolerancia {args.tolerance:.0%})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,126 @@
+"""
+Generador de asociados sintéticos con el esquema del archivo de entrada
+
+Produce las columnas crudas que consume DataPreprocessor.process: fechas en
+formato MM/DD/YYYY, categóricas con los niveles de las dummies de
+EXPECTED_COLUMNS, zonas del mapa de regiones (con variaciones de mayúsculas y
+espacios), títulos de todas las áreas, montos, conteos, indicadores de
+productos y las columnas redundantes que el preprocesamiento elimina.
+"""
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+from app.preprocessing import CATEGORICAL_INPUT_COLUMNS, EXPECTED_COLUMNS, DataPreprocessor
+
+TITULOS = [
+    "Enfermería", "Instrumentación Quirúrgica", "Medicina", "Ingeniería de Sistemas",
+    "Tecnología en Análisis de Sistemas", "Administración de Empresas", "Negocios Internacionales",
+    "Derecho", "Relaciones Internacionales", "Lic. en Matemáticas", "Docente", "Ingeniería Civil",
+    "Comunicación Social y Periodismo", "Arquitectura", "Contaduría Pública", "Bachiller",
+]
+
+# Montos (log-normal con una fracción de ceros) y conteos (mínimo, máximo)
+MONEY_COLUMNS = {
+    "Ingresos": 15.0, "Ingresos_Deflactados": 14.8, "Saldo_aportes": 14.0, "Vlr_mora": 11.0,
+    "saldo_VISA": 13.5, "MasterCardCupo": 15.0, "MasterCardSaldo": 13.5, "CuotaManejo": 10.0,
+}
+COUNT_COLUMNS = {
+    "Personas_a_Cargo": (0, 6), "Personas_a_Cargo_Menores_18": (0, 4),
+    "Cuotas_canceladas_aportes": (0, 360), "Cuotas_mora_aportes": (0, 12),
+    "numedad": (0, 3), "numCantidadProductos": (1, 15),
+}
+
+# Columnas derivadas por el preprocesamiento (no vienen en el archivo)
+DERIVED_COLUMNS = ["log_ingresos", "log_ingresos_deflactados", "Antiguedad_dias", "Edad", "Area_Titulo", "Region"]
+
+# Fracción de filas sin valor en una columna crítica (se descartan al preprocesar)
+MISSING_CRITICAL_RATE = 0.01
+
+
+def category_levels() -> Dict[str, List[str]]:
+    """Niveles de cada categórica: los sufijos de sus dummies en EXPECTED_COLUMNS"""
+    levels = {}
+    for column in CATEGORICAL_INPUT_COLUMNS:
+        if column in ("Nombre_Titulo_Obtenido", "Zona"):
+            continue
+        prefix = f"{column}_"
+        dummies = [c[len(prefix):] for c in EXPECTED_COLUMNS if c.startswith(prefix)]
+        levels[column] = dummies
+    return levels
+
+
+def raw_input_columns() -> List[str]:
+    """Columnas del archivo de entrada en el orden de EXPECTED_COLUMNS"""
+    end = EXPECTED_COLUMNS.index(DERIVED_COLUMNS[0])
+    return EXPECTED_COLUMNS[:end]
+
+
+def _dates(rng: np.random.Generator, n_rows: int, start: str, end: str) -> np.ndarray:
+    start_ts, end_ts = pd.Timestamp(start), pd.Timestamp(end)
+    days = rng.integers(0, (end_ts - start_ts).days, n_rows)
+    return (start_ts + pd.to_timedelta(days, unit="D")).strftime("%m/%d/%Y").to_numpy()
+
+
+def _zonas(rng: np.random.Generator, n_rows: int) -> np.ndarray:
+    ciudades = list(DataPreprocessor().region_map) + ["Desconocido", "Exterior"]
+    variantes = np.array(
+        [c for ciudad in ciudades for c in (ciudad, ciudad.lower(), f" {ciudad.upper()} ")], dtype=object
+    )
+    return variantes[rng.integers(0, len(variantes), n_rows)]
+
+
+def generate_members(n_rows: int, seed: int = 0) -> pd.DataFrame:
+    """
+    Genera n_rows asociados sintéticos
+
+    Args:
+        n_rows: Filas a generar
+        seed: Semilla (la misma semilla produce el mismo archivo)
+
+    Returns:
+        DataFrame con las columnas crudas del archivo de entrada
+    """
+    rng = np.random.default_rng(seed)
+    levels = category_levels()
+    data = {}
+
+    for column in raw_input_columns():
+        if column == "IdUnico":
+            data[column] = np.char.mod("A%09d", np.arange(n_rows)).astype(object)
+        elif column == "Fecha_Ingreso":
+            data[column] = _dates(rng, n_rows, "1980-01-01", "2025-06-30")
+        elif column == "Fecha_Nacimiento":
+            data[column] = _dates(rng, n_rows, "1940-01-01", "2007-12-31")
+        elif column == "Nombre_Titulo_Obtenido":
+            data[column] = np.array(TITULOS, dtype=object)[rng.integers(0, len(TITULOS), n_rows)]
+        elif column == "Zona":
+            data[column] = _zonas(rng, n_rows)
+        elif column in levels:
+            values = np.array(levels[column], dtype=object)
+            data[column] = values[rng.integers(0, len(values), n_rows)]
+        elif column in MONEY_COLUMNS:
+            values = np.round(rng.lognormal(MONEY_COLUMNS[column], 0.8, n_rows), 2)
+            values[rng.random(n_rows) < 0.1] = 0.0
+            data[column] = values
+        elif column in COUNT_COLUMNS:
+            low, high = COUNT_COLUMNS[column]
+            data[column] = rng.integers(low, high + 1, n_rows)
+        else:
+            # Indicador de producto con una prevalencia propia por columna
+            data[column] = (rng.random(n_rows) < rng.uniform(0.02, 0.5)).astype(np.int64)
+
+    df = pd.DataFrame(data)
+    df["Ingresos"] = df["Ingresos"].where(rng.random(n_rows) >= MISSING_CRITICAL_RATE)
+
+    # Columnas redundantes o no usadas que el preprocesamiento elimina
+    for column in DataPreprocessor().columnas_a_eliminar_inicial + ["Egresos"]:
+        if column.startswith("Fecha_"):
+            df[column] = _dates(rng, n_rows, "2020-01-01", "2025-06-30")
+        elif f"Nombre_{column}" in df.columns:
+            df[column] = pd.factorize(df[f"Nombre_{column}"])[0] + 1
+        else:
+            df[column] = rng.integers(0, 10, n_rows)
+
+    return df
@@ -0,0 +1,143 @@
+"""
+Memoria por worker: modelos copiados en cada proceso frente a compartidos
+
+Lanza N procesos como los workers de uvicorn. Cada uno carga el modelo (copia
+por proceso, o exportado una vez a MODELS_SHARED_PATH y mapeado de solo
+lectura) y predice un archivo sintético. Con todos los procesos vivos se lee
+/proc/self/smaps_rollup de cada uno:
+
+- RSS: páginas residentes, incluidas las compartidas (cuenta cada página en
+  todos los procesos que la mapean)
+- PSS: páginas compartidas repartidas entre los procesos que las usan (la suma
+  de PSS es la memoria real del conjunto de workers)
+- USS: memoria privada del proceso (lo que se libera si el worker termina)
+
+    python -m benchmarks.workers --workers 4 --shared-path /dev/shm/coomeva-models
+
+Solo Linux (smaps_rollup).
+"""
+import argparse
+import io
+import json
+import logging
+import multiprocessing as mp
+import shutil
+import sys
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from benchmarks.synthetic import generate_members
+
+MODES = ("copy", "shared")
+
+
+def _memory_mb() -> Dict[str, float]:
+    """RSS, PSS y USS del proceso en MB"""
+    fields = {}
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                fields[parts[0].rstrip(":")] = int(parts[1]) / 1024
+    return {
+        "rss_mb": round(fields["Rss"], 1),
+        "pss_mb": round(fields["Pss"], 1),
+        "uss_mb": round(fields["Private_Clean"] + fields["Private_Dirty"], 1),
+    }
+
+
+def _worker(models_path: str, shared_path: str, n_rows: int, barrier, results) -> None:
+    """Un worker: carga el modelo, predice y mide con todos los workers vivos"""
+    from app.ingestion import read_upload
+    from app.prediction import ClusteringModel
+    from app.preprocessing import DataPreprocessor
+
+    csv_bytes = generate_members(n_rows, seed=0).to_csv(index=False).encode("utf-8")
+    df_processed, _ = DataPreprocessor().process(read_upload(io.BytesIO(csv_bytes), "bench.csv"))
+    before = _memory_mb()
+
+    model = ClusteringModel(models_path, shared_path=shared_path)
+    X = df_processed[list(model.scaler.feature_names_in_)].astype(np.float64).dropna().to_numpy()
+    model._predict_features(X)
+
+    barrier.wait()
+    after = _memory_mb()
+    results.put({"before": before, "after": after})
+    # Nadie termina antes de que todos midan (el PSS depende de quién comparte)
+    barrier.wait()
+
+
+def report_mode(models_path: str, shared_path: str, n_workers: int, n_rows: int) -> Dict:
+    """
+    Memoria de n_workers procesos con el modelo cargado
+
+    Returns:
+        Promedio por worker antes y después de cargar el modelo, y PSS total
+    """
+    ctx = mp.get_context("spawn")
+    barrier = ctx.Barrier(n_workers)
+    results = ctx.Queue()
+    processes = [
+        ctx.Process(target=_worker, args=(models_path, shared_path, n_rows, barrier, results))
+        for _ in range(n_workers)
+    ]
+    for process in processes:
+        process.start()
+    measures = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+
+    def mean(moment: str, key: str) -> float:
+        return round(sum(m[moment][key] for m in measures) / len(measures), 1)
+
+    return {
+        "workers": n_workers,
+        **{f"{key}": mean("after", key) for key in ("rss_mb", "pss_mb", "uss_mb")},
+        **{f"model_{key}": round(mean("after", key) - mean("before", key), 1)
+           for key in ("rss_mb", "pss_mb", "uss_mb")},
+        "total_pss_mb": round(sum(m["after"]["pss_mb"] for m in measures), 1),
+    }
+
+
+def _print_table(results: Dict):
+    print(f"{'modo':<7} {'workers':>7} {'RSS':>8} {'PSS':>8} {'USS':>8} "
+          f"{'modelo RSS':>11} {'modelo USS':>11} {'PSS total':>10}")
+    for mode, r in results.items():
+        print(
+            f"{mode:<7} {r['workers']:>7} {r['rss_mb']:>8.1f} {r['pss_mb']:>8.1f} {r['uss_mb']:>8.1f} "
+            f"{r['model_rss_mb']:>11.1f} {r['model_uss_mb']:>11.1f} {r['total_pss_mb']:>10.1f}"
+        )
+    print("(MB por worker; 'modelo' = diferencia antes/después de cargar el modelo y predecir)")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Memoria por worker: modelos copiados vs compartidos")
+    parser.add_argument('--models-path', default="models")
+    parser.add_argument('--shared-path', default="/dev/shm/coomeva-models-bench",
+                        help="Carpeta compartida para el modo shared (se borra al terminar)")
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--rows', type=int, default=10_000, help="Filas que predice cada worker")
+    parser.add_argument('--output', default=None, help="JSON con el reporte")
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.WARNING, format="%(message)s")
+
+    results = {}
+    try:
+        for mode in MODES:
+            print(f"Midiendo {args.workers} workers en modo {mode}...", file=sys.stderr)
+            shared_path = args.shared_path if mode == "shared" else ""
+            results[mode] = report_mode(args.models_path, shared_path, args.workers, args.rows)
+    finally:
+        shutil.rmtree(args.shared_path, ignore_errors=True)
+    _print_table(results)
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,61 @@
+"""
+Modelo compartido por los tests: los pickles exportados en models/ o, si no
+están completos, arrays de prueba ajustados sobre datos sintéticos
+"""
+import pickle
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from app.prediction import ClusteringModel
+from app.preprocessing import DataPreprocessor
+from benchmarks.synthetic import generate_members
+
+MODELS_DIR = Path(__file__).resolve().parent.parent / "models"
+MODEL_FILES = ("scaler_model.pkl", "kmeans_model.pkl", "umap_data.pkl")
+
+FIXTURE_ROWS = 2000
+FIXTURE_CLUSTERS = 8
+
+
+def _fixture_models(path: Path) -> None:
+    """Scaler, KMeans y datos UMAP + KNN con la misma estructura que los exportados"""
+    from sklearn.cluster import KMeans
+    from sklearn.neighbors import NearestNeighbors
+    from sklearn.preprocessing import StandardScaler
+
+    df, _ = DataPreprocessor(compact=False).process(generate_members(FIXTURE_ROWS, seed=3))
+    features = df.select_dtypes(include=[np.float64]).dropna()
+    rng = np.random.default_rng(3)
+
+    scaler = StandardScaler().fit(features)
+    embeddings = rng.standard_normal((len(features), 2))
+    kmeans = KMeans(n_clusters=FIXTURE_CLUSTERS, n_init=1, random_state=3).fit(embeddings)
+    knn = NearestNeighbors(n_neighbors=15).fit(scaler.transform(features))
+
+    with open(path / "scaler_model.pkl", "wb") as f:
+        pickle.dump(scaler, f)
+    with open(path / "kmeans_model.pkl", "wb") as f:
+        pickle.dump(kmeans, f)
+    with open(path / "umap_data.pkl", "wb") as f:
+        pickle.dump({"embeddings": embeddings, "knn_index": knn, "feature_names": list(features.columns)}, f)
+
+
+@pytest.fixture(scope="session")
+def models_path(tmp_path_factory) -> Path:
+    if all((MODELS_DIR / name).exists() for name in MODEL_FILES):
+        return MODELS_DIR
+    path = tmp_path_factory.mktemp("models")
+    _fixture_models(path)
+    return path
+
+
+@pytest.fixture(scope="session")
+def load_model(models_path):
+    """Fábrica de ClusteringModel sobre los pickles (sin caché ni carpeta compartida)"""
+    def load(**kwargs) -> ClusteringModel:
+        model = ClusteringModel(models_path=str(models_path), models_format="pickle", shared_path="", **kwargs)
+        model.cache = None
+        return model
+    return load
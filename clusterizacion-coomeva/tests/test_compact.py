@@ -0,0 +1,34 @@
+"""
+El preprocesamiento compacto (PREPROCESS_COMPACT=true) produce la misma salida que el float64
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.preprocessing import DataPreprocessor
+from app.routes.clustering import format_results
+from benchmarks.synthetic import generate_members
+
+FECHA_REFERENCIA = pd.Timestamp("2025-01-15")
+
+
+def _cluster(model, raw: pd.DataFrame, compact: bool):
+    preprocessor = DataPreprocessor(fecha_referencia=FECHA_REFERENCIA, compact=compact)
+    df_processed, _ = preprocessor.process(raw.copy())
+    labels, umap_df, df_completo = model.predict(df_processed)
+    return labels, umap_df, format_results(df_completo, labels)
+
+
+@pytest.mark.parametrize("inference_runtime", ["numpy", "sklearn"])
+def test_compact_matches_float64(load_model, inference_runtime):
+    model = load_model(inference_runtime=inference_runtime)
+    raw = generate_members(3000, seed=11)
+
+    labels, umap_df, result = _cluster(model, raw, compact=False)
+    labels_compact, umap_compact, result_compact = _cluster(model, raw, compact=True)
+
+    np.testing.assert_array_equal(labels_compact, labels)
+    pd.testing.assert_frame_equal(umap_compact, umap_df)
+    pd.testing.assert_frame_equal(result_compact, result)
+    # Mismo CSV exportado (nombres, tipos, booleanos y fechas)
+    assert result_compact.to_csv(index=False) == result.to_csv(index=False)
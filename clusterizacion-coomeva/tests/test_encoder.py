@@ -0,0 +1,82 @@
+"""
+FeatureMatrixEncoder produce la misma matriz que la secuencia original
+get_dummies -> concat -> eliminar duplicados -> reindex -> to_numeric
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from app import preprocessing
+from app.preprocessing import EXPECTED_COLUMNS, DataPreprocessor
+from benchmarks.synthetic import generate_members
+
+FECHA_REFERENCIA = pd.Timestamp("2025-01-15")
+
+
+def _legacy_encode(df: pd.DataFrame, cat_cols, df_texto: pd.DataFrame) -> pd.DataFrame:
+    """Pasos 10-16 del preprocesamiento antes del encoder compilado"""
+    df_dummies_titulo = (
+        pd.get_dummies(df['Area_Titulo'], drop_first=False) if 'Area_Titulo' in df.columns else pd.DataFrame()
+    )
+    df_dummies_region = (
+        pd.get_dummies(df['Region'], drop_first=False) if 'Region' in df.columns else pd.DataFrame()
+    )
+    df_dummies = pd.get_dummies(df[cat_cols], drop_first=False, prefix_sep='_') if cat_cols else pd.DataFrame()
+
+    df = df.drop(columns=['Nombre_Titulo_Obtenido', 'Zona', 'Area_Titulo', 'Region'] + list(cat_cols),
+                 errors='ignore')
+    df = pd.concat([df, df_dummies, df_dummies_region, df_dummies_titulo], axis=1)
+    df = df.loc[:, ~df.columns.duplicated()]
+
+    df_numerico = df.reindex(columns=EXPECTED_COLUMNS, fill_value=0.0)
+    for col in df_numerico.columns:
+        if col in df_texto.columns:
+            continue
+        df_numerico[col] = pd.to_numeric(df_numerico[col], errors='coerce').astype(np.float64)
+    for col in df_texto.columns:
+        if col in df_numerico.columns:
+            df_numerico[col] = df_texto[col]
+    return df_numerico
+
+
+class _SpyEncoder:
+    """Codifica con ambos caminos la misma entrada que recibe el encoder en process()"""
+
+    def __init__(self, encoder):
+        self.encoder = encoder
+        self.legacy = None
+
+    def encode(self, df, cat_cols, df_texto, compact=False):
+        self.legacy = _legacy_encode(df.copy(), list(cat_cols), df_texto.copy())
+        return self.encoder.encode(df, cat_cols, df_texto, compact=compact)
+
+
+def _unseen_categories(raw: pd.DataFrame) -> pd.DataFrame:
+    """Valores sin dummy en el modelo (mayúsculas, niveles nuevos, zonas y títulos desconocidos)"""
+    raw = raw.copy()
+    rows = np.arange(len(raw)) % 7 == 0
+    raw.loc[rows, 'Sexo'] = 'm'
+    raw.loc[rows, 'Estrato'] = '7'
+    raw.loc[rows, 'Nombre_Ocupacion'] = 'Astronauta'
+    raw.loc[rows, 'Nombre_Estado'] = 'Sin Estado'
+    raw.loc[rows, 'Zona'] = 'Atlántida'
+    raw.loc[rows, 'Nombre_Titulo_Obtenido'] = 'Doctorado en Alquimia'
+    return raw
+
+
+@pytest.mark.parametrize("case, transform", [
+    ("completo", lambda raw: raw),
+    ("categorias_nuevas", _unseen_categories),
+    ("sin_categoricas", lambda raw: raw.drop(columns=['Sexo', 'Estrato', 'Nombre_Ocupacion'])),
+    ("sin_zona_ni_titulo", lambda raw: raw.drop(columns=['Zona', 'Nombre_Titulo_Obtenido'])),
+    ("sin_numericas", lambda raw: raw.drop(columns=['Cdat', 'Tarj_Debit', 'Personas_a_Cargo'])),
+])
+def test_encoder_matches_get_dummies(monkeypatch, case, transform):
+    spy = _SpyEncoder(preprocessing.FEATURE_ENCODER)
+    monkeypatch.setattr(preprocessing, "FEATURE_ENCODER", spy)
+
+    raw = transform(generate_members(3000, seed=5))
+    encoded, _ = DataPreprocessor(fecha_referencia=FECHA_REFERENCIA, compact=False).process(raw)
+
+    assert list(encoded.columns) == EXPECTED_COLUMNS
+    pd.testing.assert_frame_equal(encoded, spy.legacy)
@@ -0,0 +1,158 @@
+"""
+El plan de salida compilado desde el esquema de datos produce lo mismo que el
+format_results escrito a mano (nombres, tipos, booleanos y fechas)
+"""
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.output_plan import DB_SCHEMA_PATH, get_output_plan, parse_table_schema
+from app.preprocessing import EXPECTED_COLUMNS, DataPreprocessor
+from benchmarks.synthetic import generate_members
+
+SERVICE_DIR = Path(__file__).resolve().parent.parent
+FECHA_REFERENCIA = pd.Timestamp("2025-01-15")
+
+ONEHOT_PREFIXES = [
+    'Nombre_Estado_', 'Nombre_Tipo_Vinculacion_', 'Estado_Civil_',
+    'Sexo_', 'Estrato_', 'Nombre_Tipo_Vivienda_', 'Nombre_Nivel_Academico_',
+    'Nombre_Ocupacion_', 'Andina', 'Caribe', 'Orinoquía', 'Otro', 'Pacífica',
+    'Arquitectura', 'Ciencias Sociales', 'Comunicaciones', 'Educación',
+    'Ingeniería', 'Salud', 'Tecnología'
+]
+
+BOOLEAN_COLUMNS = [
+    'cta_dep', 'cta_juve', 'fondo_soc', 'cheque_cta', 'cupo_activ', 'tarj_debit',
+    'cdat', 'pap', 'creditos', 'cred_vivienda', 'cred_lib_inv_con_garant',
+    'cred_lib_inv_sin_garant', 'cred_vehic', 'cred_creac_empr', 'cred_educac',
+    'cred_otros', 'pila', 'bancaseguro', 'afc', 'tienevisa', 'microcreditos',
+    'credisolidario', 'solidaridad', 'exequial', 'herencia', 'hospitalizacion',
+    'recuperacion', 'solvencia', 'tranquilidad', 'vida', 'vidaclasica', 'seguros2',
+    'seguroauto', 'segurosinauto', 'hogarmasytotalhome', 'soat', 'totalrcmedica',
+    'otraspolizas', 'mi', 'cem', 'saor', 'mpt', 'planeducativo', 'tarjetas',
+    'credimutual', 'solidaridadpbi', 'libranza', 'reestructuracionconsumo',
+    'coerotativo', 'originadores', 'coe', 'cupoeducar', 'creditoturismo',
+    'creditosaludbienestar', 'reestructuracioncomercial', 'reestructuracionvivienda',
+    'creditocapitaldetrabajo', 'findeter', 'bancoldex', 'sobregiro',
+    'creditocalamidad', 'creditoproductivo', 'findeterrotativo', 'nominafacil',
+    'pagodeobligaciones', 'desempleo', 'fondosocialviviendapatrimonial',
+    'fondosocialviviendavida', 'fondosocialviviendabanco', 'primanivelada',
+    'crediasociado', 'cuentapension'
+]
+
+INT_COLUMNS = [
+    'personas_a_cargo', 'personas_a_cargo_menores_18', 'cuotas_canceladas_aportes',
+    'cuotas_mora_aportes', 'numedad', 'numcantidadproductos',
+    'antiguedad_dias', 'edad', 'estrato',
+    'ingresos', 'saldo_aportes', 'vlr_mora', 'ingresos_deflactados',
+    'saldo_visa', 'cuotamanejo', 'mastercardcupo', 'mastercardsaldo',
+    'fic_365', 'fic_90', 'fic_vista', 'inversiones_no_tradicionales',
+    'renta_fija_corto_plazo'
+]
+
+
+def _legacy_format_results(df_completo: pd.DataFrame, labels: np.ndarray) -> pd.DataFrame:
+    """format_results anterior al plan de salida (conversión columna por columna)"""
+    df_result = df_completo.reset_index(drop=True)
+    df_result['Cluster'] = labels
+
+    for col in [c for c in df_result.columns if any(c.startswith(p) for p in ONEHOT_PREFIXES)]:
+        if df_result[col].dtype in [np.float64, np.float32, float]:
+            df_result[col] = df_result[col].astype(bool)
+
+    for col in ('Fecha_Ingreso', 'Fecha_Nacimiento'):
+        if col in df_result.columns:
+            df_result[col] = pd.to_datetime(df_result[col]).dt.strftime('%Y-%m-%d')
+    df_result['IdUnico'] = df_result['IdUnico'].astype(str)
+    df_result['Cluster'] = df_result['Cluster'].astype(str)
+
+    df_result.columns = (
+        df_result.columns
+        .str.lower()
+        .str.replace(' ', '_', regex=False)
+        .str.replace('/', '_', regex=False)
+        .str.replace('-', '_', regex=False)
+        .str.replace('ó', 'o', regex=False)
+        .str.replace('í', 'i', regex=False)
+        .str.replace('á', 'a', regex=False)
+        .str.replace('é', 'e', regex=False)
+        .str.replace('ú', 'u', regex=False)
+        .str.replace('ñ', 'n', regex=False)
+        .str.replace('___', '_', regex=False)
+        .str.replace('__', '_', regex=False)
+    )
+    df_result.rename(columns={
+        'otro.1': 'otro_1',
+        'nombre_ocupacion_ninguno___no_definido': 'nombre_ocupacion_ninguno_no_definido',
+        'nombre_ocupacion_pensionado___jubilado': 'nombre_ocupacion_pensionado_jubilado',
+    }, inplace=True)
+
+    onehot_columns = [c for c in df_result.columns if any(c.startswith(p) for p in [
+        'nombre_estado_', 'nombre_tipo_vinculacion_', 'estado_civil_',
+        'sexo_', 'estrato_', 'nombre_tipo_vivienda_', 'nombre_nivel_academico_',
+        'nombre_ocupacion_', 'andina', 'caribe', 'orinoquia', 'otro', 'pacifica',
+        'arquitectura', 'ciencias_sociales', 'comunicaciones', 'educacion',
+        'ingenieria', 'salud', 'tecnologia'
+    ])]
+    for col in set(BOOLEAN_COLUMNS + onehot_columns):
+        if col in df_result.columns:
+            df_result[col] = pd.to_numeric(df_result[col], errors='coerce').fillna(0).astype(int).astype(bool)
+    for col in INT_COLUMNS:
+        if col in df_result.columns:
+            df_result[col] = pd.to_numeric(df_result[col], errors='coerce').fillna(0).astype(int)
+    for col in ('log_ingresos', 'log_ingresos_deflactados'):
+        if col in df_result.columns:
+            df_result[col] = pd.to_numeric(df_result[col], errors='coerce').fillna(0)
+    return df_result
+
+
+@pytest.mark.parametrize("n_rows, seed", [(500, 1), (3000, 2)])
+def test_output_plan_matches_legacy_formatter(n_rows, seed):
+    df, _ = DataPreprocessor(fecha_referencia=FECHA_REFERENCIA, compact=False).process(
+        generate_members(n_rows, seed=seed)
+    )
+    labels = np.random.default_rng(seed).integers(0, 8, len(df)).astype(np.int32)
+
+    expected = _legacy_format_results(df, labels)
+    result = get_output_plan().apply(df, labels)
+
+    assert list(result.columns) == list(expected.columns)
+    pd.testing.assert_frame_equal(result, expected)
+    # El CSV exportado (True/False, fechas YYYY-MM-DD, enteros) es el mismo byte a byte
+    assert result.to_csv(index=False) == expected.to_csv(index=False)
+
+
+def test_parse_datos_schema():
+    with open(DB_SCHEMA_PATH, encoding="utf-8") as f:
+        schema = parse_table_schema(f.read())
+
+    assert len(schema) == 177
+    assert schema["idunico"] == "TEXT"
+    assert schema["fecha_ingreso"] == "DATE"
+    assert schema["personas_a_cargo"] == "INTEGER"
+    assert schema["ingresos"] == "NUMERIC"
+    assert schema["cdat"] == "BOOLEAN"
+    assert schema["cluster"] == "TEXT"
+    assert set(schema.values()) == {"TEXT", "DATE", "INTEGER", "NUMERIC", "BOOLEAN"}
+
+    # Cada columna de salida existe en la tabla y en el mismo orden
+    targets = [target for _, target, _ in get_output_plan().steps(EXPECTED_COLUMNS + ['Cluster'])]
+    assert targets == [column for column in schema if column in set(targets)]
+
+
+def test_parse_schema_errors():
+    with pytest.raises(ValueError):
+        parse_table_schema("CREATE TABLE public.otra (\n  id TEXT\n);")
+
+
+def test_docker_image_ships_schema():
+    """La imagen final copia el esquema junto a app/ (DB_SCHEMA_PATH por defecto) y no lo ignora"""
+    dockerfile = (SERVICE_DIR / "Dockerfile").read_text(encoding="utf-8")
+    final_stage = dockerfile.split("\nFROM ")[-1]
+    assert "COPY coomeva_cluster_db_schema.sql ./" in final_stage
+    assert "COPY app ./app" in final_stage
+
+    ignored = (SERVICE_DIR / ".dockerignore").read_text(encoding="utf-8").split()
+    assert "*.sql" not in ignored and "coomeva_cluster_db_schema.sql" not in ignored
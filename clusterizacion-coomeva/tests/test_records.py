@@ -0,0 +1,71 @@
+"""
+El camino rápido de /cluster/records produce las mismas features que DataPreprocessor
+"""
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.preprocessing import EXPECTED_COLUMNS, DataPreprocessor
+from app.records import RecordFeatureExtractor
+from benchmarks.synthetic import generate_members
+
+FECHA_REFERENCIA = pd.Timestamp("2025-01-15")
+
+# Features que el camino rápido calcula directamente del registro
+FEATURES = [
+    col for col in EXPECTED_COLUMNS if col not in RecordFeatureExtractor(EXPECTED_COLUMNS).unsupported
+]
+
+
+def _records(n_rows: int, drop=()):
+    df = generate_members(n_rows, seed=7).drop(columns=list(drop), errors="ignore")
+    return json.loads(df.to_json(orient="records"))
+
+
+def _dataframe_path(records):
+    """Mismas features por el preprocesamiento completo (filas con NaN descartadas, como predict)"""
+    preprocessor = DataPreprocessor()
+    preprocessor.fecha_referencia = FECHA_REFERENCIA
+    df_processed, _ = preprocessor.process(pd.DataFrame.from_records(records))
+    return df_processed[FEATURES].astype(np.float64).dropna()
+
+
+def _fast_path(records):
+    X, validos = RecordFeatureExtractor(FEATURES).extract(records, fecha_referencia=FECHA_REFERENCIA)
+    return X[validos], np.flatnonzero(validos)
+
+
+@pytest.mark.parametrize("drop", [
+    (),
+    ("Personas_a_Cargo",),
+    ("Fecha_Ingreso", "Antiguedad_dias"),
+    ("Ingresos_Deflactados", "log_ingresos_deflactados"),
+])
+def test_fast_path_matches_dataframe_path_on_partial_records(drop):
+    records = _records(5, drop)
+    expected = _dataframe_path(records)
+    X, positions = _fast_path(records)
+
+    assert list(positions) == list(expected.index)
+    np.testing.assert_allclose(X, expected.to_numpy(), rtol=1e-12, equal_nan=False)
+
+
+def test_absent_key_is_zero_and_null_drops_the_row():
+    records = _records(5, ("Personas_a_Cargo",))
+    _, validos = _fast_path(records)
+    records[validos[0]]["Personas_a_Cargo"] = None
+    X, positions = _fast_path(records)
+
+    assert list(positions) == list(validos[1:])
+    assert (X[:, FEATURES.index("Personas_a_Cargo")] == 0).all()
+
+
+def test_absent_critical_column_invalidates_the_row():
+    records = _records(5)
+    _, validos = _fast_path(records)
+    del records[validos[0]]["Ingresos"]
+    _, positions = _fast_path(records)
+
+    assert list(positions) == list(validos[1:])
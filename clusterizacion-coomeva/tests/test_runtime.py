@@ -0,0 +1,63 @@
+"""
+El runtime NumPy (ArrayRuntime) asigna los mismos clusters que el pipeline de
+sklearn, sobre los pickles y sobre los arrays exportados (manifest.json + .npy)
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.artifacts import export_artifacts
+from app.preprocessing import DataPreprocessor
+from app.runtime import ArrayRuntime, verify_runtime
+from benchmarks.synthetic import generate_members
+
+FECHA_REFERENCIA = pd.Timestamp("2025-01-15")
+
+
+@pytest.fixture(scope="module")
+def reference(load_model):
+    return load_model(inference_runtime="sklearn")
+
+
+def _member_features(model, n_rows: int = 3000) -> np.ndarray:
+    df, _ = DataPreprocessor(fecha_referencia=FECHA_REFERENCIA).process(generate_members(n_rows, seed=9))
+    return df[list(model.scaler.feature_names_in_)].astype(np.float64).dropna().to_numpy()
+
+
+def _interpolated_features(model, n_queries: int = 2000) -> np.ndarray:
+    """Puntos entre pares de la referencia del KNN (como python -m app.runtime verify)"""
+    fit_X = np.asarray(model.exact_knn_index._fit_X)
+    rng = np.random.default_rng(0)
+    a, b = rng.integers(0, len(fit_X), (2, n_queries))
+    t = rng.uniform(0.2, 0.4, (n_queries, 1))
+    return (fit_X[a] + t * (fit_X[b] - fit_X[a])) * model.scaler.scale_ + model.scaler.mean_
+
+
+def _assert_same_clusters(report):
+    # Solo se aceptan diferencias por empate exacto entre el vecino k y el k+1
+    assert report["label_mismatches"] == report["mismatches_at_neighbor_ties"]
+    assert report["max_embedding_error"] < 1e-9
+
+
+@pytest.mark.parametrize("features", [_member_features, _interpolated_features])
+def test_numpy_runtime_matches_sklearn(reference, features):
+    X = features(reference)
+    assert len(X)
+    _assert_same_clusters(verify_runtime(reference, X))
+
+
+def test_exported_artifacts_match_sklearn(reference, models_path, tmp_path):
+    export_artifacts(str(models_path), str(tmp_path))
+    _assert_same_clusters(verify_runtime(reference, _interpolated_features(reference), str(tmp_path)))
+
+
+def test_model_uses_numpy_runtime(load_model, reference):
+    model = load_model(inference_runtime="numpy")
+    assert isinstance(model.runtime, ArrayRuntime)
+    assert reference.runtime is None
+
+    X = _member_features(model)
+    umap, labels = model.predict_features(X)
+    ref_umap, ref_labels = reference.predict_features(X)
+    np.testing.assert_array_equal(labels, ref_labels)
+    np.testing.assert_allclose(umap, ref_umap, rtol=0, atol=1e-9)